@@ -172,6 +172,8 @@ from run_worker import (
     matches_channel,
     is_project_complete_on_master,
     has_excel_with_prompts,
+    is_scene_prompts_streaming,
+    scene_batch_progress,
     needs_api_completion,
     copy_from_master,
     copy_to_visual,
@@ -250,6 +252,11 @@ def is_local_pic_complete(project_dir: Path, name: str) -> bool:
     if len(img_files) == 0:
         return False
 
+    # Excel Worker vẫn đang ghi thêm scenes -> chưa thể complete
+    if is_scene_prompts_streaming(project_dir, name, include_stale=True):
+        print(f"    [{name}] Scene prompts still streaming - incomplete")
+        return False
+
     try:
         from modules.excel_manager import PromptWorkbook
         excel_path = project_dir / f"{name}_prompts.xlsx"
@@ -568,18 +575,35 @@ def process_project_pic_basic_chrome2(code: str, callback=None) -> bool:
         log(f"  Excel: {excel_path.name}")
         log(f"  Mode: CHROME 2 (scenes lẻ: 1,3,5,...)")
 
-        # Run engine - images only, skip video, skip references (Chrome 1 tạo)
-        result = engine.run(
-            str(excel_path),
-            callback=callback,
-            skip_compose=True,
-            skip_video=True,
-            skip_references=True
-        )
+        # Excel Worker còn đang ghi scene prompts -> tạo ảnh cho từng batch đã có
+        known = scene_batch_progress(local_dir, code)[0]
 
-        if result.get('error'):
-            log(f"  Error: {result.get('error')}", "ERROR")
-            return False
+        while True:
+            # Run engine - images only, skip video, skip references (Chrome 1 tạo)
+            result = engine.run(
+                str(excel_path),
+                callback=callback,
+                skip_compose=True,
+                skip_video=True,
+                skip_references=True
+            )
+
+            if result.get('error'):
+                log(f"  Error: {result.get('error')}", "ERROR")
+                return False
+
+            # Không chờ batch mới: batch nào ghi sau lần đọc này do lần scan sau xử lý
+            count, status = scene_batch_progress(local_dir, code)
+            if status == "STALE":
+                log(f"  [STREAM] Step 7 không còn cập nhật (Excel Worker đã dừng?), để lần scan sau kiểm tra lại", "WARN")
+                return False
+            if status != "IN_PROGRESS":
+                break
+            if count <= known:
+                log(f"  [STREAM] Excel Worker đang tạo scene prompts ({known} scenes), để lần scan sau xử lý batch mới")
+                return False
+            log(f"  [STREAM] Có thêm {count - known} scenes, tạo ảnh tiếp")
+            known = count
 
     except Exception as e:
         log(f"  Exception: {e}", "ERROR")
@@ -619,7 +643,7 @@ def scan_incomplete_local_projects() -> list:
             continue
 
         srt_path = item / f"{code}.srt"
-        if has_excel_with_prompts(item, code):
+        if has_excel_with_prompts(item, code, allow_streaming=True):
             print(f"    - {code}: incomplete (has Excel, no images)")
             incomplete.append(code)
         elif srt_path.exists():
@@ -654,7 +678,7 @@ def scan_master_projects() -> list:
 
             # Wrap network path checks in try-except
             try:
-                if has_excel_with_prompts(item, code):
+                if has_excel_with_prompts(item, code, allow_streaming=True):
                     print(f"    - {code}: ready (has prompts)")
                     pending.append(code)
                 elif srt_path.exists():
@@ -776,8 +800,8 @@ def validate_references_if_needed(code: str, callback=None) -> bool:
         if not excel_path.exists():
             return True  # No Excel, skip validation
 
-        # Load workbook
-        workbook = PromptWorkbook(str(excel_path))
+        # Load workbook (change journal: validator update từng NV song song với Chrome 1)
+        workbook = PromptWorkbook(str(excel_path), change_journal=True)
 
         # Get all references
         all_chars = workbook.get_characters()
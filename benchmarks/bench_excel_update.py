@@ -0,0 +1,76 @@
+"""
+Benchmark: PromptWorkbook.update_scene - linear scan vs row index
+==================================================================
+Đo thời gian đánh dấu done cho toàn bộ scenes (giống image run) với 1k và 5k scenes.
+
+Usage:
+    python benchmarks/bench_excel_update.py
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.excel_manager import PromptWorkbook, Scene, SCENES_COLUMNS
+
+
+def legacy_update_scene(workbook: PromptWorkbook, scene_id: int, **kwargs) -> bool:
+    """Thuật toán cũ: quét ws.max_row và int(cell.value) cho mỗi lần update."""
+    ws = workbook.workbook[workbook.SCENES_SHEET]
+    for row_idx in range(2, ws.max_row + 1):
+        cell_value = ws.cell(row=row_idx, column=1).value
+        if cell_value is not None and int(cell_value) == scene_id:
+            for key, value in kwargs.items():
+                if key in SCENES_COLUMNS:
+                    col_idx = SCENES_COLUMNS.index(key) + 1
+                    ws.cell(row=row_idx, column=col_idx, value=value)
+            return True
+    return False
+
+
+def build_workbook(tmp_dir: Path, n_scenes: int) -> PromptWorkbook:
+    workbook = PromptWorkbook(tmp_dir / f"bench_{n_scenes}.xlsx").load_or_create()
+    for i in range(1, n_scenes + 1):
+        workbook.add_scene(Scene(
+            scene_id=i,
+            srt_start="00:00:01,000",
+            srt_end="00:00:05,000",
+            srt_text=f"Scene text {i}",
+            img_prompt=f"Cinematic prompt for scene {i}",
+        ))
+    return workbook
+
+
+def bench(n_scenes: int, tmp_dir: Path) -> None:
+    workbook = build_workbook(tmp_dir, n_scenes)
+
+    # Legacy chậm (O(n^2)) -> chỉ đo 1 mẫu rồi ngoại suy cho toàn bộ scenes
+    sample = min(n_scenes, 200)
+    step = max(1, n_scenes // sample)
+    sample_ids = list(range(1, n_scenes + 1, step))[:sample]
+    start = time.perf_counter()
+    for scene_id in sample_ids:
+        legacy_update_scene(workbook, scene_id, status_img="done", img_path=f"img/{scene_id}.png")
+    legacy_per_update = (time.perf_counter() - start) / len(sample_ids)
+
+    start = time.perf_counter()
+    for scene_id in range(1, n_scenes + 1):
+        workbook.update_scene(scene_id, status_img="done", img_path=f"img/{scene_id}.png")
+    indexed_total = time.perf_counter() - start
+    indexed_per_update = indexed_total / n_scenes
+
+    print(f"{n_scenes:>6} scenes | legacy {legacy_per_update * 1e6:10.1f} us/update "
+          f"(~{legacy_per_update * n_scenes:7.2f}s all) | "
+          f"indexed {indexed_per_update * 1e6:8.1f} us/update ({indexed_total:6.3f}s all) | "
+          f"x{legacy_per_update / indexed_per_update:,.0f}")
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("BENCH update_scene: linear scan vs row index")
+    print("=" * 80)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (1000, 5000):
+            bench(n, Path(tmp))
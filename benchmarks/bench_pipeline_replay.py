@@ -0,0 +1,363 @@
+"""
+Benchmark: run_all_steps với LLM call replay từ fixture (offline)
+=================================================================
+Chạy pipeline prompt (Step 1 -> 7) trên 1 SRT mẫu, response LLM lấy từ
+fixture đã record (modules.llm_replay), mỗi call giữ 1 slot HTTP đúng bằng
+latency đã ghi -> đo được thay đổi của scheduler/Excel/parse mà không cần
+API key hay mạng.
+
+Không có fixture: --fake dựng response JSON hợp lệ từ chính prompt của từng
+step (scene_id, khoảng SRT, số scene yêu cầu...), latency giả lập theo số
+token output. Kết quả xác định (cùng SRT -> cùng response), đủ để chạy hết
+7 step (kể cả stream scene của Step 7) và so sánh giữa các commit.
+
+Report: wall time, tổng tuần tự vs critical path, và theo từng step: thời
+gian, số call, token in/out, thời gian ghi/đọc Excel.
+
+Record fixture 1 lần (gọi DeepSeek thật, key trong config/settings.yaml):
+    python benchmarks/bench_pipeline_replay.py --record --fixture benchmarks/fixtures/sample_llm.jsonl
+
+Replay (offline):
+    python benchmarks/bench_pipeline_replay.py --fixture benchmarks/fixtures/sample_llm.jsonl
+    python benchmarks/bench_pipeline_replay.py --fixture ... --latency-scale 0   # chỉ đo CPU + I/O
+
+Fake responder (offline, không cần fixture):
+    python benchmarks/bench_pipeline_replay.py --fake
+    python benchmarks/bench_pipeline_replay.py --fake --latency-scale 0.1
+
+Record và replay đều tắt llm_cache, hedging và adaptive batch size (trừ khi
+--adaptive) để các prompt gửi đi giống hệt nhau giữa 2 lần chạy. Replay miss
+(prompt không có trong fixture) được đếm và báo lại.
+"""
+import argparse
+import json
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+import yaml
+
+from modules.excel_manager import PromptWorkbook
+from modules.llm_cache import cache_key
+from modules.progressive_prompts import PIPELINE_STEPS, ProgressivePromptsGenerator
+
+DEFAULT_SRT = Path(__file__).parent / "fixtures" / "sample.srt"
+
+_excel_seconds = defaultdict(float)
+_excel_lock = threading.Lock()
+
+
+# ============================================================================
+# EXCEL I/O THEO STEP
+# ============================================================================
+# Excel được ghi từ thread của step lẫn từ worker thread của step (batch
+# song song ở Step 5/6/7 gọi save()), nên step đang chạy được ghi lên chính
+# workbook (_bench_steps) thay vì thread-local. Step 3 + 4 chạy song song trên
+# cùng workbook -> I/O lúc đó chia đều cho các step đang chạy.
+
+def _timed_io(method):
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            steps = list(getattr(self, "_bench_steps", ())) or ["other"]
+            with _excel_lock:
+                for step_id in steps:
+                    _excel_seconds[step_id] += elapsed / len(steps)
+    return wrapper
+
+
+def _track_step(step_id: str, method, workbook_arg: int):
+    def wrapper(*args, **kwargs):
+        workbook = args[workbook_arg]
+        if not isinstance(workbook, PromptWorkbook):
+            workbook = workbook._workbook  # _SerializedWorkbook
+        with _excel_lock:
+            if not hasattr(workbook, "_bench_steps"):
+                workbook._bench_steps = []
+            workbook._bench_steps.append(step_id)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            with _excel_lock:
+                workbook._bench_steps.remove(step_id)
+    return wrapper
+
+
+# ============================================================================
+# FAKE RESPONDER
+# ============================================================================
+
+_SCENE_HEADER = re.compile(r"^Scene (\d+):", re.M)
+_SRT_LINE = re.compile(r"^\[(\d+)\] (\S+) --> (\S+)\n(.*)$", re.M)
+
+
+def _seconds(ts: str) -> float:
+    h, m, s = ts.replace(",", ".").split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def _int_after(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+class FakeLLM:
+    """
+    Thay LLMReplay: response JSON dựng từ prompt theo step, không cần fixture.
+
+    Cùng interface với LLMReplay (replaying, replay, record, stats). replay()
+    chỉ nhận key của request, nên prompt được đăng ký trước qua wrap() - bọc
+    _call_api của generator và tính key giống hệt _call_api.
+    """
+
+    FIRST_TOKEN_SECONDS = 1.0
+    TOKENS_PER_SECOND = 50.0
+
+    replaying = True
+
+    def __init__(self, model: str, latency_scale: float = 1.0):
+        self.model = model
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._requests = {}
+        self.replayed = 0
+        self.misses = 0
+
+    def wrap(self, call_api):
+        def wrapper(prompt, temperature=0.7, max_tokens=8192, step="", parser=None, system="", use_cache=True):
+            key = cache_key(self.model, prompt, temperature, max_tokens, system)
+            with self._lock:
+                self._requests[key] = (step, prompt)
+            return call_api(prompt, temperature=temperature, max_tokens=max_tokens, step=step,
+                            parser=parser, system=system, use_cache=use_cache)
+        return wrapper
+
+    def record(self, *args, **kwargs) -> None:
+        pass
+
+    def replay(self, key: str):
+        with self._lock:
+            step, prompt = self._requests.get(key, ("", ""))
+        data = self.respond(step, prompt)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.replayed += 1
+
+        content = json.dumps(data, ensure_ascii=False, indent=2)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        latency = self.FIRST_TOKEN_SECONDS + usage["completion_tokens"] / self.TOKENS_PER_SECOND
+        return {"content": content, "usage": usage, "finish_reason": "stop",
+                "latency": latency * self.latency_scale}
+
+    def stats(self):
+        with self._lock:
+            return {"recorded": 0, "replayed": self.replayed, "misses": self.misses}
+
+    def respond(self, step: str, prompt: str):
+        """JSON response cho 1 request, None nếu không nhận ra prompt."""
+        if step == "step_1":
+            return {
+                "setting": {"era": "1950s", "location": "coastal village", "atmosphere": "quiet, hopeful"},
+                "themes": ["loss", "family", "renewal"],
+                "visual_style": {"cinematography": "slow, observational", "color_palette": "muted blues",
+                                 "lighting": "soft natural light"},
+                "context_lock": "A 1950s coastal village under soft overcast light, cinematic, photorealistic",
+            }
+
+        if step == "step_2":
+            if "Target:" in prompt:
+                return {"image_count": _int_after(r"Target: (\d+) images", prompt, 1), "reasoning": "target"}
+            if "TOTAL SRT ENTRIES:" in prompt:
+                total = _int_after(r"TOTAL SRT ENTRIES: (\d+)", prompt, 1)
+                half = max(1, total // 2)
+                ranges = [(1, half), (half + 1, total)] if total > 1 else [(1, total)]
+            else:
+                start = _int_after(r"SRT RANGE: (\d+) to", prompt, 1)
+                ranges = [(start, _int_after(r"SRT RANGE: \d+ to (\d+)", prompt, start))]
+            return {"segments": [{
+                "segment_id": i,
+                "segment_name": f"Part {i}",
+                "message": f"Part {i} of the story, SRT {start}-{end}",
+                "key_elements": ["Anna at the harbor", "stormy sky"],
+                "visual_summary": "Anna waits by the sea for news.",
+                "mood": "tense",
+                "characters_involved": ["Anna"],
+                "image_count": max(1, (end - start + 1) // 4),
+                "srt_range_start": start,
+                "srt_range_end": end,
+            } for i, (start, end) in enumerate(ranges, start=1)], "summary": "Two parts"}
+
+        if step == "step_3":
+            return {"characters": [{
+                "id": "nv_anna", "name": "Anna", "role": "protagonist",
+                "portrait_prompt": "Portrait on pure white background, 85mm lens, 35-year-old Caucasian woman, "
+                                   "auburn hair, green eyes, wool coat, photorealistic 8K, no text",
+                "character_lock": "35-year-old Caucasian woman, auburn hair, green eyes, wool coat",
+                "is_minor": False,
+            }]}
+
+        if step == "step_4":
+            return {"locations": [{
+                "id": "loc_harbor", "name": "Harbor",
+                "location_prompt": "Empty wooden harbor at dawn, fishing boats, mist over the water",
+                "location_lock": "small wooden harbor with fishing boats and morning mist",
+                "lighting_default": "soft dawn light",
+            }]}
+
+        if step == "step_5":
+            entries = [(int(i), start, end, text) for i, start, end, text in _SRT_LINE.findall(prompt)]
+            count = max(1, _int_after(r"EXACTLY (\d+) scenes", prompt, 1))
+            if not entries:
+                return None
+            scenes = []
+            for n in range(count):
+                group = entries[n * len(entries) // count:(n + 1) * len(entries) // count] or entries[-1:]
+                scenes.append({
+                    "scene_id": n + 1,
+                    "srt_indices": [e[0] for e in group],
+                    "srt_start": group[0][1],
+                    "srt_end": group[-1][2],
+                    "duration": round(_seconds(group[-1][2]) - _seconds(group[0][1]), 1),
+                    "srt_text": " ".join(e[3] for e in group),
+                    "visual_moment": f"Anna at the harbor, moment {group[0][0]}",
+                    "characters_used": "nv_anna",
+                    "location_used": "loc_harbor",
+                    "camera": "Medium shot",
+                    "lighting": "Soft natural light",
+                })
+            return {"scenes": scenes}
+
+        scene_ids = [int(sid) for sid in _SCENE_HEADER.findall(prompt)]
+        if step == "step_6" and scene_ids:
+            return {"scene_plans": [{
+                "scene_id": sid,
+                "artistic_intent": f"Show Anna's resolve in scene {sid}",
+                "shot_type": "Medium shot",
+                "character_action": "Looking out to sea",
+                "mood": "Hopeful",
+                "lighting": "Soft morning light",
+                "color_palette": "Muted blues and grays",
+                "key_focus": "Anna's face",
+            } for sid in scene_ids]}
+
+        if step == "step_7" and scene_ids:
+            return {"scenes": [{
+                "scene_id": sid,
+                "img_prompt": f"Medium shot, 50mm lens, a 35-year-old woman (nv_anna.png) looking out to sea, "
+                              f"moment {sid}, at a small harbor (loc_harbor.png), soft morning light, cinematic, 4K",
+                "video_prompt": f"Slow push in on Anna, moment {sid}",
+            } for sid in scene_ids]}
+
+        return None
+
+
+def make_config(args) -> dict:
+    config = {}
+    if args.record:
+        with open(ROOT / "config" / "settings.yaml", "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+        config["llm_record"] = args.fixture
+    elif not args.fake:
+        config["llm_replay"] = args.fixture
+        config["llm_replay_latency_scale"] = args.latency_scale
+    config["llm_cache"] = False
+    config["llm_hedge"] = False
+    if not args.adaptive:
+        config["adaptive_batch"] = False
+    return config
+
+
+def run_once(args, tmp: Path) -> dict:
+    _excel_seconds.clear()
+    code = Path(args.srt).stem
+    project_dir = tmp / code
+    project_dir.mkdir(parents=True)
+    shutil.copy(args.srt, project_dir / f"{code}.srt")
+
+    generator = ProgressivePromptsGenerator(config=make_config(args))
+    if args.fake:
+        generator.llm_replay = FakeLLM(generator.DEEPSEEK_MODEL, args.latency_scale)
+        generator._call_api = generator.llm_replay.wrap(generator._call_api)
+    for spec in PIPELINE_STEPS:
+        setattr(generator, spec.method, _track_step(spec.step_id, getattr(generator, spec.method),
+                                                    spec.args.index("workbook")))
+
+    log = (lambda msg, level="INFO": print(msg)) if args.verbose else (lambda msg, level="INFO": None)
+    start = time.perf_counter()
+    ok = generator.run_all_steps(project_dir, code, log_callback=log)
+    wall = time.perf_counter() - start
+
+    return {
+        "ok": ok,
+        "wall": wall,
+        "schedule": dict(generator.last_schedule),
+        "durations": dict(generator.last_step_durations),
+        "tokens": generator.token_usage.report(),
+        "latency": generator.latency.report(),
+        "excel": dict(_excel_seconds),
+        "replay": generator.llm_replay.stats(),
+    }
+
+
+def print_report(r: dict) -> None:
+    schedule = r["schedule"]
+    print(f"  ok={r['ok']} wall {r['wall']:.2f}s | sequential {schedule.get('sequential', 0):.2f}s "
+          f"-> critical path {schedule.get('critical_path', 0):.2f}s | replay {r['replay']}")
+    print(f"  {'step':<8} {'time':>8} {'calls':>6} {'tok in':>9} {'tok out':>9} {'p95':>7} {'excel io':>9}")
+    for spec in PIPELINE_STEPS:
+        sid = spec.step_id
+        tokens = r["tokens"].get(sid, {})
+        p95 = r["latency"].get(sid, {}).get("p95")
+        print(f"  {sid:<8} {r['durations'].get(sid, 0):7.2f}s {tokens.get('calls', 0):>6} "
+              f"{tokens.get('prompt_tokens', 0):>9} {tokens.get('completion_tokens', 0):>9} "
+              f"{(f'{p95:.2f}s' if p95 is not None else '-'):>7} {r['excel'].get(sid, 0):8.3f}s")
+    if r["excel"].get("other"):
+        print(f"  {'other':<8} {'':>8} {'':>6} {'':>9} {'':>9} {'':>7} {r['excel']['other']:8.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", help="File JSONL của llm_replay")
+    parser.add_argument("--fake", action="store_true", help="Response dựng từ prompt, không cần fixture")
+    parser.add_argument("--srt", default=str(DEFAULT_SRT))
+    parser.add_argument("--record", action="store_true", help="Gọi API thật và ghi fixture")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--adaptive", action="store_true", help="Giữ adaptive batch size (có thể replay miss)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.fake and args.record:
+        sys.exit("--fake không dùng cùng --record")
+    if not args.fake and not args.fixture:
+        sys.exit("Cần --fixture (hoặc --fake)")
+    if args.record and Path(args.fixture).exists():
+        sys.exit(f"Fixture đã tồn tại: {args.fixture} (xóa trước khi record lại)")
+
+    # Thời gian ghi/đọc file Excel theo step
+    PromptWorkbook._write_file = _timed_io(PromptWorkbook._write_file)
+    PromptWorkbook._load_from_disk = _timed_io(PromptWorkbook._load_from_disk)
+
+    print("=" * 80)
+    mode = "RECORD" if args.record else "FAKE" if args.fake else "REPLAY"
+    print(f"BENCH pipeline {mode}: {args.srt} "
+          f"(fixture {args.fixture or '-'}, latency x{args.latency_scale})")
+    print("=" * 80)
+    for run in range(1 if args.record else args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"Run {run + 1}:")
+            print_report(run_once(args, Path(tmp)))
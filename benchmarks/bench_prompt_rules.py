@@ -0,0 +1,275 @@
+"""
+Benchmark: heuristic hậu kiểm img_prompt - code cũ vs modules.prompt_rules
+==========================================================================
+Chạy looks_like_narration / clean_narration / fix_location / normalize
+character IDs trên 2,000 scene tổng hợp (prompt dài như output Step 5, có
+lẫn lời kể, thoại, location sai), so thời gian với thuật toán cũ và kiểm tra
+kết quả giống hệt.
+
+Usage:
+    python benchmarks/bench_prompt_rules.py
+    python benchmarks/bench_prompt_rules.py --scenes 10000 --repeat 5
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.prompt_rules import PromptRules, build_id_lookup
+
+# ============================================================================
+# THUẬT TOÁN CŨ (chép từ PromptGenerator / ProgressivePromptsGenerator, bỏ log)
+# ============================================================================
+
+
+def legacy_looks_like_narration(text: str) -> bool:
+    if not text:
+        return True
+    text_lower = text.lower().strip()
+    narration_patterns = [
+        text_lower.startswith("i "),
+        text_lower.startswith("i'"),
+        text_lower.startswith("my "),
+        text_lower.startswith("we "),
+        text_lower.startswith("she "),
+        text_lower.startswith("he "),
+        text_lower.startswith("they "),
+        '"' in text,
+        "said" in text_lower,
+        "told" in text_lower,
+        "asked" in text_lower,
+        "i was" in text_lower,
+        "i had" in text_lower,
+        "i remember" in text_lower,
+        "by the time" in text_lower,
+        "years old" in text_lower,
+        "subscribe" in text_lower,
+        "like button" in text_lower,
+        "comment" in text_lower,
+    ]
+    return any(narration_patterns)
+
+
+def legacy_clean_narration(img_prompt: str, scene_text: str) -> str:
+    if not img_prompt or not scene_text:
+        return img_prompt
+    words = scene_text.split()
+    if len(words) >= 5:
+        for i in range(len(words) - 4):
+            phrase = " ".join(words[i:i+5])
+            if phrase.lower() in img_prompt.lower():
+                pattern = re.compile(r'[^.]*' + re.escape(phrase) + r'[^.]*\.?', re.IGNORECASE)
+                img_prompt = pattern.sub('', img_prompt)
+    narration_patterns = [
+        r'By the time I was \d+ years old[^.]*\.?',
+        r'I had saved[^.]*\.?',
+        r'I decided to[^.]*\.?',
+        r'It cost me[^.]*\.?',
+        r'I remember[^.]*\.?',
+        r'She (told|said|asked)[^.]*\.?',
+        r'He (told|said|asked)[^.]*\.?',
+        r'"[^"]*"',
+    ]
+    for pattern in narration_patterns:
+        if re.search(pattern, img_prompt, re.IGNORECASE):
+            img_prompt = re.sub(pattern, '', img_prompt, flags=re.IGNORECASE)
+    img_prompt = re.sub(r'\.\.+', '.', img_prompt)
+    img_prompt = re.sub(r'\s+', ' ', img_prompt)
+    img_prompt = img_prompt.strip()
+    img_prompt = img_prompt.strip('.')
+    return img_prompt
+
+
+def legacy_fix_location(img_prompt: str, srt_text: str) -> str:
+    if not img_prompt:
+        return img_prompt
+    prompt_lower = img_prompt.lower()
+    srt_lower = srt_text.lower() if srt_text else ""
+    action_location_rules = [
+        {
+            "actions": ["lying in bed", "on the bed", "in bed", "bedroom", "on bed", "fell off the bed", "jumped up from bed"],
+            "wrong_locations": ["hallway", "corridor", "street", "outdoor", "kitchen", "office", "restaurant"],
+            "correct_location": "master bedroom, king-sized bed with silk sheets, elegant furniture, soft ambient lighting"
+        },
+        {
+            "actions": ["cooking", "in the kitchen", "at the stove", "preparing food"],
+            "wrong_locations": ["bedroom", "hallway", "office", "outdoor", "street"],
+            "correct_location": "modern kitchen interior, stove, countertops, cooking utensils, warm lighting"
+        },
+        {
+            "actions": ["shower", "bathtub", "bathroom", "brushing teeth", "mirror"],
+            "wrong_locations": ["bedroom", "kitchen", "office", "outdoor", "hallway"],
+            "correct_location": "elegant bathroom, marble tiles, mirror, soft lighting"
+        },
+        {
+            "actions": ["walking on street", "driving", "in the car", "outdoor", "park", "garden"],
+            "wrong_locations": ["bedroom", "kitchen", "bathroom", "office interior"],
+            "correct_location": "outdoor scene, natural daylight"
+        },
+        {
+            "actions": ["dining", "at restaurant", "eating dinner", "at the table"],
+            "wrong_locations": ["bedroom", "bathroom", "street", "office"],
+            "correct_location": "elegant restaurant interior, dining tables, ambient lighting"
+        },
+    ]
+    srt_location_hints = {
+        "bed": "bedroom", "bedroom": "bedroom", "master bedroom": "master bedroom",
+        "kitchen": "kitchen", "bathroom": "bathroom", "restaurant": "restaurant",
+        "office": "office", "car": "car interior", "street": "street",
+        "courthouse": "courthouse", "hospital": "hospital",
+    }
+    srt_location = None
+    for hint, loc in srt_location_hints.items():
+        if hint in srt_lower:
+            srt_location = loc
+            break
+    for rule in action_location_rules:
+        action_found = any(action in prompt_lower for action in rule["actions"])
+        if action_found:
+            for wrong_loc in rule["wrong_locations"]:
+                if wrong_loc in prompt_lower:
+                    correct_loc = rule["correct_location"]
+                    if srt_location:
+                        if srt_location == "bedroom" or srt_location == "master bedroom":
+                            correct_loc = "master bedroom, king-sized bed with silk sheets, elegant nightstands, soft warm lighting"
+                        elif srt_location == "kitchen":
+                            correct_loc = "modern kitchen, marble countertops, stainless steel appliances, warm lighting"
+                    pattern = re.compile(r'[^.]*' + re.escape(wrong_loc) + r'[^.]*\.?', re.IGNORECASE)
+                    fixed = pattern.sub(correct_loc + '. ', img_prompt)
+                    fixed = re.sub(r'\s+', ' ', fixed)
+                    fixed = re.sub(r'\.\.+', '.', fixed)
+                    return fixed.strip()
+    return img_prompt
+
+
+def legacy_id_lookup(valid_char_ids: set) -> dict:
+    id_lookup = {cid.lower(): cid for cid in valid_char_ids}
+    for cid in list(valid_char_ids):
+        if cid.startswith("nv_"):
+            id_lookup[cid[3:].lower()] = cid
+        if cid.startswith("loc_"):
+            id_lookup[cid[4:].lower()] = cid
+    return id_lookup
+
+
+def normalize_ids(characters_used: str, valid_char_ids: set, id_lookup: dict) -> str:
+    """Phần còn lại của _normalize_character_ids (giống nhau ở cả 2 bản)."""
+    normalized = []
+    for raw_id in [x.strip() for x in characters_used.split(",") if x.strip()]:
+        raw_lower = raw_id.lower()
+        if raw_lower in id_lookup:
+            normalized.append(id_lookup[raw_lower])
+        elif raw_id in valid_char_ids:
+            normalized.append(raw_id)
+        elif not raw_id.startswith("nv_") and not raw_id.startswith("loc_"):
+            normalized.append(f"nv_{raw_id}")
+        else:
+            normalized.append(raw_id)
+    return ", ".join(normalized)
+
+
+# ============================================================================
+# CORPUS
+# ============================================================================
+
+SHOTS = ["WIDE shot", "CLOSE-UP", "MEDIUM shot", "EXTREME CLOSE-UP", "LOW ANGLE", "TWO-SHOT"]
+SUBJECTS = ["A 35-year-old woman (nv_anna.png)", "A tall man in a grey suit (nv_mark.png)",
+            "An elderly mother (nv_mom.png)", "A young boy (nvc1.png)"]
+ACTIONS = ["lying in bed staring at the ceiling", "cooking dinner at the stove", "standing by the mirror",
+           "driving through rain", "dining at the table", "walking slowly", "holding a faded photograph",
+           "sitting at a desk", "crying silently", "looking out the window"]
+PLACES = ["dim hallway with flickering lights", "modern kitchen", "quiet office", "rainy street",
+          "elegant bedroom", "marble bathroom", "small restaurant", "city park", "courthouse steps"]
+NARRATION = ["By the time I was 30 years old I had nothing left.", "I remember the night everything changed.",
+             "She told me to leave and never come back.", '"You will regret this," he whispered.',
+             "I decided to sell the house.", "It cost me everything I had."]
+CHAR_IDS = {"nv_anna", "nv_mark", "nv_mom", "nvc1", "loc_office", "loc_kitchen"}
+RAW_CHARS = ["anna, mark", "nv_anna", "Mom", "nvc1, ANNA", "lucy", "loc_office", "mark, nv_mom, tom"]
+
+
+def build_corpus(n: int, seed: int = 7) -> list:
+    rnd = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        narration = rnd.choice(NARRATION)
+        srt_text = f"{narration} We were at the {rnd.choice(PLACES).split()[-1]} that day and nobody said a word."
+        sentences = [
+            f"{rnd.choice(SHOTS)} of {rnd.choice(SUBJECTS)}, {rnd.choice(ACTIONS)}",
+            f"Setting: {rnd.choice(PLACES)}",
+            "Soft volumetric light, shallow depth of field",
+            "Cinematic, 4K photorealistic, soft film grain",
+        ]
+        if rnd.random() < 0.3:
+            sentences.insert(1, rnd.choice([narration.rstrip("."), " ".join(srt_text.split()[:7])]))
+        corpus.append({
+            "img_prompt": ". ".join(sentences) + ".",
+            "srt_text": srt_text,
+            "visual_moment": rnd.choice([sentences[0], narration, rnd.choice(ACTIONS)]),
+            "characters_used": rnd.choice(RAW_CHARS),
+        })
+    return corpus
+
+
+# ============================================================================
+# BENCH
+# ============================================================================
+
+def run_legacy(corpus: list) -> list:
+    out = []
+    for s in corpus:
+        out.append((
+            legacy_looks_like_narration(s["visual_moment"]),
+            legacy_clean_narration(s["img_prompt"], s["srt_text"][:100]),
+            legacy_fix_location(s["img_prompt"], s["srt_text"]),
+            normalize_ids(s["characters_used"], CHAR_IDS, legacy_id_lookup(CHAR_IDS)),
+        ))
+    return out
+
+
+def run_compiled(rules: PromptRules, corpus: list) -> list:
+    narration = rules.looks_like_narration_many([s["visual_moment"] for s in corpus])
+    cleaned = [rules.clean_narration(s["img_prompt"], s["srt_text"][:100])[0] for s in corpus]
+    fixed = [rules.fix_location(s["img_prompt"], s["srt_text"])[0] for s in corpus]
+    ids = [normalize_ids(s["characters_used"], CHAR_IDS, build_id_lookup(frozenset(CHAR_IDS))) for s in corpus]
+    return list(zip(narration, cleaned, fixed, ids))
+
+
+def best_of(repeat: int, fn, *args) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.scenes)
+    start = time.perf_counter()
+    rules = PromptRules()
+    compile_time = time.perf_counter() - start
+
+    print("=" * 80)
+    print(f"BENCH prompt rules: {args.scenes} scenes, best of {args.repeat}")
+    print("=" * 80)
+    legacy_time, legacy_out = best_of(args.repeat, run_legacy, corpus)
+    compiled_time, compiled_out = best_of(args.repeat, run_compiled, rules, corpus)
+
+    mismatches = sum(1 for a, b in zip(legacy_out, compiled_out) if a != b)
+    narration = sum(1 for out in compiled_out if out[0])
+    fixed = sum(1 for s, out in zip(corpus, compiled_out) if out[2] != s["img_prompt"])
+    print(f"legacy   {legacy_time * 1000:8.1f} ms ({legacy_time / args.scenes * 1e6:6.1f} us/scene)")
+    print(f"compiled {compiled_time * 1000:8.1f} ms ({compiled_time / args.scenes * 1e6:6.1f} us/scene) "
+          f"+ compile {compile_time * 1000:.1f} ms | x{legacy_time / compiled_time:.1f}")
+    print(f"{narration} visual_moment narration, {fixed} locations fixed, {mismatches} output mismatches vs legacy")
+    if mismatches:
+        sys.exit(1)
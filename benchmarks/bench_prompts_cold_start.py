@@ -0,0 +1,128 @@
+"""
+Benchmark: cold start của prompt modules + load/format template
+===============================================================
+Mỗi lần đo chạy trong 1 process Python mới (cold start thật):
+- import package modules (__init__ import excel_manager, prompts_generator...)
+  và modules.prompts_loader
+- lần đầu lấy template (parse config/prompts.yaml), so với yaml.safe_load cũ
+Trong cùng process:
+- _load_prompt_template cũ (đọc + yaml.safe_load lại mỗi call) vs get_template (cache)
+- str.format vs PromptTemplate.format cho các template lớn (kết quả phải giống hệt)
+
+Usage:
+    python benchmarks/bench_prompts_cold_start.py
+    python benchmarks/bench_prompts_cold_start.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+PROMPTS_FILE = ROOT / "config" / "prompts.yaml"
+
+COLD_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import yaml
+t1 = time.perf_counter()
+import modules
+t2 = time.perf_counter()
+from modules import prompts_loader
+t3 = time.perf_counter()
+with open({prompts!r}, "r", encoding="utf-8") as f:
+    yaml.safe_load(f)
+t4 = time.perf_counter()
+prompts_loader.get_generate_scenes_prompt()
+t5 = time.perf_counter()
+prompts_loader.get_template("directors_treatment")
+t6 = time.perf_counter()
+print(json.dumps({{
+    "import yaml": t1 - t0,
+    "import modules (package init)": t2 - t1,
+    "import prompts_loader": t3 - t2,
+    "parse prompts.yaml (safe_load)": t4 - t3,
+    "first template (prompts_loader)": t5 - t4,
+    "second template": t6 - t5,
+}}))
+"""
+
+FORMAT_ARGS = {
+    "story_text": "Once upon a time... " * 200,
+    "characters_info": "- nv_anna: Anna (main) - 35-year-old woman\n" * 5,
+    "locations_info": "- loc_office: Office - glass walls\n" * 3,
+    "scenes_info": "[1] 00:00:01 Scene text\n" * 50,
+    "pacing_script": "[1] 00:00:01 Scene text\n" * 50,
+    "context_lock": "Modern city, 2020s",
+    "global_style": "Cinematic, 4K photorealistic",
+    "srt_with_timestamps": "[00:00:01] text\n" * 100,
+    "directors_treatment": "Part 1: Hook",
+}
+
+
+def cold_start(runs: int) -> dict:
+    samples = {}
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_SCRIPT.format(root=str(ROOT), prompts=str(PROMPTS_FILE))],
+                             capture_output=True, text=True, check=True, cwd=str(ROOT))
+        for name, value in json.loads(out.stdout).items():
+            samples.setdefault(name, []).append(value)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def legacy_load_prompt_template(prompt_name: str):
+    """_load_prompt_template cũ: đọc + parse lại prompts.yaml mỗi call."""
+    import yaml
+    with open(PROMPTS_FILE, "r", encoding="utf-8") as f:
+        prompts = yaml.safe_load(f)
+    return prompts.get(prompt_name, None)
+
+
+def per_call(fn, *args, repeat: int = 20, **kwargs) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args, **kwargs)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="Số process mới cho phần cold start")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"BENCH prompt modules cold start (median of {args.runs} fresh processes)")
+    print("=" * 80)
+    for name, seconds in cold_start(args.runs).items():
+        print(f"  {name:<32} {seconds * 1000:8.1f} ms")
+
+    from modules import prompts_loader
+
+    print("\nLoad template mỗi call:")
+    legacy = per_call(legacy_load_prompt_template, "directors_treatment", repeat=10)
+    cached = per_call(prompts_loader.get_template, "directors_treatment", repeat=1000)
+    print(f"  legacy re-read + safe_load   {legacy * 1000:8.2f} ms/call")
+    print(f"  get_template (mtime check)   {cached * 1000:8.3f} ms/call  | x{legacy / cached:,.0f}")
+
+    print("\nFormat template:")
+    for name in ("analyze_story", "directors_treatment", "generate_scenes", "smart_divide_scenes"):
+        template = prompts_loader.get_template(name)
+        if not template:
+            continue
+        text = str(template)
+        try:
+            expected = text.format(**FORMAT_ARGS)
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"  {name:<22} skipped ({type(e).__name__}: {e})")
+            continue
+        same = template.format(**FORMAT_ARGS) == expected
+        raw = per_call(text.format, repeat=2000, **FORMAT_ARGS)
+        compiled = per_call(template.format, repeat=2000, **FORMAT_ARGS)
+        print(f"  {name:<22} {len(text):>6} chars | str.format {raw * 1e6:7.1f} us | "
+              f"precompiled {compiled * 1e6:7.1f} us | same={same}")
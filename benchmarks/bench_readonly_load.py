@@ -0,0 +1,106 @@
+"""
+Benchmark: load workbook full edit mode vs PromptWorkbook.open_readonly()
+=========================================================================
+Tạo workbook 1,000 scenes rồi đo thời gian load + peak memory cho:
+  - full:     openpyxl.load_workbook(path) + đọc sheet scenes (cách cũ)
+  - readonly: PromptWorkbook.open_readonly(path, ["scenes"])
+
+Mỗi mode chạy trong process riêng để peak RSS không ảnh hưởng nhau.
+
+Usage:
+    python benchmarks/bench_readonly_load.py [--scenes 1000]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from modules.excel_manager import PromptWorkbook, Scene, Character
+
+
+def build_workbook(path: Path, n_scenes: int) -> None:
+    workbook = PromptWorkbook(path, state_sidecar=False).load_or_create()
+    for i in range(1, 11):
+        workbook.add_character(Character(id=f"nv{i}", english_prompt="A tall man, short black hair " * 4))
+    for i in range(1, n_scenes + 1):
+        workbook.add_scene(Scene(
+            scene_id=i,
+            srt_start="00:00:01,000",
+            srt_end="00:00:05,000",
+            srt_text=f"Narration line for scene {i}. " * 3,
+            img_prompt=f"Cinematic wide shot, scene {i}, character nv1 (nv1.png) in loc_01. " * 4,
+            video_prompt=f"Slow camera push in, scene {i}",
+            characters_used='["nv1"]',
+            location_used="loc_01",
+            reference_files='["nv1.png", "loc_01.png"]',
+        ))
+    workbook.save()
+
+
+def load_rows(mode: str, path: Path) -> list:
+    if mode == "full":
+        from openpyxl import load_workbook
+        wb = load_workbook(path)
+        return list(wb[PromptWorkbook.SCENES_SHEET].iter_rows(min_row=2, values_only=True))
+    sheets = PromptWorkbook.open_readonly(path, [PromptWorkbook.SCENES_SHEET])
+    return sheets[PromptWorkbook.SCENES_SHEET].rows
+
+
+def run_mode(mode: str, path: Path) -> dict:
+    # Lần 1: đo thời gian (tracemalloc làm chậm đáng kể nên tách riêng)
+    start = time.perf_counter()
+    rows = load_rows(mode, path)
+    elapsed = time.perf_counter() - start
+
+    # Lần 2: đo peak memory của Python
+    tracemalloc.start()
+    load_rows(mode, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {"rows": len(rows), "seconds": elapsed, "py_peak_mb": peak / 1024 / 1024}
+    try:
+        import resource
+        # Linux: ru_maxrss tính bằng KB
+        result["rss_peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        result["rss_peak_mb"] = None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=1000)
+    parser.add_argument("--mode", choices=["full", "readonly"])
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, Path(args.path))))
+        sys.exit(0)
+
+    print("=" * 80)
+    print(f"BENCH load workbook: full vs read-only ({args.scenes} scenes)")
+    print("=" * 80)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "BENCH_prompts.xlsx"
+        build_workbook(path, args.scenes)
+        print(f"Workbook: {path.stat().st_size / 1024:.0f} KB")
+
+        for mode in ("full", "readonly"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--path", str(path)],
+                capture_output=True, text=True, check=True
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            rss = f"{r['rss_peak_mb']:.1f} MB" if r["rss_peak_mb"] is not None else "n/a"
+            print(f"{mode:>9}: {r['seconds'] * 1000:8.1f} ms | python peak {r['py_peak_mb']:6.1f} MB "
+                  f"| process peak RSS {rss} | rows {r['rows']}")
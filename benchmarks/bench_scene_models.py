@@ -0,0 +1,83 @@
+"""
+Benchmark: Scene/Character model - dict-based vs __slots__ + from_row
+======================================================================
+Đo thời gian dựng và bộ nhớ giữ 5k Scene (giống GUI scene list của project lớn).
+
+- legacy : object có __dict__, dựng qua from_dict(dict(zip(SCENES_COLUMNS, row)))
+- slots  : Scene hiện tại (__slots__), dựng thẳng từ row tuple qua Scene.from_row
+
+Usage:
+    python benchmarks/bench_scene_models.py
+"""
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.excel_manager import Scene, SCENES_COLUMNS
+
+
+# Layout cũ: cùng __init__/from_dict nhưng không có __slots__ -> mỗi instance có __dict__
+LegacyScene = type("LegacyScene", (), {
+    key: value for key, value in vars(Scene).items()
+    if key not in Scene.__slots__ and key not in ("__slots__", "__dict__", "__weakref__")
+})
+
+
+def legacy_from_row(row: tuple) -> LegacyScene:
+    """Đường cũ: row -> dict -> from_dict -> object có __dict__."""
+    return LegacyScene.from_dict(dict(zip(SCENES_COLUMNS, row)))
+
+
+def make_rows(n_scenes: int) -> list:
+    rows = []
+    for i in range(1, n_scenes + 1):
+        rows.append((
+            i, "00:00:01,000", "00:00:05,000", 4.0, 4.0,
+            f"Scene text {i} " * 8,
+            f"Cinematic prompt for scene {i} " * 10,
+            "", "", f"img/{i}.png", "", "done", "pending",
+            '["nvc"]', "loc_1", '["nvc.png", "loc_1.png"]', f"media-{i}", "", 1 + i // 50,
+        ))
+    return rows
+
+
+def bench_build(build, rows: list, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        [build(row) for row in rows]
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_memory(build, rows: list) -> int:
+    """Bộ nhớ tăng thêm để giữ list object (không tính string đã có sẵn trong rows)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build(row) for row in rows]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return after - before
+
+
+if __name__ == "__main__":
+    n = 5000
+    rows = make_rows(n)
+
+    print("=" * 80)
+    print(f"BENCH scene models: {n} scenes")
+    print("=" * 80)
+    results = {}
+    for name, build in (("legacy", legacy_from_row), ("slots", Scene.from_row)):
+        elapsed = bench_build(build, rows)
+        memory = bench_memory(build, rows)
+        results[name] = (elapsed, memory)
+        print(f"  {name:<7} build {elapsed * 1000:8.1f} ms ({elapsed / n * 1e6:5.2f} us/scene) | "
+              f"memory {memory / 1024 / 1024:6.2f} MB ({memory / n:6.0f} B/scene)")
+
+    (legacy_t, legacy_m), (slots_t, slots_m) = results["legacy"], results["slots"]
+    print(f"  speedup x{legacy_t / slots_t:.1f} | memory -{(1 - slots_m / legacy_m) * 100:.0f}%")
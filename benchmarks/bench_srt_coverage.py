@@ -0,0 +1,106 @@
+"""
+Benchmark: SRT coverage - quét lồng nhau vs interval map
+=========================================================
+Đo update_srt_coverage_segments / update_srt_coverage_scenes cho SRT 3 tiếng
+(3,000 entries, 60 segments, 1,000 scenes trong director_plan).
+
+Usage:
+    python benchmarks/bench_srt_coverage.py
+"""
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from openpyxl.styles import PatternFill
+
+from modules.excel_manager import PromptWorkbook
+from modules.utils import SrtEntry
+
+
+def legacy_update_segments(workbook: PromptWorkbook, segments: list) -> None:
+    """Thuật toán cũ: mỗi row quét toàn bộ segments, ghi/tô lại từng ô."""
+    ws = workbook.workbook[workbook.SRT_COVERAGE_SHEET]
+    segment_fill = PatternFill(start_color="FFF9C4", end_color="FFF9C4", fill_type="solid")
+    for row in range(2, ws.max_row + 1):
+        srt_index = ws.cell(row=row, column=1).value
+        if srt_index is None:
+            continue
+        segment_found = None
+        for seg in segments:
+            if seg.get("srt_range_start", 0) <= srt_index <= seg.get("srt_range_end", 0):
+                segment_found = seg
+                break
+        if segment_found:
+            ws.cell(row=row, column=5, value=segment_found.get("segment_id", ""))
+            ws.cell(row=row, column=6, value=segment_found.get("segment_name", ""))
+            ws.cell(row=row, column=8, value="SEGMENT_OK")
+            ws.cell(row=row, column=8).fill = segment_fill
+
+
+def legacy_update_scenes(workbook: PromptWorkbook, director_plan: list) -> None:
+    """Thuật toán cũ: mỗi row quét srt_indices của toàn bộ director_plan."""
+    ws = workbook.workbook[workbook.SRT_COVERAGE_SHEET]
+    scene_fill = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")
+    for row in range(2, ws.max_row + 1):
+        srt_index = ws.cell(row=row, column=1).value
+        if srt_index is None:
+            continue
+        scene_ids = [s.get("scene_id", "") for s in director_plan if srt_index in s.get("srt_indices", [])]
+        if scene_ids:
+            ws.cell(row=row, column=7, value=", ".join(map(str, scene_ids)))
+            ws.cell(row=row, column=8, value="COVERED")
+            ws.cell(row=row, column=8).fill = scene_fill
+
+
+def make_inputs(n_srt: int, n_segments: int, n_scenes: int):
+    entries = [
+        SrtEntry(i, timedelta(seconds=i * 3.6), timedelta(seconds=i * 3.6 + 3), f"Line {i} of the story")
+        for i in range(1, n_srt + 1)
+    ]
+    per_segment = n_srt // n_segments
+    segments = [
+        {"segment_id": s + 1, "segment_name": f"Part {s + 1}",
+         "srt_range_start": s * per_segment + 1, "srt_range_end": (s + 1) * per_segment}
+        for s in range(n_segments)
+    ]
+    per_scene = n_srt // n_scenes
+    scenes = [
+        {"scene_id": s + 1, "srt_indices": list(range(s * per_scene + 1, (s + 1) * per_scene + 1))}
+        for s in range(n_scenes)
+    ]
+    return entries, segments, scenes
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    entries, segments, scenes = make_inputs(3000, 60, 1000)
+
+    print("=" * 80)
+    print(f"BENCH srt coverage: {len(entries)} SRT, {len(segments)} segments, {len(scenes)} scenes")
+    print("=" * 80)
+    with tempfile.TemporaryDirectory() as tmp:
+        workbook = PromptWorkbook(Path(tmp) / "bench_prompts.xlsx", state_sidecar=False).load_or_create()
+        workbook.init_srt_coverage(entries)
+        # Chỉ đo phần tính + ghi cell, không tính thời gian save file
+        workbook.save = lambda: None
+
+        legacy_seg = timed(legacy_update_segments, workbook, segments)
+        legacy_scn = timed(legacy_update_scenes, workbook, scenes)
+
+        workbook.init_srt_coverage(entries)
+        new_seg = timed(workbook.update_srt_coverage_segments, segments)
+        new_scn = timed(workbook.update_srt_coverage_scenes, scenes)
+
+    print(f"  segments | legacy {legacy_seg * 1000:8.1f} ms | interval map {new_seg * 1000:7.1f} ms | "
+          f"x{legacy_seg / new_seg:.0f}")
+    print(f"  scenes   | legacy {legacy_scn * 1000:8.1f} ms | inverted map {new_scn * 1000:7.1f} ms | "
+          f"x{legacy_scn / new_scn:.0f}")
@@ -28,10 +28,17 @@ if sys.platform == "win32":
 import os
 import json
 import time
+import threading
 import requests
-from typing import Optional, List, Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Callable, Iterator
 from dataclasses import dataclass
 
+from modules.provider_router import ProviderRouter
+from modules.llm_cache import cache_key
+from modules.llm_replay import LLMReplay
+
 
 @dataclass
 class AIProvider:
@@ -333,19 +340,51 @@ class MultiAIClient:
     """
     Client ho tro nhieu AI providers.
     Tu dong test va loai bo API khong hoat dong khi khoi tao.
+    Moi call chon provider theo latency/ti le thanh cong (ProviderRouter),
+    provider loi lien tiep bi ngat tam thoi (circuit breaker).
     """
 
+    # Provider theo thu tu cau hinh: (ten, key trong config, client class)
+    PROVIDERS = (
+        ("deepseek", "deepseek_api_keys", DeepSeekClient),
+        ("groq", "groq_api_keys", GroqClient),
+        ("openrouter", "openrouter_api_keys", OpenRouterClient),
+        ("gemini", "gemini_api_keys", GeminiClient),
+    )
+
+    # So request dong thoi toi da moi provider (tat ca key cong lai),
+    # ghi de bang config provider_concurrency: {deepseek: 6, groq: 2, ...}
+    DEFAULT_CONCURRENCY = {"deepseek": 6, "groq": 2, "openrouter": 2, "gemini": 2}
+
     def __init__(self, config: Dict[str, Any], auto_filter: bool = True):
         """
         Config format:
         {
             "deepseek_api_keys": ["key1"],  # DeepSeek
+            "groq_api_keys": [],            # Groq (tuy chon)
+            "openrouter_api_keys": [],      # OpenRouter (tuy chon)
+            "gemini_api_keys": [],          # Gemini (tuy chon)
         }
 
         auto_filter: Tu dong test va loai bo API khong hoat dong
         """
         self.config = config
         self.clients = []
+        # label ("deepseek:deepseek-chat#1") -> (ten provider, client)
+        self._routes: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.router = ProviderRouter()
+
+        limits = dict(self.DEFAULT_CONCURRENCY)
+        limits.update(config.get("provider_concurrency") or {})
+        self._limits = {name: max(1, int(limits.get(name, 1))) for name, _, _ in self.PROVIDERS}
+        self._slots = {name: threading.BoundedSemaphore(limit) for name, limit in self._limits.items()}
+        # label -> so call dang chay (de chia tai giua cac key/provider)
+        self._in_flight: Dict[str, int] = {}
+
+        # Record/replay cho benchmark offline (config llm_record / llm_replay)
+        self.llm_replay = LLMReplay.from_config(config)
+
         self._init_clients(auto_filter)
 
     def _test_client(self, name: str, client) -> bool:
@@ -356,26 +395,30 @@ class MultiAIClient:
         except:
             return False
 
+    def _add_client(self, name: str, client, index: int):
+        self.clients.append((name, client))
+        self._routes[f"{name}:{client.model}#{index + 1}"] = (name, client)
+
     def _init_clients(self, auto_filter: bool = True):
-        """Khoi tao cac clients - DeepSeek."""
+        """Khoi tao cac clients theo thu tu PROVIDERS."""
 
         if auto_filter:
             print("\n[API Filter] Dang kiem tra API keys...")
 
-        # DeepSeek
-        deepseek_keys = self.config.get("deepseek_api_keys", [])
-        for i, key in enumerate(deepseek_keys):
-            if key and key.strip():
-                client = DeepSeekClient(key.strip())
-                if auto_filter:
-                    print(f"  Testing DeepSeek key #{i+1}...", end=" ")
-                    if self._test_client("deepseek", client):
-                        print("OK")
-                        self.clients.append(("deepseek", client))
+        for name, config_key, client_class in self.PROVIDERS:
+            keys = self.config.get(config_key) or []
+            for i, key in enumerate(keys):
+                if key and key.strip():
+                    client = client_class(key.strip())
+                    if auto_filter:
+                        print(f"  Testing {name.capitalize()} key #{i+1}...", end=" ")
+                        if self._test_client(name, client):
+                            print("OK")
+                            self._add_client(name, client, i)
+                        else:
+                            print("SKIP (error)")
                     else:
-                        print("SKIP (error)")
-                else:
-                    self.clients.append(("deepseek", client))
+                        self._add_client(name, client, i)
 
         if auto_filter:
             # Count by provider type
@@ -383,9 +426,7 @@ class MultiAIClient:
             for name, _ in self.clients:
                 counts[name] = counts.get(name, 0) + 1
 
-            result_parts = []
-            if counts.get('deepseek', 0):
-                result_parts.append(f"{counts['deepseek']} DeepSeek")
+            result_parts = [f"{counts[name]} {name.capitalize()}" for name, _, _ in self.PROVIDERS if counts.get(name)]
 
             print(f"[API Filter] Ket qua: {', '.join(result_parts) if result_parts else 'Khong co provider nao'}")
 
@@ -395,7 +436,48 @@ class MultiAIClient:
                 first_provider = self.clients[0][0] if self.clients else None
                 if first_provider:
                     print(f"[API Filter] Se dung: {first_provider.capitalize()}")
-    
+
+    def _remove_client(self, label: str):
+        """Bo client khong dung duoc nua (key leak/het quota/sai key)."""
+        with self._lock:
+            entry = self._routes.pop(label, None)
+            if entry is not None:
+                self.clients = [c for c in self.clients if c[1] is not entry[1]]
+
+    @contextmanager
+    def _acquire(self, labels: List[str]) -> Iterator[str]:
+        """
+        Giu 1 slot concurrency cho label dau tien (theo thu tu) co provider con
+        slot; tat ca deu het slot thi cho slot cua label dau tien.
+        """
+        chosen = None
+        for label in labels:
+            if self._slots[self._provider_of(label)].acquire(blocking=False):
+                chosen = label
+                break
+        if chosen is None:
+            chosen = labels[0]
+            self._slots[self._provider_of(chosen)].acquire()
+
+        with self._lock:
+            self._in_flight[chosen] = self._in_flight.get(chosen, 0) + 1
+        try:
+            yield chosen
+        finally:
+            with self._lock:
+                self._in_flight[chosen] -= 1
+            self._slots[self._provider_of(chosen)].release()
+
+    @staticmethod
+    def _request_key(prompt: str, system_prompt: Optional[str], temperature: float, max_tokens: int) -> str:
+        """Key cua request trong fixture llm_replay (khong phu thuoc provider duoc chon)."""
+        return cache_key("multi_ai", prompt, temperature, max_tokens, system_prompt or "")
+
+    @staticmethod
+    def _provider_of(label: str) -> str:
+        """'deepseek:deepseek-chat#1' -> 'deepseek'."""
+        return label.split(":", 1)[0]
+
     def generate(
         self,
         prompt: str,
@@ -405,62 +487,145 @@ class MultiAIClient:
         retry_count: int = 2
     ) -> Optional[str]:
         """
-        Generate text, tu dong chuyen sang provider khac neu loi.
-        Chi thu cac API da duoc filter la hoat dong.
+        Generate text, thu provider tot nhat truoc (router), loi thi chuyen
+        sang provider tiep theo ngay. Het 1 vong ma tat ca deu loi thi cho 1s
+        roi thu lai (toi da retry_count vong).
+
+        Provider dang chay du so request toi da (provider_concurrency) thi
+        uu tien provider khac con slot.
         """
 
+        if self.llm_replay is not None and self.llm_replay.replaying:
+            entry = self.llm_replay.replay(self._request_key(prompt, system_prompt, temperature, max_tokens))
+            if entry is None:
+                print("[MultiAI] Replay miss (request khong co trong fixture)")
+                return None
+            time.sleep(entry["latency"])
+            return entry["content"]
+
         if not self.clients:
             print("[MultiAI] Khong co AI provider nao hoat dong!")
             return None
 
         errors = []
-        clients_to_remove = []
 
-        for idx, (name, client) in enumerate(self.clients):
-            for attempt in range(retry_count):
-                try:
-                    print(f"[MultiAI] {name.capitalize()} (attempt {attempt + 1})...")
+        for attempt in range(retry_count):
+            with self._lock:
+                labels = list(self._routes)
+                load = dict(self._in_flight)
+            remaining = self.router.order(labels, load=load)
+            while remaining:
+                with self._acquire(remaining) as label:
+                    remaining.remove(label)
+                    entry = self._routes.get(label)
+                    if entry is None:
+                        continue
+                    result, error = self._call_route(label, entry[1], attempt, prompt, system_prompt,
+                                                     temperature, max_tokens)
+                if result:
+                    return result
+                if error:
+                    errors.append(error)
+
+            if attempt < retry_count - 1 and self.clients:
+                time.sleep(1)
 
-                    result = client.generate(
-                        prompt=prompt,
-                        system_prompt=system_prompt,
-                        temperature=temperature,
-                        max_tokens=max_tokens
-                    )
+        if errors:
+            print(f"[MultiAI] Tat ca providers failed")
+        return None
 
-                    if result:
-                        return result
+    def _call_route(self, label: str, client, attempt: int, prompt: str, system_prompt: Optional[str],
+                    temperature: float, max_tokens: int) -> tuple:
+        """1 call qua 1 client, cap nhat router. Returns: (text hoac None, loi hoac None)."""
+        if not self.router.begin(label):
+            # Provider half-open, call thu da co call khac giu
+            return None, None
+        print(f"[MultiAI] {label} (attempt {attempt + 1})...")
 
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    errors.append(f"{name}: {str(e)[:50]}")
+        started = time.monotonic()
+        try:
+            result = client.generate(
+                prompt=prompt,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        except Exception as e:
+            self.router.record_failure(label)
+            error_msg = str(e).lower()
+
+            # Loi nghiem trong - xoa client nay
+            if "leaked" in error_msg or "quota" in error_msg or "unauthorized" in error_msg:
+                print(f"[MultiAI] {label} khong dung duoc, bo qua...")
+                self._remove_client(label)
+            return None, f"{label}: {str(e)[:50]}"
+
+        if result:
+            latency = time.monotonic() - started
+            self.router.record_success(label, latency)
+            if self.llm_replay is not None:
+                self.llm_replay.record(self._request_key(prompt, system_prompt, temperature, max_tokens),
+                                       label, result, latency)
+            return result, None
+        self.router.record_failure(label)
+        return None, None
+
+    def generate_many(
+        self,
+        prompts: List[str],
+        system_prompt: str = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096,
+        retry_count: int = 2,
+        on_result: Optional[Callable[[int, Optional[str]], None]] = None
+    ) -> List[Optional[str]]:
+        """
+        Generate nhieu prompt song song tren tat ca provider/key con dung duoc.
 
-                    # Loi nghiem trong - xoa client nay
-                    if "leaked" in error_msg or "quota" in error_msg or "unauthorized" in error_msg:
-                        print(f"[MultiAI] {name} khong dung duoc, bo qua...")
-                        clients_to_remove.append(idx)
-                        break
+        So request dong thoi = tong provider_concurrency cua cac provider dang
+        co client; moi call chon route nhu generate() (router + con slot).
 
-                    # Rate limit - chuyen sang provider khac ngay
-                    if "rate" in error_msg or "429" in error_msg:
-                        print(f"[MultiAI] {name} rate limit, chuyen provider...")
-                        break
+        Args:
+            on_result: Callback(index, text) ngay khi 1 prompt xong (thu tu
+                       hoan thanh, khong phai thu tu prompts)
 
-                time.sleep(1)
+        Returns:
+            Ket qua theo dung thu tu prompts (None = that bai)
+        """
+        results: List[Optional[str]] = [None] * len(prompts)
+        if not prompts:
+            return results
 
-        # Xoa cac client khong dung duoc
-        for idx in reversed(clients_to_remove):
-            if idx < len(self.clients):
-                self.clients.pop(idx)
+        providers = {name for name, _ in self.clients}
+        max_workers = max(1, min(len(prompts), sum(self._limits[name] for name in providers) or 1))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.generate, prompt, system_prompt, temperature, max_tokens, retry_count): idx
+                for idx, prompt in enumerate(prompts)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    print(f"[MultiAI] Prompt {idx + 1} loi: {e}")
+                if on_result:
+                    on_result(idx, results[idx])
+
+        return results
 
-        if errors:
-            print(f"[MultiAI] Tat ca providers failed")
-        return None
-    
     def get_available_providers(self) -> List[str]:
         """Tra ve danh sach providers kha dung."""
         return [name for name, _ in self.clients]
 
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Label provider -> calls, successes, failures, success_rate, latency
+        (EWMA, giay), state (closed/open/half_open), open_for (giay).
+        """
+        return self.router.stats()
+
 
 # ============================================================================
 # HELPER FUNCTIONS
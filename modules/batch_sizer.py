@@ -0,0 +1,147 @@
+"""
+VE3 Tool - Adaptive batch size cho các step gọi LLM theo batch
+==============================================================
+Step 4.5 (scene planning) và Step 5 (scene prompts) gửi N scenes mỗi request.
+N cố định thì:
+- N lớn: response vượt max_tokens, bị cắt -> mất scenes, phải tạo fallback
+- N nhỏ: phần context chung của prompt (story, characters, locations) bị gửi
+  lại nhiều lần, tốn token + số request
+
+AdaptiveBatchSizer chọn N cho batch tiếp theo từ số liệu đo được:
+- Token output trung bình / scene (EWMA) -> N sao cho response chiếm
+  khoảng target_fill của max_tokens
+- Bị cắt -> giảm ngay xuống dưới số scene đã về được
+- Response ngắn -> tăng dần (mỗi lần tối đa +25%), không tăng khi tỉ lệ bị
+  cắt gần đây cao
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class AdaptiveBatchSizer:
+    """
+    Batch size tự điều chỉnh theo token đo được và tỉ lệ response bị cắt.
+
+    Attributes:
+        size: Batch size hiện tại (next_size())
+        min_size, max_size: Giới hạn của size
+        max_tokens: max_tokens của request
+        target_fill: Tỉ lệ max_tokens muốn response dùng tới
+    """
+
+    # Hệ số EWMA cho token/scene
+    ALPHA = 0.3
+    # Số batch gần nhất dùng để tính tỉ lệ bị cắt
+    WINDOW = 20
+    # Tỉ lệ bị cắt gần đây vượt ngưỡng này thì không tăng size
+    MAX_TRUNCATION_RATE = 0.1
+
+    def __init__(
+        self,
+        initial: int = 10,
+        min_size: int = 3,
+        max_size: int = 30,
+        max_tokens: int = 8192,
+        target_fill: float = 0.75
+    ):
+        self.min_size = max(1, int(min_size))
+        self.max_size = max(self.min_size, int(max_size))
+        self.size = min(self.max_size, max(self.min_size, int(initial)))
+        self.max_tokens = max_tokens
+        self.target_fill = target_fill
+
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=self.WINDOW)  # True = bị cắt
+        self.output_tokens_per_item: Optional[float] = None
+        self.prompt_tokens_per_call: Optional[float] = None
+
+        # Metrics
+        self.calls = 0
+        self.items = 0
+        self.truncations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @classmethod
+    def from_config(cls, config: dict, initial: int, max_tokens: int = 8192) -> "AdaptiveBatchSizer":
+        """
+        settings.yaml: adaptive_batch (true/false), batch_size_min, batch_size_max.
+        adaptive_batch=false -> size luôn = initial.
+        """
+        if not config.get("adaptive_batch", True):
+            return cls(initial=initial, min_size=initial, max_size=initial, max_tokens=max_tokens)
+        return cls(
+            initial=initial,
+            min_size=int(config.get("batch_size_min", 3)),
+            max_size=int(config.get("batch_size_max", 30)),
+            max_tokens=max_tokens,
+        )
+
+    def next_size(self) -> int:
+        """Số scene cho batch tiếp theo."""
+        with self._lock:
+            return self.size
+
+    def record(self, requested: int, returned: int, prompt_tokens: int = 0,
+               completion_tokens: int = 0, truncated: bool = False) -> None:
+        """
+        Ghi nhận kết quả của 1 API call.
+
+        Args:
+            requested: Số scene đã gửi
+            returned: Số scene hoàn chỉnh nhận về
+            prompt_tokens, completion_tokens: usage của response (0 = không có)
+            truncated: Response bị cắt (JSON chưa đóng / finish_reason=length)
+        """
+        with self._lock:
+            self.calls += 1
+            self.items += returned
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self._recent.append(bool(truncated))
+
+            if returned and completion_tokens:
+                per_item = completion_tokens / returned
+                if self.output_tokens_per_item is None:
+                    self.output_tokens_per_item = per_item
+                else:
+                    self.output_tokens_per_item += self.ALPHA * (per_item - self.output_tokens_per_item)
+            if prompt_tokens:
+                if self.prompt_tokens_per_call is None:
+                    self.prompt_tokens_per_call = float(prompt_tokens)
+                else:
+                    self.prompt_tokens_per_call += self.ALPHA * (prompt_tokens - self.prompt_tokens_per_call)
+
+            if truncated:
+                self.truncations += 1
+                # Chỉ ~returned scene vừa với max_tokens -> lùi xuống dưới mức đó
+                fits = int(returned * 0.8) if returned else self.size // 2
+                self.size = max(self.min_size, min(self.size - 1, fits))
+                return
+
+            if self.output_tokens_per_item:
+                target = int(self.max_tokens * self.target_fill / self.output_tokens_per_item)
+                target = min(self.max_size, max(self.min_size, target))
+                if target < self.size:
+                    self.size = target
+                elif target > self.size and self._truncation_rate() <= self.MAX_TRUNCATION_RATE:
+                    self.size = min(target, self.size + max(1, self.size // 4))
+
+    def _truncation_rate(self) -> float:
+        return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics: scenes/API call, tỉ lệ bị cắt, token trung bình."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "items": self.items,
+                "items_per_call": round(self.items / self.calls, 1) if self.calls else 0.0,
+                "truncations": self.truncations,
+                "truncation_rate": round(self.truncations / self.calls, 3) if self.calls else 0.0,
+                "output_tokens_per_item": round(self.output_tokens_per_item or 0.0, 1),
+                "prompt_tokens_per_call": round(self.prompt_tokens_per_call or 0.0, 1),
+                "size": self.size,
+            }
@@ -44,6 +44,7 @@ from datetime import datetime
 
 # Import PromptWorkbook
 from modules.excel_manager import PromptWorkbook, Scene
+from modules.change_journal import ChangeJournal
 from modules.utils import get_logger, load_settings
 
 # Browser driver imports - PREFER SELENIUM (more stable)
@@ -1097,7 +1098,7 @@ class BrowserFlowGenerator:
         self._log(f"Project: {self.project_code}")
 
         # Load Excel
-        workbook = PromptWorkbook(excel_path)
+        workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
         workbook.load_or_create()
 
         # Lay cac scene can tao anh
@@ -1570,7 +1571,7 @@ class BrowserFlowGenerator:
         workbook = None
         if excel_path and Path(excel_path).exists():
             try:
-                workbook = PromptWorkbook(excel_path)
+                workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
                 workbook.load_or_create()
                 self._log(f"[Excel] Loaded: {excel_path}")
             except Exception as e:
@@ -1817,7 +1818,7 @@ class BrowserFlowGenerator:
             return {"success": False, "error": "Khong tim thay file Excel"}
 
         # Load Excel
-        workbook = PromptWorkbook(excel_path)
+        workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
         workbook.load_or_create()
 
         # Lay cac nhan vat can tao anh
@@ -2589,7 +2590,7 @@ class BrowserFlowGenerator:
         aspect_ratio = ar_map.get(ar_setting, AspectRatio.LANDSCAPE)
 
         # Load Excel
-        workbook = PromptWorkbook(excel_path)
+        workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
         workbook.load_or_create()
 
         # Lay cac scene can tao anh
@@ -2852,7 +2853,7 @@ class BrowserFlowGenerator:
         aspect_ratio = ar_map.get(ar_setting, VideoAspectRatio.LANDSCAPE)
 
         # Load Excel
-        workbook = PromptWorkbook(excel_path)
+        workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
         workbook.load_or_create()
 
         # Lay cac scene can tao video
@@ -2998,7 +2999,7 @@ class BrowserFlowGenerator:
         if not excel_path:
             return {"success": False, "error": "Không tìm thấy file Excel"}
 
-        workbook = PromptWorkbook(excel_path)
+        workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
         workbook.load_or_create()
 
         # === ĐỌC MEDIA_ID TỪ CACHE (giống tạo ảnh đọc cached_media_names) ===
@@ -3382,6 +3383,19 @@ class BrowserFlowGenerator:
             except Exception as e:
                 self._log(f"[WARN] Không đọc được config từ Excel: {e}", "warn")
 
+            # Giá trị ghi qua change journal mà owner chưa gộp vào file Excel (mới hơn)
+            if ChangeJournal(excel_path).exists():
+                try:
+                    config_wb = PromptWorkbook(excel_path)
+                    journal_url = config_wb.get_config_value('flow_project_url')
+                    if journal_url and '/project/' in journal_url:
+                        saved_project_url = journal_url
+                    journal_profile = config_wb.get_config_value('chrome_profile_path')
+                    if journal_profile and Path(journal_profile).exists():
+                        saved_chrome_profile = journal_profile
+                except Exception as e:
+                    self._log(f"[WARN] Không đọc được config từ change journal: {e}", "warn")
+
         # Chọn profile: ưu tiên saved profile từ Excel, fallback về default
         if saved_chrome_profile:
             profile_to_use = saved_chrome_profile
@@ -3464,62 +3478,15 @@ class BrowserFlowGenerator:
                 new_project_url = getattr(drission_api, '_current_project_url', '')
                 if new_project_url and '/project/' in new_project_url and excel_path:
                     try:
-                        import openpyxl
-                        wb = openpyxl.load_workbook(excel_path)
-                        if 'config' not in wb.sheetnames:
-                            ws = wb.create_sheet('config')
-                            # Thêm header row
-                            ws['A1'] = 'key'
-                            ws['B1'] = 'value'
-                        else:
-                            ws = wb['config']
-                            # Đảm bảo có header
-                            if not ws['A1'].value:
-                                ws['A1'] = 'key'
-                                ws['B1'] = 'value'
-
-                        # Tìm hoặc thêm row cho flow_project_url
-                        found = False
-                        for row_num in range(2, min(ws.max_row + 1, 50)):  # Giới hạn 50 rows
-                            cell_val = ws.cell(row=row_num, column=1).value
-                            if cell_val and str(cell_val).strip().lower() == 'flow_project_url':
-                                ws.cell(row=row_num, column=2, value=new_project_url)
-                                found = True
-                                break
-                        if not found:
-                            # Tìm row trống đầu tiên (sau header)
-                            next_row = 2
-                            for r in range(2, 50):
-                                if not ws.cell(row=r, column=1).value:
-                                    next_row = r
-                                    break
-                                next_row = r + 1
-                            ws.cell(row=next_row, column=1, value='flow_project_url')
-                            ws.cell(row=next_row, column=2, value=new_project_url)
-
+                        # Qua change journal: không ghi đè thay đổi của worker khác
+                        config_wb = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
+                        config_wb.load_or_create()
+                        config_wb.set_config_value('flow_project_url', new_project_url)
                         # Cũng lưu chrome_profile_path
                         profile_path = str(drission_api.profile_dir) if hasattr(drission_api, 'profile_dir') else ''
                         if profile_path:
-                            found = False
-                            for row_num in range(2, min(ws.max_row + 1, 50)):
-                                cell_val = ws.cell(row=row_num, column=1).value
-                                if cell_val and str(cell_val).strip().lower() == 'chrome_profile_path':
-                                    ws.cell(row=row_num, column=2, value=profile_path)
-                                    found = True
-                                    break
-                            if not found:
-                                # Tìm row trống đầu tiên
-                                next_row = 2
-                                for r in range(2, 50):
-                                    if not ws.cell(row=r, column=1).value:
-                                        next_row = r
-                                        break
-                                    next_row = r + 1
-                                ws.cell(row=next_row, column=1, value='chrome_profile_path')
-                                ws.cell(row=next_row, column=2, value=profile_path)
-
-                        wb.save(excel_path)
-                        wb.close()
+                            config_wb.set_config_value('chrome_profile_path', profile_path)
+                        config_wb.save()
                         self._log(f"[v] Lưu project URL vào Excel: {new_project_url[:50]}...")
                     except Exception as e:
                         self._log(f"[WARN] Không lưu được project URL: {e}", "warn")
@@ -3617,7 +3584,7 @@ class BrowserFlowGenerator:
         workbook = None
         if excel_path and Path(excel_path).exists():
             try:
-                workbook = PromptWorkbook(excel_path)
+                workbook = PromptWorkbook(excel_path, change_journal=True, journal_owner=(self.worker_id == 0))
                 workbook.load_or_create()
             except Exception as e:
                 self._log(f"Warning: Khong load duoc Excel: {e}", "warn")
@@ -4376,21 +4343,6 @@ class BrowserFlowGenerator:
                 # 2. Lưu vào Excel (sheet config) để tái sử dụng
                 if workbook:
                     try:
-                        import openpyxl
-                        wb = openpyxl.load_workbook(excel_path)
-
-                        # Tạo hoặc lấy sheet 'config'
-                        if 'config' not in wb.sheetnames:
-                            ws = wb.create_sheet('config')
-                            ws['A1'] = 'key'
-                            ws['B1'] = 'value'
-                        else:
-                            ws = wb['config']
-                            # Đảm bảo có header nếu sheet đã tồn tại nhưng thiếu
-                            if not ws['A1'].value or str(ws['A1'].value).strip().lower() != 'key':
-                                ws['A1'] = 'key'
-                                ws['B1'] = 'value'
-
                         # Lấy project URL để lưu (cho lần chạy tiếp theo vào đúng project)
                         project_url = getattr(drission_api, '_current_project_url', '')
                         if not project_url and project_id:
@@ -4410,28 +4362,10 @@ class BrowserFlowGenerator:
                             'chrome_profile_path': chrome_profile_path  # Profile để resume đúng Chrome
                         }
 
+                        # Qua change journal: không ghi đè thay đổi của worker khác
                         for key, value in config_items.items():
-                            # Tìm row có key này để update
-                            found = False
-                            for row_num in range(2, ws.max_row + 1):
-                                cell_key = ws.cell(row=row_num, column=1).value
-                                if cell_key and str(cell_key).strip().lower() == key.lower():
-                                    ws.cell(row=row_num, column=2, value=value)
-                                    found = True
-                                    break
-                            if not found:
-                                # Tìm row trống đầu tiên (sau header)
-                                next_row = 2
-                                for r in range(2, 50):
-                                    if not ws.cell(row=r, column=1).value:
-                                        next_row = r
-                                        break
-                                    next_row = r + 1
-                                ws.cell(row=next_row, column=1, value=key)
-                                ws.cell(row=next_row, column=2, value=value)
-
-                        wb.save(excel_path)
-                        wb.close()
+                            workbook.set_config_value(key, value)
+                        workbook.save()
                         self._log(f"[EXCEL] Saved project_id + token to Excel")
                     except Exception as e:
                         self._log(f"[EXCEL] Warning: Cannot save to Excel: {e}", "warn")
@@ -0,0 +1,218 @@
+"""
+VE3 Tool - Change Journal
+=========================
+Journal append-only ({code}_changes.jsonl) cho các thay đổi nhỏ trên workbook
+(status ảnh/video, media_id, video_path, config) mà nhiều worker cùng ghi.
+
+Excel worker, Chrome 1, Chrome 2 cùng sửa 1 file {code}_prompts.xlsx. Trước đây
+mỗi worker load cả file, sửa vài ô rồi ghi đè cả file -> ghi sau đè ghi trước.
+Với journal, worker chỉ append 1 dòng JSON cho mỗi thay đổi; 1 owner gộp
+journal vào Excel (PromptWorkbook.merge_changes).
+
+Format:
+    Dòng 1: header {"journal": "ve3-changes", "generation": "<hex>"}
+    Các dòng sau: {"ts", "worker", "sheet", "id", "fields"}
+
+Excel ghi lại vị trí đã gộp (generation:offset) trong sheet config, nên khi
+load chỉ cần áp dụng phần journal phía sau. Khi journal quá lớn, owner xoay
+nó sang {code}_changes.prev.jsonl và bắt đầu generation mới; bản .prev giữ
+lại để process đang giữ workbook cũ vẫn bắt kịp được. Mọi thao tác đều giữ
+lock file ({code}_changes.lock) để không đọc/ghi lúc journal đang bị xoay.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from modules.file_lock import lock_file, unlock_file
+from modules.utils import get_logger
+
+
+_HEADER_TAG = "ve3-changes"
+
+
+def _parse_generation(header_line: bytes) -> str:
+    """Generation trong dòng header, "" nếu không phải header của journal."""
+    try:
+        header = json.loads(header_line)
+        if header.get("journal") == _HEADER_TAG:
+            return header.get("generation", "")
+    except (ValueError, AttributeError):
+        pass
+    return ""
+
+
+def _project_stem(excel_path: Path) -> str:
+    stem = excel_path.stem
+    if stem.endswith("_prompts"):
+        stem = stem[:-len("_prompts")]
+    return stem
+
+
+def journal_path_for(excel_path: Union[str, Path]) -> Path:
+    """AR8-0003_prompts.xlsx -> AR8-0003_changes.jsonl (cùng thư mục)."""
+    excel_path = Path(excel_path)
+    return excel_path.with_name(f"{_project_stem(excel_path)}_changes.jsonl")
+
+
+class ChangeJournal:
+    """
+    Journal thay đổi của một project, dùng chung giữa các process.
+
+    Attributes:
+        path: Path đến file journal
+        lock_path: Path đến lock file
+        worker: Nhãn worker ghi vào mỗi record (debug)
+    """
+
+    def __init__(self, excel_path: Union[str, Path], worker: str = ""):
+        self.path = journal_path_for(excel_path)
+        self.previous_path = self.path.with_name(self.path.stem + ".prev.jsonl")
+        self.lock_path = self.path.with_suffix(".lock")
+        self.worker = worker or f"pid{os.getpid()}"
+        self.logger = get_logger("change_journal")
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+
+    # ========================================================================
+    # LOCK
+    # ========================================================================
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Lock liên process + liên thread (re-entrant trong cùng thread)."""
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a+") as fh:
+                lock_file(fh)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    unlock_file(fh)
+
+    # ========================================================================
+    # WRITE
+    # ========================================================================
+
+    def append(self, sheet: str, item_id: Any, fields: Dict[str, Any]) -> None:
+        """Ghi 1 thay đổi: set các field của dòng item_id trong sheet."""
+        record = {
+            "ts": time.time(),
+            "worker": self.worker,
+            "sheet": sheet,
+            "id": item_id,
+            "fields": fields,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock():
+            if not self.path.exists():
+                self._write_header()
+            with open(self.path, "ab") as f:
+                f.write(line.encode("utf-8"))
+
+    def rotate(self) -> str:
+        """
+        Chuyển journal hiện tại sang .prev (đã được gộp vào Excel), tạo generation mới.
+
+        Returns:
+            generation mới
+        """
+        with self.lock():
+            if self.path.exists():
+                os.replace(self.path, self.previous_path)
+            return self._write_header()
+
+    def _write_header(self) -> str:
+        generation = uuid.uuid4().hex
+        header = json.dumps({"journal": _HEADER_TAG, "generation": generation}) + "\n"
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(header.encode("utf-8"))
+        os.replace(tmp, self.path)
+        return generation
+
+    # ========================================================================
+    # READ
+    # ========================================================================
+
+    def read(self, offset: int = 0, previous: bool = False) -> Tuple[str, List[Dict[str, Any]], int]:
+        """
+        Đọc các record từ byte offset (0 = từ đầu) đến dòng hoàn chỉnh cuối cùng.
+
+        Args:
+            offset: Byte offset (end_offset của lần đọc trước)
+            previous: True = đọc bản .prev (generation trước khi xoay)
+
+        Returns:
+            (generation, records, end_offset) - generation "" nếu chưa có journal
+        """
+        with self.lock():
+            try:
+                f = open(self.previous_path if previous else self.path, "rb")
+            except FileNotFoundError:
+                return "", [], 0
+
+            with f:
+                header_line = f.readline()
+                generation = _parse_generation(header_line)
+
+                start = max(offset, len(header_line))
+                f.seek(start)
+                data = f.read()
+
+        # Dòng cuối chưa có "\n" -> đang ghi dở, để lần đọc sau
+        complete = data[:data.rfind(b"\n") + 1]
+        records = []
+        for raw in complete.splitlines():
+            if not raw.strip():
+                continue
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                self.logger.warning(f"Skip broken change record in {self.path.name}")
+        return generation, records, start + len(complete)
+
+    def position(self) -> Tuple[str, int]:
+        """
+        (generation, byte offset cuối file) của journal hiện tại, ("", 0) nếu
+        chưa có. Bằng vị trí đã gộp của file Excel = không còn thay đổi nào chưa gộp.
+        """
+        with self.lock():
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return "", 0
+            with f:
+                return _parse_generation(f.readline()), os.fstat(f.fileno()).st_size
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def stamp(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) của journal (đổi sau mỗi append/xoay), None nếu chưa có."""
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except OSError:
+            return 0
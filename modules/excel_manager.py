@@ -21,22 +21,36 @@ if sys.platform == "win32":
             pass
 
 
+import atexit
+import copy
 import json
+import stat as stat_module
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Set, Union, Callable, Iterable, NamedTuple, Tuple
 from datetime import datetime
 
 from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 
 from modules.utils import get_logger
+from modules.state_store import ProjectStateStore, scene_state_row, character_state_row
+from modules.change_journal import ChangeJournal
 
 
 # ============================================================================
 # CONSTANTS
 # ============================================================================
 
+# umask của process (đọc 1 lần lúc import: os.umask không đọc được mà không đổi)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 # Cột cho sheet Characters
 CHARACTERS_COLUMNS = [
     "id",               # ID nhân vật (nvc, nvp1, nvp2, ...)
@@ -109,6 +123,125 @@ BACKUP_LOCATIONS_COLUMNS = [
     "image_file",       # File ảnh tham chiếu (loc.png)
 ]
 
+# Map tên cột -> số thứ tự cột (1-based) để tránh list.index() mỗi lần update
+_CHARACTERS_COL_INDEX = {name: i for i, name in enumerate(CHARACTERS_COLUMNS, start=1)}
+_SCENES_COL_INDEX = {name: i for i, name in enumerate(SCENES_COLUMNS, start=1)}
+
+
+def _int_key(value: Any) -> Optional[int]:
+    """Chuẩn hóa ID dạng số (1, 1.0, "1") thành int, None nếu không hợp lệ."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _str_key(value: Any) -> Optional[str]:
+    """Chuẩn hóa ID dạng chuỗi (nvc, loc_01, step_1), None nếu rỗng."""
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+def _safe_int(val: Any, default: int = 0) -> int:
+    """Convert to int safely, handling time strings like '00:00'."""
+    if val is None or val == "":
+        return default
+    if isinstance(val, int):
+        return val
+    if isinstance(val, float):
+        return int(val)
+    if isinstance(val, str):
+        # Handle time format "HH:MM" or "MM:SS"
+        if ":" in val:
+            return default  # Skip time strings
+        try:
+            return int(val)
+        except ValueError:
+            return default
+    return default
+
+
+def _safe_float(val: Any, default: float = 0.0) -> float:
+    """Convert to float safely."""
+    if val is None or val == "":
+        return default
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return default
+
+
+# Đánh dấu ô không tồn tại trong row (khác None = ô trống) để from_row
+# dùng default giống from_dict khi key không có trong dict
+_MISSING = object()
+
+
+def _pad_row(row: Tuple[Any, ...], width: int) -> Tuple[Any, ...]:
+    """Cắt/bù row về đúng số cột (file cũ có thể thiếu cột cuối như segment_id)."""
+    if len(row) == width:
+        return row
+    if len(row) > width:
+        return tuple(row[:width])
+    return tuple(row) + (_MISSING,) * (width - len(row))
+
+
+def _copy_slots(obj: Any) -> Any:
+    """Shallow copy cho class dùng __slots__ (nhanh hơn copy.copy)."""
+    cls = type(obj)
+    new = cls.__new__(cls)
+    for name in cls.__slots__:
+        setattr(new, name, getattr(obj, name))
+    return new
+
+
+def _copy_sheet(source, target_workbook: Workbook) -> None:
+    """
+    Thay sheet cùng tên trong target_workbook bằng bản sao của source (giá trị,
+    style qua thuộc tính public, độ rộng cột, freeze panes), giữ vị trí sheet.
+    """
+    index = None
+    if source.title in target_workbook.sheetnames:
+        index = target_workbook.sheetnames.index(source.title)
+        target_workbook.remove(target_workbook[source.title])
+    ws = target_workbook.create_sheet(source.title, index)
+
+    for row in source.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            new_cell = ws.cell(row=cell.row, column=cell.column, value=cell.value)
+            if cell.has_style:
+                new_cell.font = copy.copy(cell.font)
+                new_cell.fill = copy.copy(cell.fill)
+                new_cell.border = copy.copy(cell.border)
+                new_cell.alignment = copy.copy(cell.alignment)
+                new_cell.number_format = cell.number_format
+                new_cell.protection = copy.copy(cell.protection)
+
+    for key, dimension in source.column_dimensions.items():
+        if dimension.width:
+            ws.column_dimensions[key].width = dimension.width
+    ws.freeze_panes = source.freeze_panes
+
+
+# Các workbook đang ở chế độ write-behind -> flush khi process thoát
+_WRITE_BEHIND_WORKBOOKS: "weakref.WeakSet[PromptWorkbook]" = weakref.WeakSet()
+
+
+def _flush_write_behind_workbooks() -> None:
+    """atexit: ghi nốt các thay đổi chưa flush."""
+    for workbook in list(_WRITE_BEHIND_WORKBOOKS):
+        try:
+            workbook.flush()
+        except Exception as e:
+            workbook.logger.warning(f"Flush on exit failed for {workbook.path}: {e}")
+
+
+atexit.register(_flush_write_behind_workbooks)
+
 
 # ============================================================================
 # CHARACTER DATA CLASS
@@ -117,6 +250,9 @@ BACKUP_LOCATIONS_COLUMNS = [
 class Character:
     """Đại diện cho một nhân vật trong truyện."""
 
+    # __slots__: không có __dict__ mỗi instance (project lớn giữ hàng nghìn object)
+    __slots__ = tuple(CHARACTERS_COLUMNS)
+
     def __init__(
         self,
         id: str,
@@ -172,6 +308,31 @@ class Character:
             media_id=str(data.get("media_id", "")),
         )
 
+    @classmethod
+    def from_row(cls, row: Tuple[Any, ...]) -> "Character":
+        """
+        Tạo Character trực tiếp từ row tuple của sheet characters
+        (thứ tự CHARACTERS_COLUMNS), không dựng dict trung gian.
+        Kết quả giống from_dict(dict(zip(CHARACTERS_COLUMNS, row))).
+        """
+        (id_, role, name, english_prompt, vietnamese_prompt, character_lock,
+         image_file, status, is_child, media_id) = _pad_row(row, len(CHARACTERS_COLUMNS))
+
+        obj = cls.__new__(cls)
+        obj.id = "" if id_ is _MISSING else str(id_)
+        obj.role = "supporting" if role is _MISSING else str(role)
+        obj.name = "" if name is _MISSING else str(name)
+        obj.english_prompt = "" if english_prompt is _MISSING else str(english_prompt)
+        obj.vietnamese_prompt = "" if vietnamese_prompt is _MISSING else str(vietnamese_prompt)
+        obj.character_lock = "" if character_lock is _MISSING else str(character_lock)
+        obj.image_file = "" if image_file is _MISSING else str(image_file)
+        obj.status = "pending" if status is _MISSING else str(status)
+        obj.is_child = False if is_child is _MISSING else bool(is_child)
+        obj.media_id = "" if media_id is _MISSING else str(media_id)
+        return obj
+
+    __copy__ = _copy_slots
+
 
 # ============================================================================
 # LOCATION DATA CLASS
@@ -180,6 +341,11 @@ class Character:
 class Location:
     """Dai dien cho mot dia diem trong truyen."""
 
+    __slots__ = (
+        "id", "name", "english_prompt", "location_lock",
+        "lighting_default", "image_file", "status", "media_id",
+    )
+
     def __init__(
         self,
         id: str,
@@ -227,6 +393,8 @@ class Location:
             media_id=str(data.get("media_id", "")),
         )
 
+    __copy__ = _copy_slots
+
 
 # ============================================================================
 # SCENE DATA CLASS
@@ -235,6 +403,10 @@ class Location:
 class Scene:
     """Đại diện cho một scene trong video."""
 
+    # __slots__: ~25 attribute/instance không còn nằm trong __dict__ riêng
+    # start_time/end_time (deprecated) là property alias, không chiếm slot
+    __slots__ = tuple(SCENES_COLUMNS)
+
     def __init__(
         self,
         scene_id: int,
@@ -283,9 +455,24 @@ class Scene:
         self.video_note = video_note  # Ghi chú video: "SKIP" hoặc ""
         self.segment_id = segment_id  # Segment ID (1, 2, 3...)
 
-        # DEPRECATED aliases (để code cũ không bị lỗi)
-        self.start_time = self.srt_start
-        self.end_time = self.srt_end
+    # DEPRECATED aliases (để code cũ không bị lỗi)
+    @property
+    def start_time(self) -> str:
+        return self.srt_start
+
+    @start_time.setter
+    def start_time(self, value: str) -> None:
+        self.srt_start = value
+
+    @property
+    def end_time(self) -> str:
+        return self.srt_end
+
+    @end_time.setter
+    def end_time(self, value: str) -> None:
+        self.srt_end = value
+
+    __copy__ = _copy_slots
     
     def to_dict(self) -> Dict[str, Any]:
         """Chuyển đổi thành dictionary."""
@@ -314,32 +501,8 @@ class Scene:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Scene":
         """Tao Scene tu dictionary."""
-        def safe_int(val, default=0):
-            """Convert to int safely, handling time strings like '00:00'."""
-            if val is None or val == "":
-                return default
-            if isinstance(val, int):
-                return val
-            if isinstance(val, float):
-                return int(val)
-            if isinstance(val, str):
-                # Handle time format "HH:MM" or "MM:SS"
-                if ":" in val:
-                    return default  # Skip time strings
-                try:
-                    return int(val)
-                except ValueError:
-                    return default
-            return default
-
-        def safe_float(val, default=0.0):
-            """Convert to float safely."""
-            if val is None or val == "":
-                return default
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return default
+        safe_int = _safe_int
+        safe_float = _safe_float
 
         return cls(
             scene_id=safe_int(data.get("scene_id", 0)),
@@ -366,6 +529,283 @@ class Scene:
             segment_id=safe_int(data.get("segment_id", 1)),  # Segment ID (default=1)
         )
 
+    @classmethod
+    def from_row(cls, row: Tuple[Any, ...]) -> "Scene":
+        """
+        Tạo Scene trực tiếp từ row tuple của sheet scenes (thứ tự SCENES_COLUMNS),
+        không dựng dict trung gian. Kết quả giống from_dict(dict(zip(SCENES_COLUMNS, row))).
+        """
+        (scene_id, srt_start, srt_end, duration, planned_duration, srt_text,
+         img_prompt, prompt_json, video_prompt, img_path, video_path,
+         status_img, status_vid, characters_used, location_used, reference_files,
+         media_id, video_note, segment_id) = _pad_row(row, len(SCENES_COLUMNS))
+
+        obj = cls.__new__(cls)
+        obj.scene_id = 0 if scene_id is _MISSING else _safe_int(scene_id)
+        obj.srt_start = "" if srt_start is _MISSING else str(srt_start or "")
+        obj.srt_end = "" if srt_end is _MISSING else str(srt_end or "")
+        obj.duration = 0.0 if duration is _MISSING else _safe_float(duration)
+        obj.planned_duration = 0.0 if planned_duration is _MISSING else _safe_float(planned_duration)
+        obj.srt_text = "" if srt_text is _MISSING else str(srt_text or "")
+        obj.img_prompt = "" if img_prompt is _MISSING else str(img_prompt or "")
+        obj.prompt_json = "" if prompt_json is _MISSING else str(prompt_json or "")
+        obj.video_prompt = "" if video_prompt is _MISSING else str(video_prompt or "")
+        obj.img_path = "" if img_path is _MISSING else str(img_path or "")
+        obj.video_path = "" if video_path is _MISSING else str(video_path or "")
+        obj.status_img = "pending" if status_img is _MISSING else str(status_img or "pending")
+        obj.status_vid = "pending" if status_vid is _MISSING else str(status_vid or "pending")
+        obj.characters_used = "" if characters_used is _MISSING else str(characters_used or "")
+        obj.location_used = "" if location_used is _MISSING else str(location_used or "")
+        obj.reference_files = "" if reference_files is _MISSING else str(reference_files or "")
+        obj.media_id = "" if media_id is _MISSING else str(media_id or "")
+        obj.video_note = "" if video_note is _MISSING else str(video_note or "")
+        obj.segment_id = 1 if segment_id is _MISSING else _safe_int(segment_id)
+        return obj
+
+
+# ============================================================================
+# READ-ONLY ROWS
+# ============================================================================
+
+class SheetRows(NamedTuple):
+    """Dữ liệu 1 sheet đọc ở chế độ read-only: header + các row (tuple giá trị)."""
+    headers: Tuple[Any, ...]
+    rows: List[Tuple[Any, ...]]
+
+
+def scenes_from_rows(rows: Iterable[Tuple[Any, ...]]) -> List[Scene]:
+    """Tạo Scene từ các row của sheet scenes (bỏ qua header và dòng trống)."""
+    return [Scene.from_row(row) for row in rows if row and row[0] is not None]
+
+
+def characters_from_rows(rows: Iterable[Tuple[Any, ...]]) -> List[Character]:
+    """Tạo Character từ các row của sheet characters (bỏ qua dòng trống)."""
+    return [Character.from_row(row) for row in rows if row and row[0] is not None]
+
+
+def director_plan_from_rows(rows: Iterable[Tuple[Any, ...]]) -> List[Dict]:
+    """Parse các row của sheet director_plan thành list plan dict."""
+    plans = []
+
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+
+        # Handle both old format and new format with segment_id
+        plans.append({
+            "plan_id": row[0],
+            "scene_id": row[0],  # Alias cho plan_id (step 5 dùng scene_id)
+            "segment_id": row[1] if len(row) > 1 else 1,  # NEW: segment_id column
+            "srt_start": row[2] if len(row) > 2 else "",
+            "srt_end": row[3] if len(row) > 3 else "",
+            "duration": row[4] if len(row) > 4 else 0,
+            "srt_text": row[5] if len(row) > 5 else "",
+            "characters_used": row[6] if len(row) > 6 else "[]",
+            "location_used": row[7] if len(row) > 7 else "",
+            "reference_files": row[8] if len(row) > 8 else "[]",
+            "img_prompt": row[9] if len(row) > 9 else "",
+            "status": row[10] if len(row) > 10 else "pending",
+        })
+
+    return plans
+
+
+def story_analysis_from_rows(rows: Iterable[Tuple[Any, ...]]) -> dict:
+    """Parse các row key/value của sheet story_analysis thành dict lồng nhau."""
+    data = {}
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+        key = row[0]
+        value = row[1] or ""
+
+        # Try to parse JSON for lists
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except:
+                pass
+
+        # Handle nested keys (e.g., "setting.era")
+        if "." in key:
+            parts = key.split(".")
+            current = data
+            for part in parts[:-1]:
+                if part not in current:
+                    current[part] = {}
+                current = current[part]
+            current[parts[-1]] = value
+        else:
+            data[key] = value
+
+    return data
+
+
+def story_segments_from_rows(rows: Iterable[Tuple[Any, ...]]) -> list:
+    """Parse các row của sheet story_segments thành list segment dict."""
+    segments = []
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+
+        seg = {
+            "segment_id": int(row[0]) if row[0] else 0,
+            "segment_name": row[1] or "",
+            "message": row[2] or "",
+            "key_elements": row[3] or "[]",
+            "image_count": int(row[4]) if row[4] else 1,
+            "estimated_duration": float(row[5]) if row[5] else 0,
+            "srt_range_start": int(row[6]) if row[6] else 0,
+            "srt_range_end": int(row[7]) if row[7] else 0,
+            "importance": row[8] or "medium",
+            "status": row[9] or "pending"
+        }
+
+        # Parse key_elements JSON
+        if isinstance(seg["key_elements"], str) and seg["key_elements"].startswith("["):
+            try:
+                seg["key_elements"] = json.loads(seg["key_elements"])
+            except:
+                pass
+
+        segments.append(seg)
+
+    return segments
+
+
+# step_id cũ (trước khi đánh số lại step_1..step_7) -> sheet cần migrate
+_LEGACY_STEP_IDS = ("step_1.5", "step_4.5")
+
+
+def step_status_from_rows(rows: Iterable[Tuple[Any, ...]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parse các row của sheet processing_status thành list step dict (theo thứ tự sheet).
+
+    Returns:
+        None nếu sheet còn step_id cũ -> cần _ensure_processing_status_sheet migrate trước
+    """
+    statuses = []
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        if row[0] in _LEGACY_STEP_IDS:
+            return None
+        if len(row) < 9:
+            row = tuple(row) + (None,) * (9 - len(row))
+        statuses.append({
+            "step_id": row[0],
+            "step_name": row[1],
+            "status": row[3],
+            "items_total": row[4] or 0,
+            "items_done": row[5] or 0,
+            "coverage_pct": row[6] or 0,
+            "notes": row[7] or "",
+            "last_updated": row[8] or "",
+        })
+    return statuses
+
+
+def srt_coverage_summary_from_rows(rows: Iterable[Tuple[Any, ...]]) -> Dict[str, Any]:
+    """Đếm các row của sheet srt_coverage theo status."""
+    total = 0
+    covered = 0
+    segment_only = 0
+    uncovered = 0
+
+    for row in rows:
+        if not row or row[0] is None:
+            continue
+
+        total += 1
+        status = row[7] if len(row) > 7 else None
+
+        if status == "COVERED":
+            covered += 1
+        elif status == "SEGMENT_OK":
+            segment_only += 1
+        else:
+            uncovered += 1
+
+    return {
+        "total_srt": total,
+        "fully_covered": covered,
+        "segment_only": segment_only,
+        "uncovered": uncovered,
+        "coverage_percent": round((covered / total * 100) if total > 0 else 0, 1)
+    }
+
+
+def config_from_rows(rows: Iterable[Tuple[Any, ...]]) -> Dict[str, str]:
+    """Parse các row của sheet config thành dict key (lower) -> value."""
+    config = {}
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        key = str(row[0]).strip().lower()
+        if key not in config:  # Key trùng -> giữ dòng đầu (giống get_config_value)
+            value = row[1] if len(row) > 1 else None
+            config[key] = str(value) if value else ""
+    return config
+
+
+# ============================================================================
+# PARSED WORKBOOK CACHE - dùng chung trong process
+# ============================================================================
+
+class ParsedWorkbookCache:
+    """
+    LRU cache kết quả đã parse (scenes, characters, director_plan...) theo file.
+
+    Key là path, entry chỉ hợp lệ khi (mtime_ns, size) của file còn khớp,
+    file thay đổi trên disk thì entry tự bị bỏ qua và ghi đè.
+    Giới hạn số file để GUI duyệt nhiều project không làm RAM tăng mãi.
+    """
+
+    def __init__(self, max_files: int = 16):
+        self.max_files = max_files
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path, stat: Tuple[int, int], kind: str) -> Optional[Any]:
+        """Lấy kết quả đã parse, None nếu chưa có hoặc file đã đổi."""
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stat or kind not in entry[1]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][kind]
+
+    def put(self, path: Path, stat: Tuple[int, int], kind: str, value: Any) -> None:
+        """Lưu kết quả parse cho phiên bản file (stat) hiện tại."""
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stat:
+                entry = (stat, {})
+                self._entries[key] = entry
+            entry[1][kind] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: Path) -> None:
+        """Bỏ cache của một file."""
+        with self._lock:
+            self._entries.pop(str(path), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache dùng chung cho mọi PromptWorkbook trong process
+parsed_workbook_cache = ParsedWorkbookCache()
+
 
 # ============================================================================
 # PROMPT WORKBOOK CLASS
@@ -393,6 +833,23 @@ class PromptWorkbook:
     BACKUP_LOCATIONS_SHEET = "backup_locations"
     SRT_COVERAGE_SHEET = "srt_coverage"  # Đối chiếu SRT entries với segments/scenes
     PROCESSING_STATUS_SHEET = "processing_status"  # Trạng thái xử lý từng step
+    CONFIG_SHEET = "config"  # key/value (flow_project_url, ...)
+
+    # Màu ô status của sheet srt_coverage
+    SRT_COVERAGE_COLORS = {
+        "UNCOVERED": "FFCDD2",   # Đỏ nhạt
+        "SEGMENT_OK": "FFF9C4",  # Vàng
+        "COVERED": "C8E6C9",     # Xanh lá
+    }
+
+    # Các sheet có ID ở cột đầu tiên -> hàm chuẩn hóa key (dùng cho row index)
+    ID_KEYED_SHEETS = {
+        SCENES_SHEET: _int_key,
+        CHARACTERS_SHEET: _str_key,
+        LOCATIONS_SHEET: _str_key,
+        DIRECTOR_PLAN_SHEET: _int_key,
+        PROCESSING_STATUS_SHEET: _str_key,
+    }
 
     # Step definitions for tracking (7 steps)
     STEPS = [
@@ -405,30 +862,137 @@ class PromptWorkbook:
         ("step_7", "Scene Prompts", "Tạo prompts cho từng scene"),
     ]
 
-    def __init__(self, path: Union[str, Path]):
+    # Chế độ write-behind: ghi file tối đa 1 lần mỗi N giây
+    DEFAULT_FLUSH_INTERVAL = 5.0
+
+    # Key trong sheet config: vị trí journal ("generation:offset") đã gộp vào file
+    JOURNAL_POSITION_KEY = "change_journal_position"
+    # Journal lớn hơn ngưỡng này (byte) thì owner xoay sang .prev sau khi gộp
+    JOURNAL_ROTATE_BYTES = 1024 * 1024
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        write_behind: bool = False,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        state_sidecar: bool = True,
+        change_journal: bool = False,
+        journal_owner: bool = False
+    ):
         """
         Khởi tạo PromptWorkbook.
 
         Args:
             path: Path đến file Excel (có thể là str hoặc Path)
+            write_behind: True = save() chỉ đánh dấu dirty, file được ghi
+                tối đa mỗi flush_interval giây, khi kết thúc step, khi
+                close() hoặc khi process thoát
+            flush_interval: Khoảng cách tối thiểu giữa 2 lần ghi file (giây)
+            state_sidecar: True = sau mỗi lần ghi Excel cập nhật luôn
+                {code}_state.sqlite để reader chỉ cần status không phải mở xlsx
+            change_journal: True = update_scene/update_character/set_config_value
+                chỉ append vào {code}_changes.jsonl, save() không ghi đè file
+                Excel (dùng cho các worker chạy song song trên cùng project)
+            journal_owner: True = process này gộp journal vào Excel (mỗi
+                flush_interval giây khi save(), khi flush()/close()/thoát)
         """
         # Chuyển str thành Path để đảm bảo tương thích
         self.path = Path(path) if isinstance(path, str) else path
-        self.workbook: Optional[Workbook] = None
+        self._workbook: Optional[Workbook] = None
+        # load_or_create() chỉ đánh dấu, file được parse full khi thật sự cần
+        self._load_pending = False
+        # (mtime_ns, size) của file lúc workbook trong bộ nhớ khớp với disk
+        self._synced_stat: Optional[Tuple[int, int]] = None
         self.logger = get_logger("excel_manager")
+        # Row index: sheet_name -> {id: row}, build 1 lần mỗi lần load
+        self._row_index: Dict[str, Dict[Any, int]] = {}
+        # Snapshot processing_status (step_id -> dict) và config, build 1 lần mỗi lần load
+        self._step_status: Optional[Dict[str, Dict[str, Any]]] = None
+        self._config: Optional[Dict[str, str]] = None
+
+        # Write-behind state
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._dirty = False
+        # Các sheet đã sửa trực tiếp (không qua journal) từ lần ghi trước, None = không rõ (cả workbook)
+        self._dirty_sheets: Optional[Set[str]] = set()
+        self._last_flush = 0.0
+        self._save_lock = threading.RLock()
+        if write_behind:
+            _WRITE_BEHIND_WORKBOOKS.add(self)
+
+        self.state_sidecar = state_sidecar
+
+        # Change journal: luôn đọc (nếu có file), chỉ ghi khi change_journal=True
+        self._journal = ChangeJournal(self.path)
+        self.change_journal = change_journal
+        self.journal_owner = journal_owner
+        # Vị trí journal (generation, byte offset) mà workbook trong bộ nhớ đã áp dụng tới
+        self._journal_generation = ""
+        self._journal_offset = 0
+        # Số thay đổi từ journal có trong bộ nhớ nhưng chưa ghi vào file Excel
+        self._journal_pending = 0
+        if change_journal:
+            _WRITE_BEHIND_WORKBOOKS.add(self)
     
+    @property
+    def workbook(self) -> Optional[Workbook]:
+        """openpyxl Workbook (parse full file ở lần truy cập đầu tiên)."""
+        if self._load_pending:
+            self._load_pending = False
+            if self._journal.exists():
+                # Load + đọc journal trong cùng lock: không lọt lần gộp nào ở giữa
+                with self._journal.lock():
+                    self._load_from_disk()
+            else:
+                self._load_from_disk()
+        return self._workbook
+
+    @workbook.setter
+    def workbook(self, value: Optional[Workbook]) -> None:
+        self._load_pending = False
+        self._workbook = value
+        self._step_status = None
+        self._config = None
+
     def load_or_create(self) -> "PromptWorkbook":
         """
         Load file Excel nếu tồn tại, hoặc tạo mới nếu chưa có.
         Tự động xóa và tạo mới nếu file bị corrupted.
 
+        File có sẵn chỉ được parse full khi cần (truy cập self.workbook);
+        get_scenes/get_characters/... đọc qua parsed_workbook_cache nếu được.
+
         Returns:
             self để hỗ trợ method chaining
         """
+        self._row_index = {}
+        self._step_status = None
+        self._config = None
+        if self.path.exists():
+            self._workbook = None
+            self._load_pending = True
+        else:
+            self.logger.info(f"Creating new Excel file: {self.path}")
+            self._create_new_workbook()
+
+        return self
+
+    def _load_from_disk(self) -> None:
+        """Parse full file Excel (edit mode)."""
+        self._row_index = {}
         if self.path.exists():
             try:
                 self.logger.info(f"Loading existing Excel file: {self.path}")
+                stat = self._file_stat()
                 self.workbook = load_workbook(self.path)
+                self._dirty = False
+                self._dirty_sheets = set()
+                self._synced_stat = stat
+                self._journal_pending = 0
+                self._load_journal_position()
+                if self._journal.exists():
+                    self._catch_up_journal()
             except Exception as e:
                 # File bị corrupted (BadZipFile, etc.) → xóa và tạo mới
                 self.logger.warning(f"Excel file corrupted: {e}")
@@ -442,8 +1006,6 @@ class PromptWorkbook:
             self.logger.info(f"Creating new Excel file: {self.path}")
             self._create_new_workbook()
 
-        return self
-
     def _ensure_workbook(self) -> None:
         """Đảm bảo workbook đã được load."""
         if self.workbook is None:
@@ -452,6 +1014,7 @@ class PromptWorkbook:
     def _create_new_workbook(self) -> None:
         """Tạo workbook mới với cấu trúc chuẩn."""
         self.workbook = Workbook()
+        self._row_index = {}
         
         # Xóa sheet mặc định
         default_sheet = self.workbook.active
@@ -475,6 +1038,7 @@ class PromptWorkbook:
     def _create_characters_sheet(self) -> None:
         """Tạo sheet Characters với header."""
         ws = self.workbook.create_sheet(self.CHARACTERS_SHEET)
+        self.mark_dirty(self.CHARACTERS_SHEET)
         
         # Header style
         header_font = Font(bold=True, color="FFFFFF")
@@ -505,6 +1069,7 @@ class PromptWorkbook:
     def _create_scenes_sheet(self) -> None:
         """Tạo sheet Scenes với header."""
         ws = self.workbook.create_sheet(self.SCENES_SHEET)
+        self.mark_dirty(self.SCENES_SHEET)
         
         # Header style
         header_font = Font(bold=True, color="FFFFFF")
@@ -538,6 +1103,7 @@ class PromptWorkbook:
     def _create_director_plan_sheet(self) -> None:
         """Tạo sheet Director Plan với header."""
         ws = self.workbook.create_sheet(self.DIRECTOR_PLAN_SHEET)
+        self.mark_dirty(self.DIRECTOR_PLAN_SHEET)
 
         # Header style - màu cam để phân biệt
         header_font = Font(bold=True, color="FFFFFF")
@@ -569,15 +1135,653 @@ class PromptWorkbook:
             ws.column_dimensions[get_column_letter(col)].width = column_widths.get(column_name, 15)
 
     def save(self) -> None:
-        """Lưu workbook ra file."""
+        """
+        Lưu workbook ra file.
+
+        Ở chế độ write-behind chỉ đánh dấu dirty, file chỉ được ghi nếu lần
+        flush trước đã cách đây >= flush_interval giây.
+        """
         if self.workbook is None:
             raise RuntimeError("Workbook chưa được load hoặc tạo")
-        
+
+        with self._save_lock:
+            if self.change_journal:
+                # Thay đổi đã nằm trong journal, chỉ owner gộp vào file (có giới hạn tần suất).
+                # Sửa ô trực tiếp (update_step_status, save_director_plan...) đã mark_dirty
+                # -> ghi full (trên bản mới nhất của file, xem _write_file)
+                if (self._dirty or self.journal_owner) and \
+                        time.monotonic() - self._last_flush >= self.flush_interval:
+                    self.merge_changes()
+                return
+
+            self._dirty = True
+            if self.write_behind and time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            self._write_file()
+
+    def flush(self) -> None:
+        """Ghi file ngay nếu có thay đổi chưa được lưu."""
+        with self._save_lock:
+            if self.change_journal:
+                if self._dirty or self.journal_owner:
+                    self.merge_changes()
+                return
+            if self._dirty and self._workbook is not None:
+                self._write_file()
+
+    def close(self) -> None:
+        """Flush thay đổi còn lại và ngừng theo dõi write-behind."""
+        self.flush()
+        _WRITE_BEHIND_WORKBOOKS.discard(self)
+
+    def mark_dirty(self, sheet_name: Optional[str] = None) -> None:
+        """
+        Đánh dấu có thay đổi chưa lưu (sẽ được ghi ở lần flush tiếp theo).
+        Code bên ngoài sửa trực tiếp self.workbook phải gọi hàm này.
+
+        Args:
+            sheet_name: Sheet vừa sửa. Khi file Excel đã bị process khác ghi lại,
+                chỉ các sheet này được chép từ bộ nhớ sang bản mới load từ disk;
+                None = không rõ -> chép cả workbook
+        """
+        self._dirty = True
+        if sheet_name is None:
+            self._dirty_sheets = None
+        elif self._dirty_sheets is not None:
+            self._dirty_sheets.add(sheet_name)
+
+    # ========================================================================
+    # CHANGE JOURNAL - thay đổi nhỏ dùng chung giữa các worker
+    # ========================================================================
+
+    def _record_change(self, sheet_name: str, item_id: Any, fields: Dict[str, Any]) -> None:
+        """Thay đổi đã áp dụng trong bộ nhớ -> ghi journal hoặc đánh dấu dirty."""
+        if not fields:
+            return
+        if self.change_journal:
+            self._journal.append(sheet_name, item_id, fields)
+            self._journal_pending += 1
+        else:
+            self.mark_dirty(sheet_name)
+
+    def _apply_changes(self, records: List[Dict[str, Any]]) -> None:
+        """Áp dụng các record journal vào workbook trong bộ nhớ (theo thứ tự ghi)."""
+        col_indexes = {
+            self.SCENES_SHEET: _SCENES_COL_INDEX,
+            self.CHARACTERS_SHEET: _CHARACTERS_COL_INDEX,
+        }
+        for record in records:
+            sheet_name = record.get("sheet")
+            item_id = record.get("id")
+            fields = record.get("fields") or {}
+
+            if sheet_name == self.CONFIG_SHEET:
+                self._set_config_cell(str(item_id), fields.get("value"))
+            elif sheet_name in col_indexes and sheet_name in self._workbook.sheetnames:
+                row_idx = self._find_row(sheet_name, item_id)
+                if row_idx is None:
+                    continue  # Dòng chưa có trong file này (vd: scene bị xóa)
+                ws = self._workbook[sheet_name]
+                for key, value in fields.items():
+                    col_idx = col_indexes[sheet_name].get(key)
+                    if col_idx:
+                        ws.cell(row=row_idx, column=col_idx, value=value)
+            else:
+                continue
+            self._journal_pending += 1
+
+    def _load_journal_position(self) -> None:
+        """Đọc vị trí journal đã gộp vào file Excel vừa load (sheet config)."""
+        # Đọc thẳng sheet (không qua _get_parsed: nó sẽ bắt kịp journal từ vị trí chưa biết)
+        config = {}
+        if self.CONFIG_SHEET in self._workbook.sheetnames:
+            config = config_from_rows(
+                self._workbook[self.CONFIG_SHEET].iter_rows(min_row=2, max_col=2, values_only=True)
+            )
+        self._config = config
+        generation, _, offset = config.get(self.JOURNAL_POSITION_KEY, "").partition(":")
+        self._journal_generation = generation
+        self._journal_offset = int(offset) if offset.isdigit() else 0
+
+    def _catch_up_journal(self) -> None:
+        """
+        Áp dụng các record journal sau vị trí hiện tại vào workbook trong bộ nhớ.
+        Journal đã bị xoay thì đọc nốt phần còn lại của bản .prev trước.
+        """
+        with self._journal.lock():
+            generation, records, end = self._journal_records_since(self._journal_generation, self._journal_offset)
+            self._apply_changes(records)
+            self._journal_generation = generation
+            self._journal_offset = end
+
+    def _journal_records_since(self, generation: str, offset: int) -> Tuple[str, List[Dict[str, Any]], int]:
+        """
+        Các record journal sau vị trí (generation, offset), theo thứ tự ghi.
+        Journal đã bị xoay thì gồm cả phần còn lại của bản .prev.
+
+        Returns:
+            (generation, records, end_offset) của journal hiện tại
+        """
+        with self._journal.lock():
+            current, records, end = self._journal.read(offset)
+            if current == generation:
+                return current, records, end
+
+            prev_generation, prev_records, _ = self._journal.read(offset, previous=True)
+            if prev_generation != generation:
+                # Cũ hơn cả bản .prev -> áp dụng toàn bộ (record chỉ set giá trị, áp lại không sao)
+                self.logger.debug(f"Journal position {generation!r} not found, replaying all")
+                prev_generation, prev_records, _ = self._journal.read(0, previous=True)
+            current, records, end = self._journal.read(0)
+            return current, prev_records + records, end
+
+    def _patch_rows(self, sheet_name: str, rows: List[Tuple[Any, ...]],
+                    records: List[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        """
+        Áp dụng record journal của sheet lên các dòng đọc read-only (không load
+        full workbook) - cùng kết quả như _apply_changes trên workbook.
+        """
+        records = [r for r in records if r.get("sheet") == sheet_name]
+        if not records:
+            return rows
+        rows = list(rows)
+
+        if sheet_name == self.CONFIG_SHEET:
+            for record in records:
+                key = str(record.get("id"))
+                value = (record.get("fields") or {}).get("value")
+                for i, row in enumerate(rows):
+                    if row and row[0] and str(row[0]).strip().lower() == key.lower():
+                        rows[i] = (row[0], value) + tuple(row[2:])
+                        break
+                else:
+                    rows.append((key, value))
+            return rows
+
+        col_index = {
+            self.SCENES_SHEET: _SCENES_COL_INDEX,
+            self.CHARACTERS_SHEET: _CHARACTERS_COL_INDEX,
+        }.get(sheet_name)
+        if col_index is None:
+            return rows
+
+        key_func = self.ID_KEYED_SHEETS[sheet_name]
+        index: Dict[Any, int] = {}
+        for i, row in enumerate(rows):
+            key = key_func(row[0]) if row else None
+            if key is not None and key not in index:
+                index[key] = i
+
+        for record in records:
+            i = index.get(key_func(record.get("id")))
+            if i is None:
+                continue  # Dòng chưa có trong file này (vd: scene bị xóa)
+            row = list(rows[i])
+            for field, value in (record.get("fields") or {}).items():
+                col_idx = col_index.get(field)
+                if not col_idx:
+                    continue
+                if col_idx > len(row):
+                    row.extend([None] * (col_idx - len(row)))
+                row[col_idx - 1] = value
+            rows[i] = tuple(row)
+        return rows
+
+    def _get_parsed_journaled(
+        self,
+        kind: str,
+        sheet_name: str,
+        parse_rows: Callable[[Iterable[Tuple[Any, ...]]], Any],
+        ensure_sheet: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """
+        Workbook chưa parse full + project có journal: đọc sheet read-only rồi
+        áp dụng các record journal sau vị trí đã gộp của file lên các dòng.
+        Cache theo stat của file Excel, mỗi kind giữ 1 kết quả kèm stamp của journal.
+
+        Returns:
+            Kết quả parse, hoặc _MISSING nếu phải load full (file lỗi, cần tạo sheet)
+        """
+        stat = self._file_stat()
+        journal_stamp = self._journal.stamp()
+        if stat is None or journal_stamp is None:
+            return _MISSING
+        # 1 entry cho mỗi kind, kèm stamp của journal: journal đổi -> entry bị thay
+        # (không thêm kind mới mỗi lần append, cache giữ được giới hạn bộ nhớ)
+        cache_kind = f"{kind}@journal"
+        cached = parsed_workbook_cache.get(self.path, stat, cache_kind)
+        if cached is not None and cached[0] == journal_stamp:
+            return cached[1]
+
+        try:
+            sheets = self.open_readonly(self.path, [sheet_name, self.CONFIG_SHEET])
+        except Exception as e:
+            self.logger.debug(f"Read-only parse failed, loading full workbook: {e}")
+            return _MISSING
+        if sheet_name not in sheets and ensure_sheet is not None:
+            return _MISSING
+
+        config = config_from_rows(sheets[self.CONFIG_SHEET].rows) if self.CONFIG_SHEET in sheets else {}
+        generation, _, offset = config.get(self.JOURNAL_POSITION_KEY, "").partition(":")
+        _, records, _ = self._journal_records_since(generation, int(offset) if offset.isdigit() else 0)
+
+        rows = sheets[sheet_name].rows if sheet_name in sheets else []
+        value = parse_rows(self._patch_rows(sheet_name, rows, records))
+        if self._file_stat() == stat:
+            # File không bị ghi lại trong lúc đọc -> cache được
+            parsed_workbook_cache.put(self.path, stat, cache_kind, (journal_stamp, value))
+        return value
+
+    def refresh(self) -> None:
+        """
+        Đồng bộ workbook trong bộ nhớ với file Excel + journal.
+        File Excel đã bị ghi bởi process khác và mình chưa sửa gì -> load lại.
+        """
+        if self._workbook is None and not self._load_pending:
+            self.load_or_create()
+        if not self._journal.exists():
+            return
+
+        with self._journal.lock():
+            if self._workbook is not None and not self._dirty and self._file_stat() != self._synced_stat:
+                self._load_pending = True
+            if self.workbook is not None:
+                self._catch_up_journal()
+
+    def merge_changes(self) -> int:
+        """
+        Owner: gộp journal (của mọi worker) vào file Excel.
+
+        Giữ lock trong lúc gộp nên tại mỗi thời điểm chỉ 1 process ghi file.
+
+        Returns:
+            Số thay đổi đã gộp (0 = file Excel đã mới nhất, không ghi)
+        """
+        with self._save_lock, self._journal.lock():
+            self.refresh()
+            if self._workbook is None:
+                return 0
+
+            merged = self._journal_pending
+            if merged or self._dirty:
+                self._write_file()
+            self._last_flush = time.monotonic()
+
+            if self._journal.size() > self.JOURNAL_ROTATE_BYTES:
+                self._journal.rotate()
+                self._catch_up_journal()
+                self._set_config_cell(self.JOURNAL_POSITION_KEY, f"{self._journal_generation}:{self._journal_offset}")
+                self._write_workbook_file()
+
+            if merged:
+                self.logger.info(f"Merged {merged} journal changes into {self.path.name}")
+            return merged
+
+    @staticmethod
+    def merge_change_journal(path: Union[str, Path]) -> int:
+        """
+        Gộp journal của project vào file Excel (gọi bởi owner, vd: trước khi
+        copy project sang VISUAL).
+
+        Returns:
+            Số thay đổi đã gộp
+        """
+        path = Path(path)
+        if not path.exists() or not ChangeJournal(path).exists():
+            return 0
+        workbook = PromptWorkbook(path, change_journal=True, journal_owner=True).load_or_create()
+        try:
+            return workbook.merge_changes()
+        finally:
+            _WRITE_BEHIND_WORKBOOKS.discard(workbook)
+
+    # ========================================================================
+    # PARSED CACHE - tránh parse lại cùng một file nhiều lần
+    # ========================================================================
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) của file Excel, None nếu không đọc được."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _cacheable_stat(self) -> Optional[Tuple[int, int]]:
+        """
+        Stat của file nếu dữ liệu trong bộ nhớ đúng bằng dữ liệu trên disk
+        (chưa parse full, hoặc đã parse nhưng chưa sửa gì và file chưa đổi).
+        """
+        stat = self._file_stat()
+        if stat is None or self._journal_pending:
+            return None
+        if self._load_pending:
+            return stat
+        if self._workbook is not None and not self._dirty and stat == self._synced_stat:
+            return stat
+        return None
+
+    def _get_parsed(
+        self,
+        kind: str,
+        sheet_name: str,
+        parse_rows: Callable[[Iterable[Tuple[Any, ...]]], Any],
+        ensure_sheet: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """
+        Đọc + parse một sheet, qua parsed_workbook_cache nếu được.
+
+        Khi workbook chưa parse full thì chỉ đọc đúng sheet cần (read-only).
+        Kết quả trả về là object dùng chung trong cache -> caller phải copy.
+        """
+        if self._workbook is None and not self._load_pending:
+            self.load_or_create()
+        if self._journal.exists():
+            # Có thay đổi của worker khác trong journal. Chỉ đọc (không có gì chưa lưu)
+            # -> đọc read-only + áp dụng journal lên các dòng, không load full workbook
+            stat = self._file_stat()
+            if self._workbook is not None and not self._dirty and stat is not None and stat != self._synced_stat:
+                self.load_or_create()  # File đã được process khác ghi lại, bỏ bản trong bộ nhớ
+            if self._load_pending:
+                value = self._get_parsed_journaled(kind, sheet_name, parse_rows, ensure_sheet)
+                if value is not _MISSING:
+                    return value
+            self.refresh()
+
+        stat = self._cacheable_stat()
+        if stat is not None:
+            cached = parsed_workbook_cache.get(self.path, stat, kind)
+            if cached is not None:
+                return cached
+
+        value = None
+        if self._load_pending:
+            try:
+                sheets = self.open_readonly(self.path, [sheet_name])
+                if sheet_name in sheets:
+                    value = parse_rows(sheets[sheet_name].rows)
+                elif ensure_sheet is None:
+                    value = parse_rows(())  # Sheet không có và không cần tạo -> rỗng
+            except Exception as e:
+                # File lỗi -> để đường load full xử lý (xóa + tạo mới)
+                self.logger.debug(f"Read-only parse failed, loading full workbook: {e}")
+
+        if value is None:
+            if ensure_sheet is not None:
+                ensure_sheet()
+            if sheet_name in self.workbook.sheetnames:
+                ws = self.workbook[sheet_name]
+                value = parse_rows(ws.iter_rows(min_row=2, values_only=True))
+            else:
+                value = parse_rows(())
+            stat = self._cacheable_stat()
+
+        if stat is not None:
+            parsed_workbook_cache.put(self.path, stat, kind, value)
+        return value
+
+    def _write_file(self) -> None:
+        """
+        Ghi workbook qua file tạm rồi rename (atomic).
+        Process bị kill giữa chừng không để lại file Excel bị cắt cụt.
+
+        Nếu project có change journal: giữ lock, áp dụng các thay đổi mới của
+        worker khác trước khi ghi, để không ghi đè mất chúng. File Excel đã bị
+        process khác ghi lại từ lần load/ghi trước -> ghi trên bản mới load từ
+        disk (chỉ chép sang các sheet mình sửa trực tiếp), không ghi đè bằng
+        bản cũ trong bộ nhớ.
+        """
+        if self._journal.exists():
+            with self._journal.lock():
+                if self._file_stat() not in (None, self._synced_stat):
+                    self._rebase_on_disk()
+                self._catch_up_journal()
+                self._set_config_cell(self.JOURNAL_POSITION_KEY, f"{self._journal_generation}:{self._journal_offset}")
+                self._write_workbook_file()
+        else:
+            self._write_workbook_file()
+
+    def _rebase_on_disk(self) -> None:
+        """
+        Load lại file Excel từ disk rồi chép sang các sheet đã sửa trực tiếp
+        trong bộ nhớ. Thay đổi qua journal không cần chép: _catch_up_journal
+        áp dụng lại từ vị trí đã gộp của file mới load.
+        """
+        local = self._workbook
+        dirty = set(local.sheetnames) if self._dirty_sheets is None else self._dirty_sheets
+        stat = self._file_stat()
+        self.logger.info(f"{self.path.name} changed on disk, rebasing {sorted(dirty) or 'no'} local sheets")
+
+        self.workbook = load_workbook(self.path)
+        self._synced_stat = stat
+        self._journal_pending = 0
+        self._load_journal_position()
+        for sheet_name in local.sheetnames:
+            if sheet_name in dirty:
+                _copy_sheet(local[sheet_name], self._workbook)
+        self._row_index = {}
+        self._step_status = None
+        self._config = None
+
+    def _file_mode(self) -> int:
+        """Quyền cho file Excel ghi lại: như file hiện tại, chưa có thì 0666 & ~umask."""
+        try:
+            return stat_module.S_IMODE(os.stat(self.path).st_mode)
+        except OSError:
+            return 0o666 & ~_UMASK
+
+    def _write_workbook_file(self) -> None:
+        """Ghi file Excel (atomic) + sidecar."""
         # Đảm bảo thư mục tồn tại
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        
-        self.workbook.save(self.path)
+
+        fd, tmp_name = tempfile.mkstemp(
+            prefix=f".{self.path.stem}.", suffix=".tmp", dir=str(self.path.parent)
+        )
+        os.close(fd)
+        try:
+            self.workbook.save(tmp_name)
+            # mkstemp tạo file 0600 -> giữ quyền của file cũ (file mới: theo umask)
+            # để account/service khác vẫn đọc được thư mục PROJECTS dùng chung
+            os.chmod(tmp_name, self._file_mode())
+            os.replace(tmp_name, self.path)
+            # Stat ngay sau rename: sidecar/cache phải khớp đúng file vừa ghi
+            stat = os.stat(self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+
+        self._dirty = False
+        self._dirty_sheets = set()
+        self._journal_pending = 0
+        self._last_flush = time.monotonic()
+        self._synced_stat = (stat.st_mtime_ns, stat.st_size)
         self.logger.debug(f"Saved Excel file: {self.path}")
+
+        if self.state_sidecar:
+            self._write_state(stat)
+
+    # ========================================================================
+    # READ-ONLY - Đọc nhanh cho các chỗ chỉ cần đọc, không sửa
+    # ========================================================================
+
+    @staticmethod
+    def open_readonly(
+        path: Union[str, Path],
+        sheets: Optional[Union[Iterable[str], Callable[[str], bool]]] = None
+    ) -> Dict[str, SheetRows]:
+        """
+        Đọc workbook ở chế độ read-only (streaming), chỉ parse các sheet cần.
+
+        Args:
+            path: Path đến file Excel
+            sheets: Danh sách tên sheet, hoặc hàm nhận tên sheet trả về True/False.
+                None = tất cả sheets.
+
+        Returns:
+            Dict tên sheet -> SheetRows (giữ thứ tự sheet trong file).
+            Row được pad None cho đủ số cột header.
+        """
+        if sheets is None:
+            wanted = lambda name: True
+        elif callable(sheets):
+            wanted = sheets
+        else:
+            sheet_set = set(sheets)
+            wanted = lambda name: name in sheet_set
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            result: Dict[str, SheetRows] = {}
+            for name in wb.sheetnames:
+                if not wanted(name):
+                    continue
+
+                row_iter = wb[name].iter_rows(values_only=True)
+                headers = tuple(next(row_iter, ()) or ())
+                width = len(headers)
+                rows = []
+                for row in row_iter:
+                    if len(row) < width:
+                        row = row + (None,) * (width - len(row))
+                    rows.append(row)
+                result[name] = SheetRows(headers, rows)
+            return result
+        finally:
+            wb.close()
+
+    # ========================================================================
+    # STATE SIDECAR - {code}_state.sqlite cho các reader chỉ cần status
+    # ========================================================================
+
+    @staticmethod
+    def read_state(path: Union[str, Path]) -> Optional[ProjectStateStore]:
+        """
+        Mở sidecar state của file Excel (không parse xlsx).
+
+        Returns:
+            ProjectStateStore nếu sidecar khớp với file Excel hiện tại,
+            None nếu chưa có hoặc đã cũ -> caller tự đọc Excel
+        """
+        store = ProjectStateStore(path)
+        return store if store.is_fresh() else None
+
+    def _write_state(self, excel_stat: os.stat_result) -> None:
+        """
+        Ghi snapshot trạng thái ra sidecar, từ đúng các dòng vừa ghi vào file
+        Excel (không qua get_scenes/get_characters: chúng có thể đọc lại
+        file/journal đã đổi sau lần ghi này).
+
+        Args:
+            excel_stat: os.stat của file Excel lấy ngay sau khi rename
+        """
+        try:
+            sheetnames = self.workbook.sheetnames
+
+            def sheet_rows(sheet_name: str) -> Iterable[Tuple[Any, ...]]:
+                if sheet_name not in sheetnames:
+                    return ()
+                return self.workbook[sheet_name].iter_rows(min_row=2, values_only=True)
+
+            segments = []
+            if self.STORY_SEGMENTS_SHEET in sheetnames:
+                segments = story_segments_from_rows(sheet_rows(self.STORY_SEGMENTS_SHEET))
+
+            steps = []
+            if self.PROCESSING_STATUS_SHEET in sheetnames:
+                ws = self.workbook[self.PROCESSING_STATUS_SHEET]
+                for row in ws.iter_rows(min_row=2, max_col=9, values_only=True):
+                    if not row[0]:
+                        continue
+                    steps.append({
+                        "step_id": row[0],
+                        "step_name": row[1],
+                        "status": row[3],
+                        "items_total": row[4] or 0,
+                        "items_done": row[5] or 0,
+                        "coverage_pct": row[6] or 0,
+                        "notes": row[7] or "",
+                        "last_updated": row[8] or "",
+                    })
+
+            config = {}
+            if "config" in sheetnames:
+                for row in self.workbook["config"].iter_rows(min_row=2, max_col=2, values_only=True):
+                    if row[0]:
+                        config[str(row[0]).strip().lower()] = str(row[1]) if row[1] else ""
+
+            ProjectStateStore(self.path).write_snapshot(
+                scenes=[scene_state_row(s) for s in scenes_from_rows(sheet_rows(self.SCENES_SHEET))],
+                characters=[character_state_row(c) for c in characters_from_rows(sheet_rows(self.CHARACTERS_SHEET))],
+                segments=segments,
+                steps=steps,
+                config=config,
+                excel_stat=excel_stat,
+                journal_position=(self._journal_generation, self._journal_offset),
+            )
+        except Exception as e:
+            # Sidecar chỉ là cache, lỗi không được làm hỏng việc lưu Excel
+            self.logger.warning(f"Cannot update state sidecar for {self.path}: {e}")
+
+    # ========================================================================
+    # ROW INDEX - Tra cứu dòng theo ID thay vì quét cả sheet
+    # ========================================================================
+
+    def _build_row_index(self, sheet_name: str) -> Dict[Any, int]:
+        """Quét sheet một lần, tạo map ID -> số dòng (giữ dòng đầu tiên nếu trùng)."""
+        key_func = self.ID_KEYED_SHEETS[sheet_name]
+        index: Dict[Any, int] = {}
+
+        if sheet_name in self.workbook.sheetnames:
+            ws = self.workbook[sheet_name]
+            rows = ws.iter_rows(min_row=2, max_col=1, values_only=True)
+            for row_idx, (value,) in enumerate(rows, start=2):
+                key = key_func(value)
+                if key is not None and key not in index:
+                    index[key] = row_idx
+
+        self._row_index[sheet_name] = index
+        return index
+
+    def _find_row(self, sheet_name: str, item_id: Any) -> Optional[int]:
+        """
+        Tìm số dòng của ID trong sheet.
+
+        Index được kiểm tra lại với giá trị ô thực tế, nếu lệch (sheet bị sửa
+        trực tiếp từ bên ngoài) thì build lại index.
+
+        Returns:
+            Số dòng, hoặc None nếu không tìm thấy
+        """
+        key_func = self.ID_KEYED_SHEETS[sheet_name]
+        key = key_func(item_id)
+        if key is None:
+            return None
+
+        ws = self.workbook[sheet_name]
+        index = self._row_index.get(sheet_name)
+        if index is not None:
+            row_idx = index.get(key)
+            if row_idx is not None and key_func(ws.cell(row=row_idx, column=1).value) == key:
+                return row_idx
+
+        return self._build_row_index(sheet_name).get(key)
+
+    def _index_row(self, sheet_name: str, item_id: Any, row_idx: int) -> None:
+        """Ghi nhận dòng mới thêm vào index (nếu index của sheet đã được build)."""
+        index = self._row_index.get(sheet_name)
+        if index is None:
+            return
+        key = self.ID_KEYED_SHEETS[sheet_name](item_id)
+        if key is not None:
+            index.setdefault(key, row_idx)
+
+    def _reset_row_index(self, sheet_name: str) -> None:
+        """Sheet vừa bị xóa hết dữ liệu -> index rỗng."""
+        self._row_index[sheet_name] = {}
     
     # ========================================================================
     # CHARACTERS METHODS
@@ -590,21 +1794,8 @@ class PromptWorkbook:
         Returns:
             List các Character objects
         """
-        if self.workbook is None:
-            self.load_or_create()
-        
-        ws = self.workbook[self.CHARACTERS_SHEET]
-        characters = []
-        
-        # Đọc từ dòng 2 (skip header)
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:  # Skip empty rows
-                continue
-            
-            data = dict(zip(CHARACTERS_COLUMNS, row))
-            characters.append(Character.from_dict(data))
-        
-        return characters
+        characters = self._get_parsed("characters", self.CHARACTERS_SHEET, characters_from_rows)
+        return [copy.copy(c) for c in characters]
     
     def add_character(self, character: Character) -> None:
         """
@@ -625,6 +1816,8 @@ class PromptWorkbook:
         data = character.to_dict()
         for col, column_name in enumerate(CHARACTERS_COLUMNS, start=1):
             ws.cell(row=next_row, column=col, value=data.get(column_name, ""))
+        self._index_row(self.CHARACTERS_SHEET, character.id, next_row)
+        self.mark_dirty(self.CHARACTERS_SHEET)
         
         self.logger.debug(f"Added character: {character.id}")
     
@@ -644,20 +1837,25 @@ class PromptWorkbook:
         
         ws = self.workbook[self.CHARACTERS_SHEET]
         
-        # Tìm dòng có character_id
-        for row_idx in range(2, ws.max_row + 1):
-            if ws.cell(row=row_idx, column=1).value == character_id:
-                # Cập nhật các field
-                for key, value in kwargs.items():
-                    if key in CHARACTERS_COLUMNS:
-                        col_idx = CHARACTERS_COLUMNS.index(key) + 1
-                        ws.cell(row=row_idx, column=col_idx, value=value)
-                
-                self.logger.debug(f"Updated character: {character_id}")
-                return True
-        
-        self.logger.warning(f"Character not found: {character_id}")
-        return False
+        # Tìm dòng có character_id (qua row index)
+        row_idx = self._find_row(self.CHARACTERS_SHEET, character_id)
+        if row_idx is None and self.change_journal:
+            # Có thể vừa được worker khác thêm vào file
+            self.refresh()
+            ws = self.workbook[self.CHARACTERS_SHEET]
+            row_idx = self._find_row(self.CHARACTERS_SHEET, character_id)
+        if row_idx is None:
+            self.logger.warning(f"Character not found: {character_id}")
+            return False
+
+        # Cập nhật các field
+        fields = {key: value for key, value in kwargs.items() if key in _CHARACTERS_COL_INDEX}
+        for key, value in fields.items():
+            ws.cell(row=row_idx, column=_CHARACTERS_COL_INDEX[key], value=value)
+        self._record_change(self.CHARACTERS_SHEET, character_id, fields)
+
+        self.logger.debug(f"Updated character: {character_id}")
+        return True
     
     def clear_characters(self) -> None:
         """Xóa tất cả nhân vật (giữ lại header)."""
@@ -668,6 +1866,8 @@ class PromptWorkbook:
 
         # Xóa tất cả dòng trừ header
         ws.delete_rows(2, ws.max_row)
+        self._reset_row_index(self.CHARACTERS_SHEET)
+        self.mark_dirty(self.CHARACTERS_SHEET)
         self.logger.debug("Cleared all characters")
 
     def get_media_ids(self) -> Dict[str, str]:
@@ -752,21 +1952,8 @@ class PromptWorkbook:
         Returns:
             List các Scene objects
         """
-        if self.workbook is None:
-            self.load_or_create()
-        
-        ws = self.workbook[self.SCENES_SHEET]
-        scenes = []
-        
-        # Đọc từ dòng 2 (skip header)
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:  # Skip empty rows
-                continue
-            
-            data = dict(zip(SCENES_COLUMNS, row))
-            scenes.append(Scene.from_dict(data))
-        
-        return scenes
+        scenes = self._get_parsed("scenes", self.SCENES_SHEET, scenes_from_rows)
+        return [copy.copy(s) for s in scenes]
     
     def add_scene(self, scene: Scene) -> None:
         """
@@ -787,9 +1974,50 @@ class PromptWorkbook:
         data = scene.to_dict()
         for col, column_name in enumerate(SCENES_COLUMNS, start=1):
             ws.cell(row=next_row, column=col, value=data.get(column_name, ""))
+        self._index_row(self.SCENES_SHEET, scene.scene_id, next_row)
+        self.mark_dirty(self.SCENES_SHEET)
         
         self.logger.debug(f"Added scene: {scene.scene_id}")
     
+    def add_scenes(self, scenes: Iterable[Scene]) -> int:
+        """
+        Thêm nhiều scene vào cuối sheet trong 1 lượt (chỉ tính ws.max_row 1 lần).
+
+        Args:
+            scenes: Các Scene object
+
+        Returns:
+            Số scene đã thêm
+        """
+        if self.workbook is None:
+            self.load_or_create()
+
+        ws = self.workbook[self.SCENES_SHEET]
+        next_row = ws.max_row + 1
+        added = 0
+
+        for scene in scenes:
+            data = scene.to_dict()
+            for col, column_name in enumerate(SCENES_COLUMNS, start=1):
+                ws.cell(row=next_row, column=col, value=data.get(column_name, ""))
+            self._index_row(self.SCENES_SHEET, scene.scene_id, next_row)
+            next_row += 1
+            added += 1
+
+        if added:
+            self.mark_dirty(self.SCENES_SHEET)
+            self.logger.debug(f"Added {added} scenes")
+        return added
+
+    def get_scene_ids(self) -> set:
+        """
+        Tập scene_id đang có trong sheet scenes.
+        Đọc qua parsed_workbook_cache như get_scenes (dùng chung entry "scenes",
+        không copy Scene), không load full workbook.
+        """
+        scenes = self._get_parsed("scenes", self.SCENES_SHEET, scenes_from_rows)
+        return {s.scene_id for s in scenes}
+
     def update_scene(self, scene_id: int, **kwargs) -> bool:
         """
         Cập nhật thông tin scene.
@@ -806,21 +2034,25 @@ class PromptWorkbook:
         
         ws = self.workbook[self.SCENES_SHEET]
         
-        # Tìm dòng có scene_id
-        for row_idx in range(2, ws.max_row + 1):
-            cell_value = ws.cell(row=row_idx, column=1).value
-            if cell_value is not None and int(cell_value) == scene_id:
-                # Cập nhật các field
-                for key, value in kwargs.items():
-                    if key in SCENES_COLUMNS:
-                        col_idx = SCENES_COLUMNS.index(key) + 1
-                        ws.cell(row=row_idx, column=col_idx, value=value)
-                
-                self.logger.debug(f"Updated scene: {scene_id}")
-                return True
-        
-        self.logger.warning(f"Scene not found: {scene_id}")
-        return False
+        # Tìm dòng có scene_id (qua row index, không quét cả sheet)
+        row_idx = self._find_row(self.SCENES_SHEET, scene_id)
+        if row_idx is None and self.change_journal:
+            # Có thể vừa được Excel worker thêm vào file
+            self.refresh()
+            ws = self.workbook[self.SCENES_SHEET]
+            row_idx = self._find_row(self.SCENES_SHEET, scene_id)
+        if row_idx is None:
+            self.logger.warning(f"Scene not found: {scene_id}")
+            return False
+
+        # Cập nhật các field
+        fields = {key: value for key, value in kwargs.items() if key in _SCENES_COL_INDEX}
+        for key, value in fields.items():
+            ws.cell(row=row_idx, column=_SCENES_COL_INDEX[key], value=value)
+        self._record_change(self.SCENES_SHEET, scene_id, fields)
+
+        self.logger.debug(f"Updated scene: {scene_id}")
+        return True
     
     def clear_scenes(self) -> None:
         """Xóa tất cả scenes (giữ lại header)."""
@@ -831,6 +2063,8 @@ class PromptWorkbook:
         
         # Xóa tất cả dòng trừ header
         ws.delete_rows(2, ws.max_row)
+        self._reset_row_index(self.SCENES_SHEET)
+        self.mark_dirty(self.SCENES_SHEET)
         self.logger.debug("Cleared all scenes")
     
     def get_pending_image_scenes(self) -> List[Scene]:
@@ -873,13 +2107,16 @@ class PromptWorkbook:
         # Xóa dữ liệu cũ (giữ header)
         if ws.max_row > 1:
             ws.delete_rows(2, ws.max_row)
+        self._reset_row_index(self.DIRECTOR_PLAN_SHEET)
 
         # Thêm scenes
+        next_row = 1
         for scene in scenes_data:
-            next_row = ws.max_row + 1
+            next_row += 1
             # Đảm bảo scene_id là integer, không phải float (1.0 -> 1)
             scene_id = scene.get("scene_id", 0)
             ws.cell(row=next_row, column=1, value=int(scene_id) if scene_id else 0)
+            self._index_row(self.DIRECTOR_PLAN_SHEET, scene_id, next_row)
             # NEW: Column 2 = segment_id
             segment_id = scene.get("segment_id", 1)  # Default = 1 nếu không có
             ws.cell(row=next_row, column=2, value=int(segment_id) if segment_id else 1)
@@ -907,6 +2144,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=10, value=scene.get("img_prompt", "")[:1000])
             ws.cell(row=next_row, column=11, value=scene.get("status", "backup"))
 
+        self.mark_dirty(self.DIRECTOR_PLAN_SHEET)
         self.save()
         self.logger.info(f"Saved {len(scenes_data)} scenes to director_plan")
 
@@ -917,32 +2155,11 @@ class PromptWorkbook:
         Returns:
             List các scene dict với backup info
         """
-        self._ensure_director_plan_sheet()
-
-        ws = self.workbook[self.DIRECTOR_PLAN_SHEET]
-        plans = []
-
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:
-                continue
-
-            # Handle both old format and new format with segment_id
-            plans.append({
-                "plan_id": row[0],
-                "scene_id": row[0],  # Alias cho plan_id (step 5 dùng scene_id)
-                "segment_id": row[1] if len(row) > 1 else 1,  # NEW: segment_id column
-                "srt_start": row[2] if len(row) > 2 else "",
-                "srt_end": row[3] if len(row) > 3 else "",
-                "duration": row[4] if len(row) > 4 else 0,
-                "srt_text": row[5] if len(row) > 5 else "",
-                "characters_used": row[6] if len(row) > 6 else "[]",
-                "location_used": row[7] if len(row) > 7 else "",
-                "reference_files": row[8] if len(row) > 8 else "[]",
-                "img_prompt": row[9] if len(row) > 9 else "",
-                "status": row[10] if len(row) > 10 else "pending",
-            })
-
-        return plans
+        plans = self._get_parsed(
+            "director_plan", self.DIRECTOR_PLAN_SHEET, director_plan_from_rows,
+            ensure_sheet=self._ensure_director_plan_sheet
+        )
+        return [dict(p) for p in plans]
 
     def update_director_plan_status(self, plan_id: int, status: str) -> bool:
         """Cập nhật status của một plan entry."""
@@ -950,12 +2167,13 @@ class PromptWorkbook:
 
         ws = self.workbook[self.DIRECTOR_PLAN_SHEET]
 
-        for row_idx in range(2, ws.max_row + 1):
-            if ws.cell(row=row_idx, column=1).value == plan_id:
-                ws.cell(row=row_idx, column=11, value=status)
-                return True
+        row_idx = self._find_row(self.DIRECTOR_PLAN_SHEET, plan_id)
+        if row_idx is None:
+            return False
 
-        return False
+        ws.cell(row=row_idx, column=11, value=status)
+        self.mark_dirty(self.DIRECTOR_PLAN_SHEET)
+        return True
 
     # ========== STORY ANALYSIS SHEET ==========
 
@@ -971,6 +2189,7 @@ class PromptWorkbook:
     def _create_story_analysis_sheet(self) -> None:
         """Tạo sheet story_analysis với header."""
         ws = self.workbook.create_sheet(self.STORY_ANALYSIS_SHEET)
+        self.mark_dirty(self.STORY_ANALYSIS_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="8B4513", end_color="8B4513", fill_type="solid")
@@ -1018,6 +2237,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=1, value=key)
             ws.cell(row=next_row, column=2, value=value[:1000] if value else "")
 
+        self.mark_dirty(self.STORY_ANALYSIS_SHEET)
         self.save()
         self.logger.info(f"Saved story_analysis to Excel")
 
@@ -1028,36 +2248,11 @@ class PromptWorkbook:
         Returns:
             Dict với các keys từ sheet
         """
-        self._ensure_story_analysis_sheet()
-        ws = self.workbook[self.STORY_ANALYSIS_SHEET]
-
-        data = {}
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:
-                continue
-            key = row[0]
-            value = row[1] or ""
-
-            # Try to parse JSON for lists
-            if value.startswith("["):
-                try:
-                    value = json.loads(value)
-                except:
-                    pass
-
-            # Handle nested keys (e.g., "setting.era")
-            if "." in key:
-                parts = key.split(".")
-                current = data
-                for part in parts[:-1]:
-                    if part not in current:
-                        current[part] = {}
-                    current = current[part]
-                current[parts[-1]] = value
-            else:
-                data[key] = value
-
-        return data
+        data = self._get_parsed(
+            "story_analysis", self.STORY_ANALYSIS_SHEET, story_analysis_from_rows,
+            ensure_sheet=self._ensure_story_analysis_sheet
+        )
+        return copy.deepcopy(data)
 
     # ========== STORY SEGMENTS SHEET ==========
 
@@ -1073,6 +2268,7 @@ class PromptWorkbook:
     def _create_story_segments_sheet(self) -> None:
         """Tạo sheet story_segments với header."""
         ws = self.workbook.create_sheet(self.STORY_SEGMENTS_SHEET)
+        self.mark_dirty(self.STORY_SEGMENTS_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="9932CC", end_color="9932CC", fill_type="solid")
@@ -1125,6 +2321,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=9, value=seg.get("importance", "medium"))
             ws.cell(row=next_row, column=10, value="pending")
 
+        self.mark_dirty(self.STORY_SEGMENTS_SHEET)
         self.logger.info(f"Saved {len(segments)} story segments (total {total_images} images)")
 
     def get_story_segments(self) -> list:
@@ -1134,37 +2331,11 @@ class PromptWorkbook:
         Returns:
             List các segment dict
         """
-        self._ensure_story_segments_sheet()
-        ws = self.workbook[self.STORY_SEGMENTS_SHEET]
-
-        segments = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[0] is None:
-                continue
-
-            seg = {
-                "segment_id": int(row[0]) if row[0] else 0,
-                "segment_name": row[1] or "",
-                "message": row[2] or "",
-                "key_elements": row[3] or "[]",
-                "image_count": int(row[4]) if row[4] else 1,
-                "estimated_duration": float(row[5]) if row[5] else 0,
-                "srt_range_start": int(row[6]) if row[6] else 0,
-                "srt_range_end": int(row[7]) if row[7] else 0,
-                "importance": row[8] or "medium",
-                "status": row[9] or "pending"
-            }
-
-            # Parse key_elements JSON
-            if isinstance(seg["key_elements"], str) and seg["key_elements"].startswith("["):
-                try:
-                    seg["key_elements"] = json.loads(seg["key_elements"])
-                except:
-                    pass
-
-            segments.append(seg)
-
-        return segments
+        segments = self._get_parsed(
+            "story_segments", self.STORY_SEGMENTS_SHEET, story_segments_from_rows,
+            ensure_sheet=self._ensure_story_segments_sheet
+        )
+        return copy.deepcopy(segments)
 
     # ========== SCENE PLANNING SHEET ==========
 
@@ -1180,6 +2351,7 @@ class PromptWorkbook:
     def _create_scene_planning_sheet(self) -> None:
         """Tạo sheet scene_planning với header."""
         ws = self.workbook.create_sheet(self.SCENE_PLANNING_SHEET)
+        self.mark_dirty(self.SCENE_PLANNING_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="FF6347", end_color="FF6347", fill_type="solid")
@@ -1221,6 +2393,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=7, value=plan.get("color_palette", ""))
             ws.cell(row=next_row, column=8, value=plan.get("key_focus", "")[:300])
 
+        self.mark_dirty(self.SCENE_PLANNING_SHEET)
         self.logger.info(f"Saved {len(plans)} scene plans")
 
     def get_scene_planning(self) -> list:
@@ -1266,6 +2439,7 @@ class PromptWorkbook:
     def _create_locations_sheet(self) -> None:
         """Tạo sheet locations với header."""
         ws = self.workbook.create_sheet(self.LOCATIONS_SHEET)
+        self.mark_dirty(self.LOCATIONS_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="2E8B57", end_color="2E8B57", fill_type="solid")
@@ -1294,12 +2468,14 @@ class PromptWorkbook:
 
         next_row = ws.max_row + 1
         ws.cell(row=next_row, column=1, value=location.id)
+        self._index_row(self.LOCATIONS_SHEET, location.id, next_row)
         ws.cell(row=next_row, column=2, value=location.name)
         ws.cell(row=next_row, column=3, value=location.english_prompt[:500] if location.english_prompt else "")
         ws.cell(row=next_row, column=4, value=getattr(location, 'location_lock', '')[:200])
         ws.cell(row=next_row, column=5, value=getattr(location, 'lighting_default', ''))
         ws.cell(row=next_row, column=6, value=getattr(location, 'image_file', ''))
         ws.cell(row=next_row, column=7, value="pending")
+        self.mark_dirty(self.LOCATIONS_SHEET)
 
     def get_locations(self) -> List["Location"]:
         """
@@ -1341,6 +2517,7 @@ class PromptWorkbook:
     def _create_backup_characters_sheet(self) -> None:
         """Tạo sheet backup_characters với header."""
         ws = self.workbook.create_sheet(self.BACKUP_CHARACTERS_SHEET)
+        self.mark_dirty(self.BACKUP_CHARACTERS_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
@@ -1379,6 +2556,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=4, value=char.get("costume_lock", ""))
             ws.cell(row=next_row, column=5, value=char.get("image_file", "nvc.png"))
 
+        self.mark_dirty(self.BACKUP_CHARACTERS_SHEET)
         self.save()
         self.logger.info(f"Saved {len(characters)} backup characters")
 
@@ -1415,6 +2593,7 @@ class PromptWorkbook:
     def _create_backup_locations_sheet(self) -> None:
         """Tạo sheet backup_locations với header."""
         ws = self.workbook.create_sheet(self.BACKUP_LOCATIONS_SHEET)
+        self.mark_dirty(self.BACKUP_LOCATIONS_SHEET)
 
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="ED7D31", end_color="ED7D31", fill_type="solid")
@@ -1452,6 +2631,7 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=3, value=loc.get("location_lock", ""))
             ws.cell(row=next_row, column=4, value=loc.get("image_file", "loc.png"))
 
+        self.mark_dirty(self.BACKUP_LOCATIONS_SHEET)
         self.save()
         self.logger.info(f"Saved {len(locations)} backup locations")
 
@@ -1610,6 +2790,7 @@ class PromptWorkbook:
         """Tạo sheet srt_coverage nếu chưa có."""
         if self.SRT_COVERAGE_SHEET not in self.workbook.sheetnames:
             ws = self.workbook.create_sheet(self.SRT_COVERAGE_SHEET)
+            self.mark_dirty(self.SRT_COVERAGE_SHEET)
             headers = [
                 "srt_index", "start_time", "end_time", "text_preview",
                 "segment_id", "segment_name", "scene_id", "status"
@@ -1643,12 +2824,12 @@ class PromptWorkbook:
         self._ensure_srt_coverage_sheet()
         ws = self.workbook[self.SRT_COVERAGE_SHEET]
 
-        # Clear existing data (keep header)
-        for row in range(ws.max_row, 1, -1):
-            ws.delete_rows(row)
+        # Clear existing data (keep header) - xóa 1 lần, không xóa từng dòng
+        if ws.max_row > 1:
+            ws.delete_rows(2, ws.max_row - 1)
 
         # Add all SRT entries
-        uncovered_fill = PatternFill(start_color="FFCDD2", end_color="FFCDD2", fill_type="solid")
+        status_cells = []
 
         for i, entry in enumerate(srt_entries, 1):
             row = i + 1  # +1 for header
@@ -1659,16 +2840,54 @@ class PromptWorkbook:
             ws.cell(row=row, column=5, value="")  # segment_id - empty
             ws.cell(row=row, column=6, value="")  # segment_name - empty
             ws.cell(row=row, column=7, value="")  # scene_id - empty
-            status_cell = ws.cell(row=row, column=8, value="UNCOVERED")
-            status_cell.fill = uncovered_fill
+            status_cells.append(ws.cell(row=row, column=8, value="UNCOVERED"))
 
+        self._bulk_fill(status_cells, "UNCOVERED")
+        self.mark_dirty(self.SRT_COVERAGE_SHEET)
         self.save()
         self.logger.info(f"Initialized SRT coverage tracking for {len(srt_entries)} entries")
 
+    def _srt_coverage_rows(self) -> list:
+        """
+        Các row dữ liệu của sheet srt_coverage dạng (srt_index, cells) với
+        cells = 8 cell của row đó, đọc 1 lượt thay vì ws.cell() từng ô.
+        """
+        ws = self.workbook[self.SRT_COVERAGE_SHEET]
+        rows = []
+        for cells in ws.iter_rows(min_row=2, max_col=8):
+            srt_index = cells[0].value
+            if srt_index is not None:
+                rows.append((srt_index, cells))
+        return rows
+
+    def _coverage_style(self, status: str) -> str:
+        """
+        Tên NamedStyle tô ô status của sheet srt_coverage (đăng ký 1 lần cho
+        workbook). Gán cell.fill phải hash lại PatternFill cho mỗi ô; gán
+        cell.style bằng tên chỉ copy style đã dựng sẵn.
+        """
+        name = f"srt_coverage_{status.lower()}"
+        if name not in self.workbook.named_styles:
+            color = self.SRT_COVERAGE_COLORS[status]
+            style = NamedStyle(name=name)
+            style.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+            self.workbook.add_named_style(style)
+        return name
+
+    def _bulk_fill(self, cells: list, status: str) -> None:
+        """Tô màu của status cho nhiều cell (cùng 1 NamedStyle)."""
+        style = self._coverage_style(status)
+        for cell in cells:
+            cell.style = style
+
     def update_srt_coverage_segments(self, segments: list) -> dict:
         """
         Cập nhật coverage sau Step 1.5 (segments).
 
+        Map srt_index -> segment được dựng 1 lần bằng cách tô các khoảng
+        [srt_range_start, srt_range_end] lên mảng (segment đứng trước trong list
+        được ưu tiên khi các khoảng chồng nhau), mỗi row chỉ tra O(1).
+
         Args:
             segments: List segments từ Step 1.5
 
@@ -1676,35 +2895,43 @@ class PromptWorkbook:
             Dict với coverage statistics
         """
         self._ensure_srt_coverage_sheet()
-        ws = self.workbook[self.SRT_COVERAGE_SHEET]
+        rows = self._srt_coverage_rows()
 
-        segment_fill = PatternFill(start_color="FFF9C4", end_color="FFF9C4", fill_type="solid")  # Yellow
         covered = 0
         uncovered = 0
-
-        for row in range(2, ws.max_row + 1):
-            srt_index = ws.cell(row=row, column=1).value
-            if srt_index is None:
+        to_fill = []
+
+        int_indices = [idx for idx, _ in rows if isinstance(idx, int)]
+        lo = min(int_indices) if int_indices else 0
+        hi = max(int_indices) if int_indices else -1
+
+        # owner[i - lo] = segment cover srt_index i (None nếu không có)
+        owner = [None] * (hi - lo + 1)
+        for seg in reversed(segments):
+            start = _int_key(seg.get("srt_range_start", 0))
+            end = _int_key(seg.get("srt_range_end", 0))
+            if start is None or end is None:
                 continue
+            start, end = max(start, lo), min(end, hi)
+            if start <= end:
+                owner[start - lo:end - lo + 1] = [seg] * (end - start + 1)
 
-            # Find which segment covers this SRT
-            segment_found = None
-            for seg in segments:
-                start = seg.get("srt_range_start", 0)
-                end = seg.get("srt_range_end", 0)
-                if start <= srt_index <= end:
-                    segment_found = seg
-                    break
+        for srt_index, cells in rows:
+            key = _int_key(srt_index)
+            segment_found = owner[key - lo] if key is not None and lo <= key <= hi else None
 
             if segment_found:
-                ws.cell(row=row, column=5, value=segment_found.get("segment_id", ""))
-                ws.cell(row=row, column=6, value=segment_found.get("segment_name", ""))
-                ws.cell(row=row, column=8, value="SEGMENT_OK")
-                ws.cell(row=row, column=8).fill = segment_fill
+                cells[4].value = segment_found.get("segment_id", "")
+                cells[5].value = segment_found.get("segment_name", "")
+                if cells[7].value != "SEGMENT_OK":
+                    cells[7].value = "SEGMENT_OK"
+                    to_fill.append(cells[7])
                 covered += 1
             else:
                 uncovered += 1
 
+        self._bulk_fill(to_fill, "SEGMENT_OK")
+        self.mark_dirty(self.SRT_COVERAGE_SHEET)
         self.save()
 
         total = covered + uncovered
@@ -1721,6 +2948,9 @@ class PromptWorkbook:
         """
         Cập nhật coverage sau Step 4 (director_plan).
 
+        Đảo ngược srt_indices của các scene thành map srt_index -> [scene_id]
+        trong 1 lượt, thay vì quét toàn bộ director_plan cho mỗi row.
+
         Args:
             director_plan: List scenes từ Step 4
 
@@ -1728,34 +2958,33 @@ class PromptWorkbook:
             Dict với coverage statistics
         """
         self._ensure_srt_coverage_sheet()
-        ws = self.workbook[self.SRT_COVERAGE_SHEET]
+        rows = self._srt_coverage_rows()
 
-        scene_fill = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")  # Green
         covered = 0
         uncovered = 0
+        to_fill = []
 
-        for row in range(2, ws.max_row + 1):
-            srt_index = ws.cell(row=row, column=1).value
-            if srt_index is None:
-                continue
+        # srt_index -> các scene_id cover nó (giữ thứ tự trong director_plan)
+        scenes_by_srt: Dict[Any, List[Any]] = {}
+        for scene in director_plan:
+            scene_id = scene.get("scene_id", "")
+            for srt_index in set(scene.get("srt_indices", [])):
+                scenes_by_srt.setdefault(srt_index, []).append(scene_id)
 
-            # Find which scene covers this SRT
-            scene_ids = []
-            for scene in director_plan:
-                indices = scene.get("srt_indices", [])
-                if srt_index in indices:
-                    scene_ids.append(scene.get("scene_id", ""))
+        for srt_index, cells in rows:
+            scene_ids = scenes_by_srt.get(srt_index)
 
             if scene_ids:
-                ws.cell(row=row, column=7, value=", ".join(map(str, scene_ids)))
-                ws.cell(row=row, column=8, value="COVERED")
-                ws.cell(row=row, column=8).fill = scene_fill
+                cells[6].value = ", ".join(map(str, scene_ids))
+                if cells[7].value != "COVERED":
+                    cells[7].value = "COVERED"
+                    to_fill.append(cells[7])
                 covered += 1
-            else:
-                current_status = ws.cell(row=row, column=8).value
-                if current_status != "COVERED":
-                    uncovered += 1
+            elif cells[7].value != "COVERED":
+                uncovered += 1
 
+        self._bulk_fill(to_fill, "COVERED")
+        self.mark_dirty(self.SRT_COVERAGE_SHEET)
         self.save()
 
         total = covered + uncovered
@@ -1775,36 +3004,9 @@ class PromptWorkbook:
         Returns:
             Dict với statistics
         """
-        self._ensure_srt_coverage_sheet()
-        ws = self.workbook[self.SRT_COVERAGE_SHEET]
-
-        total = 0
-        covered = 0
-        segment_only = 0
-        uncovered = 0
-
-        for row in range(2, ws.max_row + 1):
-            srt_index = ws.cell(row=row, column=1).value
-            if srt_index is None:
-                continue
-
-            total += 1
-            status = ws.cell(row=row, column=8).value
-
-            if status == "COVERED":
-                covered += 1
-            elif status == "SEGMENT_OK":
-                segment_only += 1
-            else:
-                uncovered += 1
-
-        return {
-            "total_srt": total,
-            "fully_covered": covered,
-            "segment_only": segment_only,
-            "uncovered": uncovered,
-            "coverage_percent": round((covered / total * 100) if total > 0 else 0, 1)
-        }
+        # Chưa có sheet = chưa có SRT nào -> tất cả bằng 0
+        summary = self._get_parsed("srt_coverage_summary", self.SRT_COVERAGE_SHEET, srt_coverage_summary_from_rows)
+        return dict(summary)
 
     def get_uncovered_srt_entries(self) -> list:
         """
@@ -1851,6 +3053,7 @@ class PromptWorkbook:
         if self.PROCESSING_STATUS_SHEET not in self.workbook.sheetnames:
             # Tạo mới
             ws = self.workbook.create_sheet(self.PROCESSING_STATUS_SHEET)
+            self.mark_dirty(self.PROCESSING_STATUS_SHEET)
             headers = [
                 "step_id", "step_name", "description", "status",
                 "items_total", "items_done", "coverage_pct", "notes", "last_updated"
@@ -1911,6 +3114,9 @@ class PromptWorkbook:
                 # Xóa rows cũ và tạo mới
                 self.workbook.remove(ws)
                 ws = self.workbook.create_sheet(self.PROCESSING_STATUS_SHEET)
+                self.mark_dirty(self.PROCESSING_STATUS_SHEET)
+                self._row_index.pop(self.PROCESSING_STATUS_SHEET, None)
+                self._step_status = None
 
                 headers = [
                     "step_id", "step_name", "description", "status",
@@ -1981,7 +3187,7 @@ class PromptWorkbook:
         """
         from datetime import datetime
 
-        self._ensure_processing_status_sheet()
+        snapshot = self._step_snapshot()
         ws = self.workbook[self.PROCESSING_STATUS_SHEET]
 
         # Color mapping
@@ -1994,71 +3200,61 @@ class PromptWorkbook:
         }
 
         # Find the row for this step
-        for row in range(2, ws.max_row + 1):
-            if ws.cell(row=row, column=1).value == step_id:
-                ws.cell(row=row, column=4, value=status)
-                ws.cell(row=row, column=4).fill = PatternFill(
-                    start_color=status_colors.get(status, "FFFFFF"),
-                    end_color=status_colors.get(status, "FFFFFF"),
-                    fill_type="solid"
-                )
-                ws.cell(row=row, column=5, value=items_total)
-                ws.cell(row=row, column=6, value=items_done)
-
-                # Calculate coverage percentage
-                coverage = (items_done / items_total * 100) if items_total > 0 else 0
-                ws.cell(row=row, column=7, value=round(coverage, 1))
-
-                # Add notes
-                if notes:
-                    existing_notes = ws.cell(row=row, column=8).value or ""
-                    if existing_notes and notes not in existing_notes:
-                        notes = f"{existing_notes}; {notes}"
-                    ws.cell(row=row, column=8, value=notes[:500])  # Limit notes length
-
-                ws.cell(row=row, column=9, value=datetime.now().strftime("%Y-%m-%d %H:%M"))
-                break
+        row = self._find_row(self.PROCESSING_STATUS_SHEET, step_id)
+        if row is not None:
+            ws.cell(row=row, column=4, value=status)
+            ws.cell(row=row, column=4).fill = PatternFill(
+                start_color=status_colors.get(status, "FFFFFF"),
+                end_color=status_colors.get(status, "FFFFFF"),
+                fill_type="solid"
+            )
+            ws.cell(row=row, column=5, value=items_total)
+            ws.cell(row=row, column=6, value=items_done)
+
+            # Calculate coverage percentage
+            coverage = (items_done / items_total * 100) if items_total > 0 else 0
+            ws.cell(row=row, column=7, value=round(coverage, 1))
+
+            # Add notes
+            if notes:
+                existing_notes = ws.cell(row=row, column=8).value or ""
+                if existing_notes and notes not in existing_notes:
+                    notes = f"{existing_notes}; {notes}"
+                ws.cell(row=row, column=8, value=notes[:500])  # Limit notes length
+
+            ws.cell(row=row, column=9, value=datetime.now().strftime("%Y-%m-%d %H:%M"))
+
+            # Cập nhật snapshot từ chính các ô vừa ghi
+            cells = ws.iter_rows(min_row=row, max_row=row, max_col=9, values_only=True)
+            snapshot.update((s["step_id"], s) for s in step_status_from_rows(cells) or ())
+            self.mark_dirty(self.PROCESSING_STATUS_SHEET)
 
         self.save()
+        # Kết thúc step (COMPLETED/PARTIAL/ERROR) -> ghi file ngay kể cả ở chế độ write-behind
+        if status != "IN_PROGRESS":
+            self.flush()
+
+    def _step_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Snapshot sheet processing_status (step_id -> dict), parse 1 lần mỗi lần load.
+        Các get_*status/summary/progress đều đọc từ đây thay vì quét sheet.
+        """
+        if self._step_status is None:
+            statuses = self._get_parsed(
+                "step_status", self.PROCESSING_STATUS_SHEET, step_status_from_rows,
+                ensure_sheet=self._ensure_processing_status_sheet
+            )
+            self._step_status = {s["step_id"]: dict(s) for s in statuses}
+        return self._step_status
 
     def get_step_status(self, step_id: str) -> dict:
         """Lấy trạng thái của một step."""
-        self._ensure_processing_status_sheet()
-        ws = self.workbook[self.PROCESSING_STATUS_SHEET]
-
-        for row in range(2, ws.max_row + 1):
-            if ws.cell(row=row, column=1).value == step_id:
-                return {
-                    "step_id": step_id,
-                    "step_name": ws.cell(row=row, column=2).value,
-                    "status": ws.cell(row=row, column=4).value,
-                    "items_total": ws.cell(row=row, column=5).value or 0,
-                    "items_done": ws.cell(row=row, column=6).value or 0,
-                    "coverage_pct": ws.cell(row=row, column=7).value or 0,
-                    "notes": ws.cell(row=row, column=8).value or "",
-                    "last_updated": ws.cell(row=row, column=9).value or ""
-                }
-        return {}
+        status = self._step_snapshot().get(step_id)
+        return dict(status) if status else {}
 
     def get_all_step_status(self) -> list:
-        """Lấy trạng thái của tất cả steps."""
-        self._ensure_processing_status_sheet()
-        ws = self.workbook[self.PROCESSING_STATUS_SHEET]
-
-        statuses = []
-        for row in range(2, ws.max_row + 1):
-            step_id = ws.cell(row=row, column=1).value
-            if step_id:
-                statuses.append({
-                    "step_id": step_id,
-                    "step_name": ws.cell(row=row, column=2).value,
-                    "status": ws.cell(row=row, column=4).value,
-                    "items_total": ws.cell(row=row, column=5).value or 0,
-                    "items_done": ws.cell(row=row, column=6).value or 0,
-                    "coverage_pct": ws.cell(row=row, column=7).value or 0,
-                    "notes": ws.cell(row=row, column=8).value or ""
-                })
-        return statuses
+        """Lấy trạng thái của tất cả steps (theo thứ tự trong sheet)."""
+        return [dict(s) for s in self._step_snapshot().values()]
 
     def get_incomplete_steps(self) -> list:
         """Lấy danh sách các steps chưa hoàn thành (PARTIAL hoặc ERROR)."""
@@ -2112,20 +3308,16 @@ class PromptWorkbook:
             Value string, hoặc "" nếu không tìm thấy
         """
         try:
-            if 'config' not in self.workbook.sheetnames:
-                return ""
-
-            ws = self.workbook['config']
-            for row in range(2, ws.max_row + 1):
-                cell_key = ws.cell(row=row, column=1).value
-                if cell_key and str(cell_key).strip().lower() == key.lower():
-                    value = ws.cell(row=row, column=2).value
-                    return str(value) if value else ""
-
-            return ""
+            return self._config_values().get(key.lower(), "")
         except:
             return ""
 
+    def _config_values(self) -> Dict[str, str]:
+        """Snapshot sheet config (key lower -> value), parse 1 lần mỗi lần load."""
+        if self._config is None:
+            self._config = dict(self._get_parsed("config", self.CONFIG_SHEET, config_from_rows))
+        return self._config
+
     def set_config_value(self, key: str, value: str) -> None:
         """
         Ghi giá trị vào sheet 'config'.
@@ -2134,13 +3326,18 @@ class PromptWorkbook:
             key: Key cần ghi (vd: 'flow_project_url')
             value: Value cần ghi
         """
+        self._set_config_cell(key, value)
+        self._record_change(self.CONFIG_SHEET, key, {"value": value})
+
+    def _set_config_cell(self, key: str, value: str) -> None:
+        """Ghi key/value vào sheet 'config' (không đánh dấu dirty/journal)."""
         # Tạo sheet config nếu chưa có
-        if 'config' not in self.workbook.sheetnames:
-            ws = self.workbook.create_sheet('config')
+        if self.CONFIG_SHEET not in self.workbook.sheetnames:
+            ws = self.workbook.create_sheet(self.CONFIG_SHEET)
             ws['A1'] = 'key'
             ws['B1'] = 'value'
         else:
-            ws = self.workbook['config']
+            ws = self.workbook[self.CONFIG_SHEET]
 
         # Tìm row có key này để update
         found = False
@@ -2157,6 +3354,10 @@ class PromptWorkbook:
             ws.cell(row=next_row, column=1, value=key)
             ws.cell(row=next_row, column=2, value=value)
 
+        config_key = key.strip().lower()
+        if self._config is not None and (found or config_key not in self._config):
+            self._config[config_key] = str(value) if value else ""
+
     def get_total_progress(self) -> float:
         """
         Tính % hoàn thành tổng thể dựa trên processing_status.
@@ -2165,11 +3366,11 @@ class PromptWorkbook:
             Float từ 0.0 đến 100.0
         """
         try:
-            statuses = self.get_all_step_status()
+            statuses = self._step_snapshot()
             if not statuses:
                 return 0.0
 
-            completed = sum(1 for s in statuses if s["status"] == "COMPLETED")
+            completed = sum(1 for s in statuses.values() if s["status"] == "COMPLETED")
             return round((completed / len(statuses)) * 100, 1)
         except:
             return 0.0
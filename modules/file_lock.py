@@ -0,0 +1,52 @@
+"""
+VE3 Tool - File lock liên process
+=================================
+Lock trên 1 file đang mở, dùng chung cho các state file mà nhiều worker
+(Excel worker, Chrome 1, Chrome 2) cùng đọc/ghi: key_rate_limiter,
+key_health, change_journal, shared_403_tracker.
+
+fcntl chỉ có trên Linux/macOS, Windows dùng msvcrt. msvcrt không có lock
+blocking không giới hạn (LK_LOCK chỉ thử ~10s) và không có shared lock, nên
+trên Windows lock được thử lại (LK_NBLCK) tới khi hết timeout và luôn là
+exclusive. Lock đặt trên byte đầu tiên của file.
+"""
+
+import sys
+import time
+
+# Khoảng chờ giữa các lần thử lock trên Windows
+_POLL_INTERVAL = 0.01
+
+if sys.platform == 'win32':
+    import msvcrt
+
+    def lock_file(f, exclusive: bool = True, timeout: float = 30.0) -> None:
+        """Lock file f (chờ tối đa timeout giây, hết giờ -> OSError)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(_POLL_INTERVAL)
+
+    def unlock_file(f) -> None:
+        """Bỏ lock đã đặt bằng lock_file."""
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+else:
+    import fcntl
+
+    def lock_file(f, exclusive: bool = True, timeout: float = 30.0) -> None:
+        """Lock file f (flock chờ tới khi lấy được lock, không cần timeout)."""
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def unlock_file(f) -> None:
+        """Bỏ lock đã đặt bằng lock_file."""
+        fcntl.flock(f, fcntl.LOCK_UN)
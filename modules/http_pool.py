@@ -0,0 +1,101 @@
+"""
+VE3 Tool - Pooled HTTP client cho LLM API
+==========================================
+Mỗi API key giữ 1 requests.Session (keep-alive, pool kết nối) thay vì
+requests.post mới mỗi lần -> không phải bắt tay TLS lại cho từng call.
+
+Số request đang bay được giới hạn bằng semaphore (max_in_flight), không phải
+bằng số thread: thread đang sleep backoff (429/5xx) không giữ slot, nên các
+step song song có thể submit nhiều task hơn mà API vẫn chỉ nhận tối đa
+max_in_flight request cùng lúc.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpPool:
+    """
+    Session keep-alive theo API key + semaphore giới hạn request đồng thời.
+
+    Attributes:
+        max_in_flight: Số request tối đa đang chờ response cùng lúc
+        peak_in_flight: Số request đồng thời cao nhất đã thấy (metrics)
+    """
+
+    def __init__(self, max_in_flight: int = 6):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def session(self, key: str) -> requests.Session:
+        """Session riêng cho key (tạo lần đầu dùng)."""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                # Pool đủ lớn để mọi slot dùng chung 1 key vẫn giữ được kết nối
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[key] = session
+            return session
+
+    @contextmanager
+    def _slot(self) -> Iterator[None]:
+        """Giữ 1 slot trong max_in_flight."""
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def post(self, key: str, url: str, **kwargs: Any) -> requests.Response:
+        """requests.post qua session của key, chờ slot nếu đã đủ max_in_flight."""
+        session = self.session(key)
+        with self._slot():
+            return session.post(url, **kwargs)
+
+    def post_stream(self, key: str, url: str, on_line: Callable[[str], None], **kwargs: Any) -> requests.Response:
+        """
+        POST stream=True (SSE): response 200 thì gọi on_line cho từng dòng ngay
+        khi về. Slot được giữ tới khi đọc hết body.
+
+        Returns:
+            Response (body đã đọc xong; response lỗi vẫn dùng .text được)
+        """
+        session = self.session(key)
+        with self._slot():
+            with session.post(url, stream=True, **kwargs) as resp:
+                if resp.status_code == 200:
+                    # text/event-stream không có charset -> requests mặc định latin-1
+                    resp.encoding = "utf-8"
+                    for line in resp.iter_lines(decode_unicode=True):
+                        on_line(line)
+                else:
+                    resp.content  # Đọc body lỗi trước khi trả kết nối về pool
+                return resp
+
+    def hold(self, seconds: float) -> None:
+        """Giữ 1 slot trong seconds giây như 1 request thật (replay, xem modules.llm_replay)."""
+        with self._slot():
+            time.sleep(seconds)
+
+    def close(self) -> None:
+        """Đóng tất cả kết nối."""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,275 @@
+"""
+VE3 Tool - Streaming JSON parser cho output của LLM
+===================================================
+Parse JSON tăng dần khi response của LLM về theo từng chunk (stream=True).
+
+Response của các step có dạng {"scenes": [{...}, {...}, ...], ...}. Parser
+theo dõi trạng thái string/escape và độ sâu ngoặc, nên ngay khi 1 phần tử của
+mảng cấp 1 đóng ngoặc là được json.loads và trả ra (on_item) - không phải chờ
+cả response.
+
+Response bị cắt (hết max_tokens, mất kết nối) không cần repair lại: result()
+trả về các field cấp 1 đã hoàn chỉnh + tất cả phần tử hoàn chỉnh của mảng
+đang dở.
+
+Text trước JSON (lời dẫn, ```json, <think>...</think>) được bỏ qua. Cặp ngoặc
+trong lời dẫn không phải JSON (vd "dùng {placeholder}") cũng bị bỏ qua, parser
+tìm tiếp ngoặc mở sau đó. JSON gốc là mảng ([{...}, ...]) thì parser không
+nhận (result() = None), để caller parse theo cách khác.
+"""
+
+import json
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# Độ sâu tối đa mà parser cần giữ lại giá trị (1 = field của object ngoài cùng,
+# 2 = phần tử của mảng nằm trong object ngoài cùng)
+_TRACK_DEPTH = 2
+
+
+class _Frame:
+    """1 cấp ngoặc đang mở ({ hoặc [)."""
+
+    __slots__ = ("kind", "key", "expect_key", "value_start", "items", "fields")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key: Optional[str] = None          # object: key của value đang đọc
+        self.expect_key = kind == "{"
+        self.value_start: Optional[int] = None  # vị trí bắt đầu của value/phần tử con đang đọc
+        self.items: List[Any] = []              # array: các phần tử đã hoàn chỉnh
+        self.fields: dict = {}                  # object: các field đã hoàn chỉnh
+
+
+class JsonStreamParser:
+    """
+    Parser JSON tăng dần.
+
+    Usage:
+        parser = JsonStreamParser(on_item=lambda key, obj: ...)
+        for chunk in stream:
+            parser.feed(chunk)
+        data = parser.result()
+
+    Attributes:
+        on_item: Callback(key, item) cho mỗi object hoàn chỉnh trong mảng cấp 1
+                 (key = tên field chứa mảng, vd "scenes")
+        items_emitted: Số phần tử đã trả ra
+        first_item_at: time.monotonic() lúc phần tử đầu tiên hoàn chỉnh
+    """
+
+    def __init__(self, on_item: Optional[Callable[[str, Any], None]] = None):
+        self.on_item = on_item
+        self.reset()
+
+    def reset(self) -> None:
+        """Bỏ dữ liệu đã feed (vd: retry request từ đầu)."""
+        self.items_emitted = 0
+        self.started_at = time.monotonic()
+        self.first_item_at: Optional[float] = None
+        self._buf = ""
+        self._pos = 0
+        self._started = False
+        self._start = 0          # vị trí ngoặc mở của object ngoài cùng
+        self._search_from = 0    # tìm ngoặc mở từ đây (sau các cặp ngoặc không phải JSON)
+        self._done = False
+        self._array_root = False  # JSON gốc là mảng -> không parse
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._stack: List[_Frame] = []
+        self._value: Any = None  # JSON ngoài cùng khi đã đóng
+
+    @property
+    def done(self) -> bool:
+        """JSON ngoài cùng đã đóng ngoặc."""
+        return self._done
+
+    @property
+    def has_data(self) -> bool:
+        """Đã lấy được ít nhất 1 field/phần tử (không chỉ là {} rỗng)."""
+        return self.items_emitted > 0 or bool(self.result())
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Thêm 1 chunk text.
+
+        Returns:
+            Các (key, item) vừa hoàn chỉnh trong chunk này
+        """
+        if not chunk or self._done or self._array_root:
+            return []
+        self._buf += chunk
+        if not self._started and not self._find_start():
+            return []
+        return self._scan()
+
+    def result(self) -> Optional[Any]:
+        """
+        JSON đã parse được.
+
+        JSON hoàn chỉnh -> giá trị đầy đủ. Bị cắt -> object ngoài cùng chỉ gồm
+        các field đã hoàn chỉnh, mảng đang dở giữ các phần tử hoàn chỉnh.
+        None nếu chưa thấy JSON nào.
+        """
+        if self._done:
+            return self._value
+        if not self._stack:
+            return None
+
+        top = self._stack[0]
+        data = dict(top.fields)
+        if len(self._stack) > 1:
+            child = self._stack[1]
+            if child.kind == "[" and top.key is not None:
+                data[top.key] = list(child.items)
+        return data
+
+    # ========================================================================
+    # SCAN
+    # ========================================================================
+
+    def _find_start(self) -> bool:
+        """Bỏ qua text trước JSON; True nếu đã thấy ngoặc mở đầu tiên."""
+        search_from = self._search_from
+        think = self._buf.rfind("<think>")
+        if think != -1:
+            end = self._buf.find("</think>", think)
+            if end == -1:
+                return False  # Đang trong <think>, chờ thêm
+            search_from = max(search_from, end + len("</think>"))
+
+        start = self._buf.find("{", search_from)
+        bracket = self._buf.find("[", search_from, start if start != -1 else None)
+        if bracket != -1:
+            # "[{" (chỉ cách nhau khoảng trắng) -> JSON gốc là mảng, không phải object
+            rest = self._buf[bracket + 1:].lstrip()
+            if not rest:
+                return False  # Chưa biết, chờ thêm
+            if rest[0] == "{":
+                self._array_root = True
+                return False
+        if start == -1:
+            return False
+        self._pos = self._start = start
+        self._started = True
+        return True
+
+    def _scan(self) -> List[Tuple[str, Any]]:
+        emitted: List[Tuple[str, Any]] = []
+        buf = self._buf
+        stack = self._stack
+        i = self._pos
+        n = len(buf)
+
+        while i < n:
+            ch = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = stack[-1]
+                    if frame.kind == "{" and frame.expect_key:
+                        # Chỉ cần key ở các cấp giữ giá trị
+                        if len(stack) <= _TRACK_DEPTH:
+                            frame.key = json.loads(buf[self._string_start:i + 1])
+                i += 1
+                continue
+
+            if ch in " \t\r\n":
+                i += 1
+                continue
+
+            frame = stack[-1] if stack else None
+
+            if ch == '"':
+                if frame is not None and not (frame.kind == "{" and frame.expect_key) and frame.value_start is None:
+                    frame.value_start = i
+                self._in_string = True
+                self._string_start = i
+
+            elif ch in "{[":
+                if frame is not None and frame.value_start is None:
+                    frame.value_start = i
+                stack.append(_Frame(ch))
+
+            elif ch in "}]":
+                # Value scalar cuối cùng trước ngoặc đóng
+                self._finish_child(frame, len(stack), i, emitted)
+                stack.pop()
+                if not stack and not frame.fields and not self.items_emitted and buf[self._start + 1:i].strip():
+                    # {placeholder} trong lời dẫn, không phải JSON -> tìm ngoặc mở tiếp theo
+                    self._started = False
+                    self._search_from = i + 1
+                    if not self._find_start():
+                        self._pos = i + 1
+                        return emitted
+                    i = self._pos
+                    continue
+                if not stack:
+                    self._value = frame.fields
+                    self._done = True
+                    i += 1
+                    break
+                self._finish_child(stack[-1], len(stack), i + 1, emitted)
+
+            elif ch == ":":
+                if frame is not None:
+                    frame.expect_key = False
+
+            elif ch == ",":
+                if frame is not None:
+                    self._finish_child(frame, len(stack), i, emitted)
+                    if frame.kind == "{":
+                        frame.expect_key = True
+
+            else:
+                # Số, true/false/null
+                if frame is not None and frame.value_start is None:
+                    frame.value_start = i
+
+            i += 1
+
+        self._pos = i
+        return emitted
+
+    def _finish_child(self, frame: _Frame, depth: int, end: int, emitted: List[Tuple[str, Any]]) -> None:
+        """Value/phần tử con của frame (ở cấp depth) kết thúc tại buf[end - 1]."""
+        start = frame.value_start
+        if start is None:
+            return
+        frame.value_start = None
+        if depth > _TRACK_DEPTH:
+            return
+
+        try:
+            value = json.loads(self._buf[start:end])
+        except ValueError:
+            return
+
+        if frame.kind == "{":
+            if frame.key is not None:
+                frame.fields[frame.key] = value
+            frame.key = None
+            return
+
+        frame.items.append(value)
+        key = self._stack[depth - 2].key or ""
+        if isinstance(value, dict):
+            emitted.append((key, value))
+            self.items_emitted += 1
+            if self.first_item_at is None:
+                self.first_item_at = time.monotonic()
+            if self.on_item:
+                self.on_item(key, value)
+
+
+def parse_json_stream(text: str, on_item: Optional[Callable[[str, Any], None]] = None) -> Optional[Any]:
+    """Parse cả response 1 lần (cùng kết quả với feed từng chunk)."""
+    parser = JsonStreamParser(on_item=on_item)
+    parser.feed(text)
+    return parser.result()
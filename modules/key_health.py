@@ -0,0 +1,141 @@
+"""
+VE3 Tool - Sức khỏe API key (dùng chung giữa các process)
+==========================================================
+Trước đây mỗi ProgressivePromptsGenerator / MultiAIClient mới tạo đều gửi
+"Say OK" tới từng key để lọc key chết -> mỗi lần restart worker mất vài
+chục giây.
+
+KeyHealthRegistry ghi trạng thái key vào file JSON có lock, cập nhật thụ động
+từ kết quả của các call thật:
+- 200 -> key sống
+- 401/402/403 (sai key, hết tiền, bị khóa) -> key chết trong ttl giây
+- Lỗi khác (429, 5xx, timeout) không nói gì về key -> không đổi
+
+Khởi tạo chỉ đọc file: key đang chết thì bỏ qua, không probe. Hết ttl thì key
+được dùng lại và call thật sẽ xác nhận lại trạng thái.
+
+Key không được ghi ra file, chỉ ghi sha256[:12] của key (như key_rate_limiter).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from modules.file_lock import lock_file, unlock_file
+from modules.key_rate_limiter import key_id
+from modules.utils import get_logger
+
+
+DEFAULT_STATE_FILE = Path(__file__).parent.parent / "config" / ".key_health.json"
+
+# Status code cho biết chính key có vấn đề
+DEAD_STATUSES = (401, 402, 403)
+
+
+class KeyHealthRegistry:
+    """
+    Trạng thái sống/chết của API key, state dùng chung qua file + lock.
+
+    Attributes:
+        ttl: Key chết bị bỏ qua bao lâu (giây) trước khi thử lại
+    """
+
+    # Key sống: ghi lại "ok" tối đa 1 lần / OK_REFRESH giây (không ghi file mỗi call)
+    OK_REFRESH = 300.0
+
+    def __init__(self, state_file: Union[str, Path, None] = None, ttl: float = 6 * 3600):
+        self.state_file = Path(state_file) if state_file else DEFAULT_STATE_FILE
+        self.lock_path = self.state_file.with_suffix(".lock")
+        self.ttl = ttl
+        self.logger = get_logger("key_health")
+        self._thread_lock = threading.Lock()
+        self._ok_written: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "KeyHealthRegistry":
+        """settings.yaml: key_health_ttl (giây)."""
+        return cls(ttl=float(config.get("key_health_ttl", 6 * 3600)))
+
+    # ========================================================================
+    # STATE FILE
+    # ========================================================================
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, Dict]]:
+        """Đọc state dưới lock, ghi lại (atomic) khi thoát context."""
+        with self._thread_lock:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a+") as lock_fh:
+                lock_file(lock_fh)
+                try:
+                    state = self._read()
+
+                    yield state
+
+                    tmp = self.state_file.with_name(self.state_file.name + f".{os.getpid()}.tmp")
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(state, f)
+                    os.replace(tmp, self.state_file)
+                finally:
+                    unlock_file(lock_fh)
+
+    # ========================================================================
+    # API
+    # ========================================================================
+
+    def is_dead(self, key: str, state: Optional[Dict[str, Dict]] = None) -> bool:
+        """Key bị đánh dấu chết và chưa hết ttl."""
+        entry = (state if state is not None else self._read()).get(key_id(key))
+        return bool(entry) and entry.get("status") == "dead" and time.time() - entry.get("updated", 0) < self.ttl
+
+    def filter(self, keys: List[str]) -> List[str]:
+        """
+        Bỏ các key đang chết (chỉ đọc file, không gọi API).
+        Tất cả đều chết -> trả lại đủ danh sách để call thật kiểm tra lại.
+        """
+        state = self._read()
+        alive = [key for key in keys if not self.is_dead(key, state)]
+        if keys and not alive:
+            self.logger.warning(f"All {len(keys)} keys marked dead, retrying them anyway")
+            return list(keys)
+        return alive
+
+    def mark_ok(self, key: str) -> None:
+        """Call thành công bằng key."""
+        kid = key_id(key)
+        now = time.time()
+        if now - self._ok_written.get(kid, 0.0) < self.OK_REFRESH:
+            return
+        with self._state() as state:
+            state[kid] = {"status": "ok", "updated": now}
+        self._ok_written[kid] = now
+
+    def mark_dead(self, key: str, reason: str = "") -> None:
+        """Key bị từ chối (sai key/hết tiền/bị khóa)."""
+        kid = key_id(key)
+        with self._state() as state:
+            state[kid] = {"status": "dead", "updated": time.time(), "reason": reason[:200]}
+        self._ok_written.pop(kid, None)
+        self.logger.info(f"Key {kid} marked dead for {self.ttl / 3600:.1f}h: {reason[:100]}")
+
+    def record(self, key: str, status_code: int, reason: str = "") -> None:
+        """Cập nhật từ status code của 1 call thật."""
+        if status_code == 200:
+            self.mark_ok(key)
+        elif status_code in DEAD_STATUSES:
+            self.mark_dead(key, reason or f"HTTP {status_code}")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """State hiện tại (id -> status/updated/reason), để log/debug."""
+        return self._read()
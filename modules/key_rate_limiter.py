@@ -0,0 +1,201 @@
+"""
+VE3 Tool - Rate limiter theo API key (dùng chung giữa các process)
+===================================================================
+Token bucket cho mỗi API key, state nằm trong file JSON có lock nên excel
+worker, run_excel_api và các process khác trên cùng máy chia sẻ chung
+"ngân sách" request của từng key.
+
+- acquire(): chọn key còn nhiều token nhất (key đang bị chặn thì bỏ qua),
+  hết token thì chờ đúng tới lúc key gần nhất có token lại.
+- on_rate_limited(key, retry_after): gặp 429 -> giảm rate của key một nửa,
+  chặn key tới hết Retry-After.
+- on_success(key): tăng rate từ từ (AIMD) tới max_rate.
+
+Key không được ghi ra file, chỉ ghi sha256[:12] của key.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Collection, Dict, Iterator, List, Optional, Union
+
+from modules.file_lock import lock_file, unlock_file
+from modules.utils import get_logger
+
+
+DEFAULT_STATE_FILE = Path(__file__).parent.parent / "config" / ".deepseek_rate.json"
+
+
+def key_id(api_key: str) -> str:
+    """ID ổn định của key để ghi vào state file (không lộ key)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class KeyRateLimiter:
+    """
+    Token bucket theo API key, state dùng chung qua file + lock.
+
+    Attributes:
+        rate: Rate ban đầu của mỗi key (request/giây)
+        burst: Số token tối đa (request liên tiếp không phải chờ)
+        min_rate, max_rate: Giới hạn khi rate tự điều chỉnh
+    """
+
+    # Chặn key bao lâu khi 429 không có Retry-After (giây)
+    DEFAULT_BLOCK = 5.0
+    # Chờ tối đa mỗi vòng trong acquire() trước khi đọc lại state (process khác có thể đã đổi)
+    MAX_WAIT_STEP = 2.0
+
+    def __init__(
+        self,
+        keys: List[str],
+        state_file: Union[str, Path, None] = None,
+        rate: float = 2.0,
+        burst: float = 10.0,
+        min_rate: float = 0.05,
+        max_rate: float = 20.0,
+        rate_increase: float = 0.05
+    ):
+        self.keys = list(keys)
+        self.state_file = Path(state_file) if state_file else DEFAULT_STATE_FILE
+        self.lock_path = self.state_file.with_suffix(".lock")
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.logger = get_logger("key_rate_limiter")
+        self._ids = {key: key_id(key) for key in self.keys}
+        self._thread_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, keys: List[str], config: dict) -> "KeyRateLimiter":
+        """settings.yaml: deepseek_rate_per_key, deepseek_rate_burst."""
+        return cls(
+            keys,
+            rate=float(config.get("deepseek_rate_per_key", 2.0)),
+            burst=float(config.get("deepseek_rate_burst", 10.0)),
+        )
+
+    # ========================================================================
+    # STATE FILE
+    # ========================================================================
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, Dict[str, float]]]:
+        """Đọc state dưới lock, ghi lại (atomic) khi thoát context."""
+        with self._thread_lock:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a+") as lock_fh:
+                lock_file(lock_fh)
+                try:
+                    try:
+                        with open(self.state_file, "r", encoding="utf-8") as f:
+                            state = json.load(f)
+                    except (OSError, ValueError):
+                        state = {}
+
+                    yield state
+
+                    tmp = self.state_file.with_name(self.state_file.name + f".{os.getpid()}.tmp")
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(state, f)
+                    os.replace(tmp, self.state_file)
+                finally:
+                    unlock_file(lock_fh)
+
+    def _bucket(self, state: dict, key: str, now: float) -> Dict[str, float]:
+        """Bucket của key sau khi nạp thêm token theo thời gian đã trôi qua."""
+        bucket = state.setdefault(self._ids[key], {
+            "tokens": self.burst, "rate": self.rate, "updated": now, "blocked_until": 0.0
+        })
+        elapsed = max(0.0, now - bucket["updated"])
+        bucket["tokens"] = min(self.burst, bucket["tokens"] + elapsed * bucket["rate"])
+        bucket["updated"] = now
+        return bucket
+
+    # ========================================================================
+    # API
+    # ========================================================================
+
+    def acquire(self, timeout: Optional[float] = None, exclude: Collection[str] = ()) -> Optional[str]:
+        """
+        Lấy 1 token từ key có nhiều token nhất, chờ nếu tất cả đều hết.
+
+        Args:
+            exclude: Các key không được chọn (vd: key của request đang chậm)
+
+        Returns:
+            API key, hoặc None nếu chờ quá timeout / không còn key nào ngoài exclude
+        """
+        keys = [key for key in self.keys if key not in exclude] if exclude else self.keys
+        if not keys:
+            return None
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._state() as state:
+                now = time.time()
+                best_key, best_tokens, wait = None, -1.0, float("inf")
+                for key in keys:
+                    bucket = self._bucket(state, key, now)
+                    if bucket["blocked_until"] > now:
+                        wait = min(wait, bucket["blocked_until"] - now)
+                        continue
+                    if bucket["tokens"] >= 1.0 and bucket["tokens"] > best_tokens:
+                        best_key, best_tokens = key, bucket["tokens"]
+                    else:
+                        wait = min(wait, (1.0 - bucket["tokens"]) / bucket["rate"])
+
+                if best_key is not None:
+                    state[self._ids[best_key]]["tokens"] -= 1.0
+                    return best_key
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            time.sleep(max(0.01, min(wait, self.MAX_WAIT_STEP)))
+
+    def on_success(self, key: str) -> None:
+        """Request thành công -> tăng rate của key (additive increase)."""
+        with self._state() as state:
+            bucket = self._bucket(state, key, time.time())
+            bucket["rate"] = min(self.max_rate, bucket["rate"] + self.rate_increase)
+
+    def on_rate_limited(self, key: str, retry_after: Optional[float] = None) -> None:
+        """429 -> giảm rate một nửa, chặn key tới hết Retry-After (multiplicative decrease)."""
+        with self._state() as state:
+            now = time.time()
+            bucket = self._bucket(state, key, now)
+            bucket["rate"] = max(self.min_rate, bucket["rate"] / 2)
+            bucket["tokens"] = 0.0
+            block = retry_after if retry_after is not None else self.DEFAULT_BLOCK
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + block)
+        self.logger.info(f"Key {self._ids[key]} rate limited: block {block:.1f}s, rate {bucket['rate']:.2f}/s")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """State hiện tại của các key (id -> tokens/rate/blocked_until), để log/debug."""
+        with self._state() as state:
+            now = time.time()
+            return {self._ids[key]: dict(self._bucket(state, key, now)) for key in self.keys}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Header Retry-After (số giây hoặc HTTP date) -> số giây, None nếu không có/không hợp lệ."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
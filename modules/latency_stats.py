@@ -0,0 +1,100 @@
+"""
+VE3 Tool - Latency của LLM call theo step
+==========================================
+Giữ latency của các call gần nhất theo step (step_1..step_7) để:
+- Log p50/p95/p99 cuối run_all_steps (tune timeout/hedging)
+- Tính ngưỡng hedge: call chạy quá p95 của step thì gửi thêm 1 request
+  (xem ProgressivePromptsGenerator._post_hedged)
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+class LatencyStats:
+    """
+    Latency (giây) theo step, percentile tính trên WINDOW call gần nhất.
+
+    Attributes:
+        window: Số call gần nhất giữ lại cho mỗi step
+    """
+
+    WINDOW = 200
+
+    def __init__(self, window: int = WINDOW):
+        self.window = max(1, int(window))
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _entry(self, step: str) -> Dict[str, int]:
+        entry = self._counts.get(step)
+        if entry is None:
+            entry = {"calls": 0, "hedges": 0, "hedge_wins": 0}
+            self._counts[step] = entry
+            self._samples[step] = deque(maxlen=self.window)
+        return entry
+
+    def record(self, step: str, seconds: float) -> None:
+        """1 call thành công của step."""
+        with self._lock:
+            self._entry(step)["calls"] += 1
+            self._samples[step].append(seconds)
+
+    def record_hedge(self, step: str, won: bool) -> None:
+        """Đã gửi request hedge cho 1 call (won = request hedge về trước)."""
+        with self._lock:
+            entry = self._entry(step)
+            entry["hedges"] += 1
+            if won:
+                entry["hedge_wins"] += 1
+
+    def count(self, step: str) -> int:
+        """Số mẫu đang có trong window của step."""
+        with self._lock:
+            return len(self._samples.get(step) or ())
+
+    def percentile(self, step: str, q: float) -> Optional[float]:
+        """Percentile q (0-100) của step, None nếu chưa có mẫu."""
+        with self._lock:
+            samples = sorted(self._samples.get(step) or ())
+        return _percentile(samples, q)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """step -> calls, hedges, hedge_wins, p50/p95/p99/max (giây)."""
+        with self._lock:
+            snapshot = {step: (dict(entry), sorted(self._samples[step]))
+                        for step, entry in self._counts.items()}
+        result = {}
+        for step, (entry, samples) in sorted(snapshot.items()):
+            row: Dict[str, Any] = entry
+            for q in (50, 95, 99):
+                row[f"p{q}"] = _percentile(samples, q)
+            row["max"] = samples[-1] if samples else None
+            result[step] = row
+        return result
+
+    def format_report(self) -> List[str]:
+        """Các dòng log của report (rỗng nếu chưa có call nào)."""
+        lines = []
+        for step, row in self.report().items():
+            if row["p50"] is None:
+                continue
+            line = (f"  {step}: {row['calls']} calls, p50 {row['p50']:.1f}s / p95 {row['p95']:.1f}s / "
+                    f"p99 {row['p99']:.1f}s / max {row['max']:.1f}s")
+            if row["hedges"]:
+                line += f", {row['hedges']} hedged ({row['hedge_wins']} won)"
+            lines.append(line)
+        if lines:
+            lines.insert(0, "  LLM LATENCY:")
+        return lines
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    """Percentile nearest-rank của list đã sort."""
+    if not samples:
+        return None
+    rank = math.ceil(q / 100.0 * len(samples)) - 1
+    return samples[min(len(samples) - 1, max(0, rank))]
@@ -0,0 +1,231 @@
+"""
+VE3 Tool - LLM Response Cache
+=============================
+Cache response của LLM API trên disk, key = hash(model, prompt, temperature, max_tokens[, system]).
+
+Chạy lại run_all_steps sau khi fail, hoặc fix_excel_with_api, gửi lại đúng các
+prompt đã gửi trước đó. Với cache, prompt giống hệt trả về ngay response cũ
+thay vì trả tiền + chờ API thêm lần nữa.
+
+Layout: {cache_dir}/{key[:2]}/{key}.json
+    {"created": ts, "model": ..., "usage": {...}, "response": "..."}
+
+- Entry quá ttl bị bỏ qua (và xóa).
+- Tổng dung lượng vượt max_bytes -> xóa entry ít dùng nhất (mtime cũ nhất,
+  mỗi lần hit sẽ touch mtime).
+- Ghi qua file tạm + os.replace nên nhiều process dùng chung cache an toàn.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from modules.utils import get_logger
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / "cache" / "llm_responses"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(model: str, prompt: str, temperature: float, max_tokens: int, system: str = "") -> str:
+    """Hash nội dung request (sha256 hex). system rỗng -> cùng key như trước khi có system."""
+    parts = [model, prompt, round(float(temperature), 4), int(max_tokens)]
+    if system:
+        parts.append(system)
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache response LLM trên disk, dùng chung giữa các lần chạy và các process.
+
+    Attributes:
+        cache_dir: Thư mục chứa cache
+        ttl: Thời gian sống của entry (giây), 0 = không hết hạn
+        max_bytes: Dung lượng tối đa, vượt quá thì evict entry cũ nhất
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path, None] = None,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.logger = get_logger("llm_cache")
+
+        self._lock = threading.Lock()
+        # Tổng dung lượng cache, quét thư mục ở lần put đầu tiên
+        self._total_bytes: Optional[int] = None
+
+        # Thống kê (process hiện tại)
+        self.hits = 0
+        self.misses = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        # Token của các request thật (miss) đã put vào cache
+        self.spent_tokens = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["LLMResponseCache"]:
+        """
+        Tạo cache từ settings.yaml:
+            llm_cache: true/false (mặc định true)
+            llm_cache_dir, llm_cache_ttl_hours, llm_cache_max_mb
+
+        Returns:
+            None nếu cache bị tắt
+        """
+        if not config.get("llm_cache", True):
+            return None
+        return cls(
+            cache_dir=config.get("llm_cache_dir") or None,
+            ttl=float(config.get("llm_cache_ttl_hours", DEFAULT_TTL_SECONDS / 3600)) * 3600,
+            max_bytes=int(float(config.get("llm_cache_max_mb", DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    # ========================================================================
+    # GET / PUT
+    # ========================================================================
+
+    def get(self, key: str) -> Optional[str]:
+        """Response đã cache, None nếu chưa có hoặc đã hết hạn."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # Đánh dấu vừa dùng (cho LRU eviction)
+        except OSError:
+            pass
+
+        usage = entry.get("usage") or {}
+        with self._lock:
+            self.hits += 1
+            self.saved_prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            self.saved_completion_tokens += int(usage.get("completion_tokens") or 0)
+        return entry.get("response")
+
+    def put(self, key: str, response: str, model: str = "", usage: Optional[Dict[str, Any]] = None) -> None:
+        """Lưu response (atomic). Lỗi ghi cache không làm fail request."""
+        path = self._path(key)
+        entry = {"created": time.time(), "model": model, "usage": usage or {}, "response": response}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(prefix=f".{key[:8]}.", suffix=".tmp", dir=str(path.parent))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except OSError as e:
+            self.logger.debug(f"LLM cache write failed: {e}")
+            return
+
+        with self._lock:
+            usage = usage or {}
+            self.spent_tokens += int(usage.get("prompt_tokens") or 0) + int(usage.get("completion_tokens") or 0)
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data)
+            over_budget = self.max_bytes and self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    # ========================================================================
+    # EVICTION
+    # ========================================================================
+
+    def _entries(self):
+        """(mtime, size, path) của tất cả entry."""
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _remove(self, path: Path) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def evict(self) -> int:
+        """
+        Xóa entry hết hạn, rồi xóa entry cũ nhất tới khi còn <= 90% max_bytes.
+
+        Returns:
+            Số entry đã xóa
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9 if self.max_bytes else float("inf")
+            expire_before = time.time() - self.ttl if self.ttl else 0
+
+            removed = 0
+            for mtime, size, path in entries:
+                # mtime được touch mỗi lần hit -> entry chưa hit lần nào có mtime = lúc tạo
+                if total <= target and mtime >= expire_before:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+
+            self._total_bytes = total
+
+        if removed:
+            self.logger.info(f"LLM cache: evicted {removed} entries ({total / 1024 / 1024:.1f} MB left)")
+        return removed
+
+    # ========================================================================
+    # STATS
+    # ========================================================================
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss và số token API tiết kiệm được (process hiện tại)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            saved = self.saved_prompt_tokens + self.saved_completion_tokens
+            total_tokens = saved + self.spent_tokens
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_prompt_tokens": self.saved_prompt_tokens,
+                "saved_completion_tokens": self.saved_completion_tokens,
+                "spent_tokens": self.spent_tokens,
+                # Tỉ lệ token (~chi phí API) được cache trả thay
+                "saved_pct": round(saved / total_tokens * 100, 1) if total_tokens else 0.0,
+            }
@@ -0,0 +1,124 @@
+"""
+VE3 Tool - Record/replay LLM call cho benchmark offline
+=======================================================
+Đo pipeline prompt (run_all_steps) mà không cần gọi DeepSeek thật:
+
+- record: mỗi call thành công được ghi thêm 1 dòng JSON vào fixture
+  (key của request, step, response, latency, usage, finish_reason)
+- replay: call không tới API, lấy response theo key từ fixture và giữ
+  1 slot HTTP đúng bằng latency đã ghi (nhân latency_scale) để giả lập
+  thời gian chờ + giới hạn max_parallel_api
+
+Key = llm_cache.cache_key(model, prompt, temperature, max_tokens, system),
+nên replay chỉ trúng khi prompt giống hệt lúc record. Cùng 1 key gọi nhiều
+lần -> trả lần lượt các response đã ghi (hết thì dùng lại cái cuối).
+
+settings.yaml: llm_record: <fixture.jsonl> hoặc llm_replay: <fixture.jsonl>
+(+ llm_replay_latency_scale). Xem benchmarks/bench_pipeline_replay.py.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from modules.utils import get_logger
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class LLMReplay:
+    """
+    Fixture record/replay của LLM call.
+
+    Attributes:
+        path: File fixture (JSONL)
+        mode: "record" hoặc "replay"
+        latency_scale: Hệ số nhân latency khi replay (0 = không chờ)
+    """
+
+    def __init__(self, path: Union[str, Path], mode: str, latency_scale: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"mode phải là '{RECORD}' hoặc '{REPLAY}': {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.logger = get_logger("llm_replay")
+        self._lock = threading.Lock()
+
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        if mode == REPLAY:
+            self._load()
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["LLMReplay"]:
+        """settings.yaml: llm_replay / llm_record (đường dẫn fixture), llm_replay_latency_scale."""
+        if config.get("llm_replay"):
+            return cls(config["llm_replay"], REPLAY, float(config.get("llm_replay_latency_scale", 1.0)))
+        if config.get("llm_record"):
+            return cls(config["llm_record"], RECORD)
+        return None
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Dòng cuối bị cắt (record bị kill giữa chừng)
+                self._entries.setdefault(entry["key"], []).append(entry)
+        self.logger.info(f"Loaded {sum(len(v) for v in self._entries.values())} recorded calls from {self.path}")
+
+    def record(self, key: str, step: str, content: str, latency: float,
+               usage: Optional[Dict[str, Any]] = None, finish_reason: Optional[str] = None) -> None:
+        """Ghi 1 call thành công vào fixture."""
+        if self.mode != RECORD:
+            return
+        line = json.dumps({
+            "key": key,
+            "step": step,
+            "latency": round(latency, 3),
+            "usage": usage,
+            "finish_reason": finish_reason,
+            "content": content,
+        }, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    def replay(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Entry đã ghi cho key (latency đã nhân latency_scale), None nếu fixture
+        không có request này. Không tự chờ - caller giữ slot trong "latency" giây.
+        """
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                return None
+            idx = self._served.get(key, 0)
+            self._served[key] = idx + 1
+            self.replayed += 1
+        entry = dict(entries[min(idx, len(entries) - 1)])
+        entry["latency"] = float(entry.get("latency") or 0.0) * self.latency_scale
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        """Số call đã record / replay / không có trong fixture."""
+        with self._lock:
+            return {"recorded": self.recorded, "replayed": self.replayed, "misses": self.misses}
@@ -44,13 +44,15 @@ if sys.platform == "win32":
             pass
 
 
+import contextlib
 import json
 import time
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple, Callable
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable
 from dataclasses import dataclass
 from enum import Enum
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 from modules.utils import (
     get_logger,
@@ -62,6 +64,17 @@ from modules.excel_manager import (
     Location,
     Scene
 )
+from modules.step_journal import StepJournal
+from modules.llm_cache import LLMResponseCache, cache_key
+from modules.http_pool import HttpPool
+from modules.json_stream import JsonStreamParser
+from modules.batch_sizer import AdaptiveBatchSizer
+from modules.token_usage import TokenUsage
+from modules.latency_stats import LatencyStats
+from modules.llm_replay import LLMReplay
+from modules.prompt_rules import build_id_lookup
+from modules.key_rate_limiter import KeyRateLimiter, parse_retry_after
+from modules.key_health import KeyHealthRegistry, DEAD_STATUSES
 
 
 class StepStatus(Enum):
@@ -81,6 +94,104 @@ class StepResult:
     data: Any = None
 
 
+@dataclass(frozen=True)
+class StepSpec:
+    """
+    Một step của pipeline: đọc inputs, ghi outputs (tên dữ liệu/sheet).
+    Step chỉ chạy khi mọi step tạo ra inputs của nó đã xong.
+    """
+    step_id: str                 # ID trong processing_status (step_1..step_7)
+    label: str                   # Tên trong log ("1", "1.5", ..., "5")
+    method: str                  # Method của ProgressivePromptsGenerator
+    args: Tuple[str, ...]        # Tham số lấy từ context của lần chạy
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+
+
+_STEP_ARGS = ("project_dir", "code", "workbook", "srt_entries", "txt_content")
+
+# Thứ tự khai báo = 1 thứ tự topo hợp lệ (cũng là thứ tự chạy tuần tự cũ)
+PIPELINE_STEPS: Tuple[StepSpec, ...] = (
+    StepSpec("step_1", "1", "step_analyze_story", _STEP_ARGS,
+             inputs=("srt",), outputs=("story_analysis",)),
+    StepSpec("step_2", "1.5", "step_analyze_story_segments", _STEP_ARGS,
+             inputs=("srt", "story_analysis"), outputs=("story_segments",)),
+    StepSpec("step_3", "2", "step_create_characters", _STEP_ARGS,
+             inputs=("story_analysis", "story_segments"), outputs=("characters",)),
+    # locations được lưu trong sheet characters (role="location") -> step 3 và 4
+    # cùng ghi 1 sheet, mỗi step giữ lock workbook qua đoạn kiểm tra + ghi + save
+    StepSpec("step_4", "3", "step_create_locations", _STEP_ARGS,
+             inputs=("story_analysis", "story_segments"), outputs=("locations",)),
+    StepSpec("step_5", "4", "step_create_director_plan", _STEP_ARGS[:4],
+             inputs=("srt", "story_analysis", "story_segments", "characters", "locations"),
+             outputs=("director_plan",)),
+    StepSpec("step_6", "4.5", "step_plan_scenes", _STEP_ARGS[:3],
+             inputs=("story_analysis", "story_segments", "characters", "locations", "director_plan"),
+             outputs=("scene_planning",)),
+    StepSpec("step_7", "5", "step_create_scene_prompts", _STEP_ARGS[:3],
+             inputs=("story_analysis", "characters", "locations", "director_plan", "scene_planning"),
+             outputs=("scenes",)),
+)
+
+
+def step_dependencies(steps: Tuple[StepSpec, ...] = PIPELINE_STEPS) -> Dict[str, Set[str]]:
+    """step_id -> các step_id tạo ra inputs của nó."""
+    producers = {output: spec.step_id for spec in steps for output in spec.outputs}
+    return {
+        spec.step_id: {producers[name] for name in spec.inputs if name in producers}
+        for spec in steps
+    }
+
+
+def critical_path_seconds(
+    durations: Dict[str, float],
+    deps: Dict[str, Set[str]],
+    steps: Tuple[StepSpec, ...] = PIPELINE_STEPS
+) -> float:
+    """Thời gian của đường dài nhất trong DAG (step không chạy tính 0s)."""
+    finish: Dict[str, float] = {}
+    for spec in steps:
+        start = max((finish[d] for d in deps[spec.step_id]), default=0.0)
+        finish[spec.step_id] = start + durations.get(spec.step_id, 0.0)
+    return max(finish.values(), default=0.0)
+
+
+class _SerializedWorkbook:
+    """
+    Bọc PromptWorkbook cho các step chạy song song: mỗi lời gọi method giữ
+    1 lock chung (openpyxl không thread-safe), phần gọi API vẫn chạy song song.
+    """
+
+    def __init__(self, workbook: PromptWorkbook):
+        self._workbook = workbook
+        self._lock = threading.RLock()
+
+    def locked(self) -> threading.RLock:
+        """Lock chung, giữ qua nhiều lời gọi (đoạn đọc -> kiểm tra -> ghi -> save)."""
+        return self._lock
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._workbook, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+def _workbook_section(workbook: Any):
+    """
+    Context giữ lock workbook qua cả 1 đoạn đọc-sửa-save của step.
+    Step 3 và 4 chạy song song và cùng ghi sheet characters; workbook thường
+    (gọi step trực tiếp, không qua _run_steps) thì không cần lock.
+    """
+    if isinstance(workbook, _SerializedWorkbook):
+        return workbook.locked()
+    return contextlib.nullcontext()
+
+
 def parse_srt_timestamp(ts: str) -> float:
     """
     Parse SRT timestamp to seconds.
@@ -140,6 +251,80 @@ def calc_planned_duration(srt_start, srt_end) -> float:
     return 0.0
 
 
+class _HedgeLost(Exception):
+    """Request kia của cùng 1 call đã thắng -> dừng đọc stream, trả slot."""
+
+
+class _HedgeRace:
+    """
+    Request gốc (0) và request hedge (1) của 1 lần gọi API.
+
+    Chỉ request gốc feed thẳng vào parser của caller (on_item chạy ngay khi
+    object về); request hedge feed vào parser riêng. Request nào xong trước
+    thắng, request kia bị ngắt ở dòng SSE tiếp theo.
+    """
+
+    def __init__(self, parser: Optional[JsonStreamParser]):
+        self.parser = parser
+        self.lock = threading.Lock()
+        self.winner: Optional[int] = None
+        self.states: Dict[int, Dict[str, Any]] = {}
+
+    def stream_state(self, idx: int) -> Dict[str, Any]:
+        """State của request idx (parser + content/usage/finish_reason đã nhận)."""
+        parser = self.parser if idx == 0 else JsonStreamParser()
+        state = {"content": [], "usage": None, "finish_reason": None, "parser": parser}
+        self.states[idx] = state
+        return state
+
+    def can_hedge(self) -> bool:
+        """Request gốc chưa trả object nào (đã trả -> đang stream bình thường, không hedge)."""
+        with self.lock:
+            return self.parser is None or not self.parser.items_emitted
+
+    def finish(self, idx: int, force: bool = False) -> bool:
+        """
+        Chốt request idx thắng; hedge thắng -> parser của caller nhận content của hedge.
+
+        Request gốc đã đưa object cho caller thì hedge không được thắng (feed lại
+        content của hedge sẽ đưa lại các object đó), trừ khi force (request gốc
+        đã lỗi) - khi đó on_item của caller tự bỏ object trùng.
+
+        Returns:
+            False nếu hedge bị từ chối (chờ request gốc)
+        """
+        with self.lock:
+            if idx != 0 and self.parser is not None:
+                if self.parser.items_emitted and not force:
+                    return False
+                self.parser.reset()
+                self.parser.feed("".join(self.states[idx]["content"]))
+            self.winner = idx
+            return True
+
+
+def _spawn(fn: Callable, *args) -> Future:
+    """Chạy fn trong daemon thread (request treo không giữ process lại khi thoát)."""
+    future: Future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _scene_num(value) -> Optional[int]:
+    """scene_id từ API/Excel (int, "12", 12.0) -> int, None nếu không hợp lệ."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class ProgressivePromptsGenerator:
     """
     Generator tạo prompts theo từng step.
@@ -147,6 +332,18 @@ class ProgressivePromptsGenerator:
     """
 
     DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+    DEEPSEEK_MODEL = "deepseek-chat"
+    # Số request đang bay tối đa khi settings không có max_parallel_api
+    # (= số call song song cố định của Step 1.5 trước đây)
+    DEFAULT_MAX_PARALLEL_API = 10
+    # Thread dư ngoài max_parallel_api cho các step song song: thread đang sleep
+    # backoff (429/5xx) không giữ slot HTTP, thread dư lấp slot đó
+    API_BACKOFF_WORKERS = 2
+    # Backoff tối đa cho lỗi 5xx/timeout (429 do rate limiter xử lý)
+    MAX_BACKOFF = 30
+    # Hedging: cần đủ số call của step để tin p95, và không hedge sớm hơn HEDGE_MIN_DELAY
+    HEDGE_MIN_SAMPLES = 8
+    HEDGE_MIN_DELAY = 5.0
 
     def __init__(self, config: dict):
         """
@@ -158,41 +355,77 @@ class ProgressivePromptsGenerator:
 
         # API keys
         self.deepseek_keys = [k for k in config.get("deepseek_api_keys", []) if k and k.strip()]
-        self.deepseek_index = 0
+        # Token bucket theo key, dùng chung với các process khác (xem _key_limiter)
+        self._rate_limiter: Optional[KeyRateLimiter] = None
 
         # Callback for logging
         self.log_callback: Optional[Callable] = None
 
-        # Test API key
-        if self.deepseek_keys:
-            self._test_api_keys()
+        # Thời gian lần run_all_steps gần nhất (sequential / critical_path / wall, giây)
+        self.last_schedule: Dict[str, float] = {}
+        # Thời gian từng step của lần run_all_steps gần nhất (step_id -> giây)
+        self.last_step_durations: Dict[str, float] = {}
 
-    def _test_api_keys(self):
-        """Test API keys và loại bỏ keys không hoạt động."""
-        import requests
+        # Cache response trên disk (settings: llm_cache, llm_cache_skip_steps: [step_7, ...])
+        self.llm_cache = LLMResponseCache.from_config(config)
+        self.llm_cache_skip_steps = set(config.get("llm_cache_skip_steps") or [])
+
+        # Step 7 nhận response theo stream, scene nào đóng ngoặc là parse luôn
+        # (settings: llm_stream, false = đợi cả response như cũ)
+        self.llm_stream = bool(config.get("llm_stream", True))
+
+        # Step 7 ghi Excel ngay sau mỗi batch để Chrome workers tạo ảnh song song
+        # (settings: stream_scene_batches, false = write-behind như cũ)
+        self.stream_scene_batches = bool(config.get("stream_scene_batches", True))
+
+        # Token đã dùng theo step (report cuối run_all_steps)
+        self.token_usage = TokenUsage()
+
+        # Record/replay LLM call cho benchmark offline (settings: llm_record / llm_replay)
+        self.llm_replay = LLMReplay.from_config(config)
+
+        # Latency theo step (p50/p95/p99 cuối run_all_steps). Call chạy quá
+        # percentile llm_hedge_percentile của step thì gửi thêm 1 request qua key
+        # khác, lấy request về trước (settings: llm_hedge, false = tắt)
+        self.latency = LatencyStats()
+        self.llm_hedge = bool(config.get("llm_hedge", True))
+        self.hedge_percentile = float(config.get("llm_hedge_percentile", 95))
 
-        working_keys = []
+        # Batch size theo step (step_6, step_7), tự điều chỉnh theo token đo được
+        self._batch_sizers: Dict[str, AdaptiveBatchSizer] = {}
+
+        # usage/finish_reason của API call gần nhất trong thread (xem _last_call_info)
+        self._last_call = threading.local()
+
+        # Session keep-alive theo key, tối đa max_parallel_api request cùng lúc
+        self.http = HttpPool(max_in_flight=int(config.get("max_parallel_api", self.DEFAULT_MAX_PARALLEL_API)))
+
+        # Bỏ key đã bị từ chối gần đây (registry dùng chung trên máy, không probe API)
+        self.key_health = KeyHealthRegistry.from_config(config)
+        if self.deepseek_keys:
+            self._filter_dead_keys()
+
+    def _filter_dead_keys(self):
+        """Loại key đang bị đánh dấu chết trong key_health (trạng thái lấy từ call thật)."""
+        working_keys = self.key_health.filter(self.deepseek_keys)
         for i, key in enumerate(self.deepseek_keys):
-            try:
-                headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
-                data = {
-                    "model": "deepseek-chat",
-                    "messages": [{"role": "user", "content": "Say OK"}],
-                    "max_tokens": 5
-                }
-                resp = requests.post(self.DEEPSEEK_URL, headers=headers, json=data, timeout=15)
-                if resp.status_code == 200:
-                    working_keys.append(key)
-                    self._log(f"  DeepSeek key #{i+1}: OK")
-                else:
-                    self._log(f"  DeepSeek key #{i+1}: SKIP (status {resp.status_code})")
-            except Exception as e:
-                self._log(f"  DeepSeek key #{i+1}: SKIP ({e})")
+            if key not in working_keys:
+                self._log(f"  DeepSeek key #{i+1}: SKIP (marked dead)")
 
         self.deepseek_keys = working_keys
         if not working_keys:
             self._log("  WARNING: No working API keys!")
 
+    def _key_limiter(self) -> KeyRateLimiter:
+        """Rate limiter cho danh sách key hiện tại (tạo lại nếu key bị lọc/đổi)."""
+        if self._rate_limiter is None or self._rate_limiter.keys != self.deepseek_keys:
+            self._rate_limiter = KeyRateLimiter.from_config(self.deepseek_keys, self.config)
+        return self._rate_limiter
+
+    def _api_workers(self, n_tasks: int) -> int:
+        """Số thread cho n_tasks task gọi API: slot HTTP + vài thread cho task đang sleep backoff."""
+        return max(1, min(n_tasks, self.http.max_in_flight + self.API_BACKOFF_WORKERS))
+
     def _log(self, msg: str, level: str = "INFO"):
         """Log message."""
         if self.log_callback:
@@ -200,54 +433,315 @@ class ProgressivePromptsGenerator:
         else:
             print(msg)
 
-    def _call_api(self, prompt: str, temperature: float = 0.7, max_tokens: int = 8192) -> Optional[str]:
+    def _call_api_json(self, prompt: str, temperature: float = 0.7, max_tokens: int = 8192,
+                       step: str = "", on_item: Callable[[str, Any], None] = None,
+                       system: str = "", use_cache: bool = True) -> Tuple[Optional[dict], JsonStreamParser]:
+        """
+        Gọi API với stream=True và parse JSON tăng dần (modules.json_stream).
+
+        Mỗi object trong mảng cấp 1 (vd: scenes) được đưa cho on_item ngay khi
+        đóng ngoặc. Response bị cắt vẫn giữ mọi object hoàn chỉnh, không cần
+        repair lại như _extract_json.
+
+        Returns:
+            (JSON đã parse hoặc None, parser - có first_item_at/items_emitted cho metrics)
+        """
+        parser = JsonStreamParser(on_item=on_item)
+        response = self._call_api(prompt, temperature=temperature, max_tokens=max_tokens,
+                                  step=step, parser=parser if self.llm_stream else None, system=system,
+                                  use_cache=use_cache)
+        self._last_call.received = bool(response)
+        if not response:
+            return None, parser
+        if not self.llm_stream:
+            parser.feed(response)
+        if not parser.has_data:
+            # Không có field/object nào hoàn chỉnh (response lạ) -> thử cách cũ
+            return self._extract_json(response), parser
+        return parser.result(), parser
+
+    def _call_api_validated(self, prompt: str, valid: Callable[[Optional[dict]], bool],
+                            **kwargs) -> Optional[str]:
+        """
+        _call_api cho caller có kiểm tra JSON của response. Response lấy từ llm_cache
+        mà không qua valid (lần chạy trước đã bị từ chối) -> gọi lại API với
+        use_cache=False, không lặp lại mãi response hỏng trong cache.
+        """
+        response = self._call_api(prompt, **kwargs)
+        if response and getattr(self._last_call, "cached", False) and not valid(self._extract_json(response)):
+            self._log(f"  [{kwargs.get('step') or 'api'}] Response trong cache không hợp lệ -> gọi lại API")
+            response = self._call_api(prompt, use_cache=False, **kwargs)
+        return response
+
+    def _last_call_info(self) -> Tuple[Dict[str, Any], Optional[str], bool, bool]:
+        """
+        (usage, finish_reason, cached, received) của lần _call_api_json gần nhất
+        trong thread hiện tại. usage = {} nếu response lấy từ cache hoặc API không
+        trả usage; received = False nếu không có response nào (API lỗi hết retry).
+        """
+        return (getattr(self._last_call, "usage", None) or {},
+                getattr(self._last_call, "finish_reason", None),
+                getattr(self._last_call, "cached", False),
+                getattr(self._last_call, "received", False))
+
+    def _batch_sizer(self, step: str, initial: int) -> AdaptiveBatchSizer:
+        """Batch size tự điều chỉnh của step (dùng lại giữa các lần gọi step trong cùng generator)."""
+        sizer = self._batch_sizers.get(step)
+        if sizer is None:
+            sizer = AdaptiveBatchSizer.from_config(self.config, initial=initial)
+            self._batch_sizers[step] = sizer
+        return sizer
+
+    def _on_stream_line(self, line: str, parser: JsonStreamParser, state: Dict[str, Any]) -> None:
+        """1 dòng SSE của DeepSeek (data: {...}) -> feed phần content vào parser."""
+        if not line or not line.startswith("data:"):
+            return
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            return
+        if chunk.get("usage"):
+            state["usage"] = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            if choice.get("finish_reason"):
+                state["finish_reason"] = choice["finish_reason"]
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                state["content"].append(text)
+                parser.feed(text)
+
+    def _hedge_delay(self, step: str) -> Optional[float]:
+        """Chờ bao lâu thì hedge call của step (None = không hedge)."""
+        if not self.llm_hedge or self.latency.count(step) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.HEDGE_MIN_DELAY, self.latency.percentile(step, self.hedge_percentile))
+
+    def _post_attempt(self, race: _HedgeRace, idx: int, key: str, data: dict) -> Tuple[str, Any, int]:
+        """1 request của race (stream nếu race có parser). Returns: (key, response, idx)."""
+        headers = {
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json"
+        }
+        if race.parser is None:
+            return key, self.http.post(key, self.DEEPSEEK_URL, headers=headers, json=data, timeout=120), idx
+
+        state = race.stream_state(idx)
+
+        def on_line(line: str) -> None:
+            with race.lock:
+                if race.winner is not None and race.winner != idx:
+                    raise _HedgeLost()
+                self._on_stream_line(line, state["parser"], state)
+
+        return key, self.http.post_stream(key, self.DEEPSEEK_URL, on_line,
+                                          headers=headers, json=data, timeout=120), idx
+
+    def _post_hedged(self, race: _HedgeRace, key: str, data: dict, step: str,
+                     limiter: KeyRateLimiter) -> Tuple[str, Any, int]:
+        """
+        Gửi request; quá p95 latency của step mà chưa xong (và chưa stream được
+        object nào) -> gửi thêm request giống hệt qua key khác, dùng request
+        nào về 200 trước. Không có key khác còn token rate limit thì thôi.
+
+        Returns:
+            (key, response, idx) của request được dùng
+        Raises:
+            Exception của request gốc nếu không request nào thành công
+        """
+        step = step or "api"
+        started = time.monotonic()
+        delay = self._hedge_delay(step)
+        if delay is None:
+            outcome = self._post_attempt(race, 0, key, data)
+            if outcome[1].status_code == 200:
+                self.latency.record(step, time.monotonic() - started)
+            return outcome
+
+        primary = _spawn(self._post_attempt, race, 0, key, data)
+        done, _ = wait([primary], timeout=delay)
+        hedge_key = None
+        if not done and race.can_hedge():
+            hedge_key = limiter.acquire(timeout=0, exclude={key})
+        if hedge_key is None:
+            outcome = primary.result()
+            if outcome[1].status_code == 200:
+                self.latency.record(step, time.monotonic() - started)
+            return outcome
+
+        self._log(f"  [{step}] No response after {delay:.1f}s (p{self.hedge_percentile:.0f}), hedging on another key")
+        pending = {primary, _spawn(self._post_attempt, race, 1, hedge_key, data)}
+        standby = None  # Hedge đã về 200 nhưng request gốc đang stream dở
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                hedge_key, resp, idx = future.result()
+                if resp.status_code == 429 and idx == 1:
+                    limiter.on_rate_limited(hedge_key, parse_retry_after(resp.headers.get("Retry-After")))
+                elif resp.status_code in DEAD_STATUSES and idx == 1:
+                    self.key_health.record(hedge_key, resp.status_code, resp.text[:200])
+                if resp.status_code == 200:
+                    if not race.finish(idx):
+                        standby = future
+                        continue
+                    self.latency.record(step, time.monotonic() - started)
+                    self.latency.record_hedge(step, won=idx == 1)
+                    return future.result()
+
+        if standby is not None:
+            # Request gốc lỗi giữa stream -> dùng response của hedge
+            race.finish(1, force=True)
+            self.latency.record(step, time.monotonic() - started)
+            self.latency.record_hedge(step, won=True)
+            return standby.result()
+
+        # Cả 2 đều lỗi -> xử lý lỗi của request gốc như không hedge
+        race.finish(0)
+        self.latency.record_hedge(step, won=False)
+        return primary.result()
+
+    def _replay_call(self, request_key: str, step: str, parser: Optional[JsonStreamParser]) -> Optional[str]:
+        """Response từ fixture llm_replay thay cho API (giữ 1 slot HTTP trong latency đã ghi)."""
+        entry = self.llm_replay.replay(request_key)
+        if entry is None:
+            self._log(f"  [{step or 'api'}] Replay miss (request not in fixture)", "WARN")
+            return None
+        self.http.hold(entry["latency"])
+        content = entry["content"]
+        self._last_call.usage, self._last_call.finish_reason = entry.get("usage"), entry.get("finish_reason")
+        self.token_usage.record(step, entry.get("usage"))
+        self.latency.record(step or "api", entry["latency"])
+        if parser is not None:
+            parser.feed(content)
+        return content
+
+    def _call_api(self, prompt: str, temperature: float = 0.7, max_tokens: int = 8192,
+                  step: str = "", parser: Optional[JsonStreamParser] = None,
+                  system: str = "", use_cache: bool = True) -> Optional[str]:
         """
         Gọi DeepSeek API với retry logic để tránh mid-process failures.
 
+        Prompt giống hệt (cùng temperature, max_tokens) đã gọi trước đó được trả
+        từ llm_cache, trừ khi step nằm trong llm_cache_skip_steps.
+
+        Args:
+            step: Step đang gọi (step_1..step_7), dùng cho opt-out cache + log
+            parser: Có parser -> gọi stream=True và feed từng chunk vào parser
+                    (xem _call_api_json)
+            system: Phần context dùng chung giữa các request (system message đứng
+                    trước prompt) -> provider có prefix caching không tính lại
+            use_cache: False -> không đọc llm_cache (retry vì response trước bị
+                       caller từ chối), response mới vẫn ghi đè entry cũ
+
         Returns:
             Response text hoặc None nếu fail sau tất cả retries
         """
         import requests
         import time
 
+        self._last_call.usage, self._last_call.finish_reason, self._last_call.cached = None, None, False
+        self._last_call.received = False
+        key_hash = None
+        if self.llm_cache is not None and step not in self.llm_cache_skip_steps:
+            key_hash = cache_key(self.DEEPSEEK_MODEL, prompt, temperature, max_tokens, system)
+            cached = self.llm_cache.get(key_hash) if use_cache else None
+            if cached is not None:
+                self._log(f"  [{step or 'api'}] LLM cache hit ({len(cached)} chars)")
+                self._last_call.cached = True
+                self.token_usage.record(step, None, cached=True)
+                if parser is not None:
+                    parser.feed(cached)
+                return cached
+
+        request_key = key_hash
+        if self.llm_replay is not None:
+            request_key = key_hash or cache_key(self.DEEPSEEK_MODEL, prompt, temperature, max_tokens, system)
+            if self.llm_replay.replaying:
+                return self._replay_call(request_key, step, parser)
+
         if not self.deepseek_keys:
             self._log("  ERROR: No API keys available!", "ERROR")
             return None
 
         max_retries = 15  # Increased for multiple machines sharing API
         base_delay = 3  # seconds
+        limiter = self._key_limiter()
 
         for attempt in range(max_retries):
-            key = self.deepseek_keys[self.deepseek_index % len(self.deepseek_keys)]
-            self.deepseek_index += 1
-
-            headers = {
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json"
-            }
+            # Key còn nhiều token nhất (chờ nếu tất cả key đang hết/bị chặn)
+            key = limiter.acquire()
 
+            messages = [{"role": "user", "content": prompt}]
+            if system:
+                messages.insert(0, {"role": "system", "content": system})
             data = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": prompt}],
+                "model": self.DEEPSEEK_MODEL,
+                "messages": messages,
                 "temperature": temperature,
                 "max_tokens": max_tokens
             }
 
             try:
-                resp = requests.post(self.DEEPSEEK_URL, headers=headers, json=data, timeout=120)
+                attempt_start = time.monotonic()
+                race = _HedgeRace(parser)
+                if parser is not None:
+                    parser.reset()
+                    data["stream"] = True
+                    data["stream_options"] = {"include_usage": True}
+                    try:
+                        key, resp, idx = self._post_hedged(race, key, data, step, limiter)
+                    except requests.exceptions.RequestException as e:
+                        if not parser.items_emitted:
+                            raise
+                        # Stream bị ngắt giữa chừng: giữ các object đã hoàn chỉnh, không gọi lại
+                        self._log(f"  Stream interrupted ({e}), keeping {parser.items_emitted} complete objects", "WARN")
+                        self.token_usage.record(step, None)
+                        return "".join(race.states[0]["content"])
+                    stream_state = race.states[idx]
+                else:
+                    key, resp, idx = self._post_hedged(race, key, data, step, limiter)
+
+                self.key_health.record(key, resp.status_code,
+                                       "" if resp.status_code == 200 else resp.text[:200])
 
                 if resp.status_code == 200:
                     # Success!
                     if attempt > 0:
                         self._log(f"  API success after {attempt + 1} attempts", "INFO")
-                    return resp.json()["choices"][0]["message"]["content"]
+                    limiter.on_success(key)
+                    if parser is not None:
+                        content = "".join(stream_state["content"])
+                        usage = stream_state["usage"]
+                        finish_reason = stream_state["finish_reason"]
+                        complete = parser.done and parser.has_data
+                    else:
+                        result = resp.json()
+                        content = result["choices"][0]["message"]["content"]
+                        usage = result.get("usage")
+                        finish_reason = result["choices"][0].get("finish_reason")
+                        complete = bool(content) and self._is_complete_json(content)
+                    self._last_call.usage, self._last_call.finish_reason = usage, finish_reason
+                    self.token_usage.record(step, usage)
+                    if self.llm_replay is not None and content:
+                        self.llm_replay.record(request_key, step, content, time.monotonic() - attempt_start,
+                                               usage, finish_reason)
+                    # Chỉ cache JSON hoàn chỉnh: response bị cắt (length) hoặc phải
+                    # repair mới parse được thì lần sau gọi lại API
+                    if key_hash and content and complete and finish_reason != "length":
+                        self.llm_cache.put(key_hash, content, self.DEEPSEEK_MODEL, usage)
+                    return content
 
                 elif resp.status_code == 429:
-                    # Rate limit - retry with exponential backoff
-                    delay = base_delay * (2 ** attempt)
-                    self._log(f"  Rate limit hit (429), retry {attempt + 1}/{max_retries} after {delay}s", "WARN")
+                    # Rate limit - giảm rate + chặn key theo Retry-After, lần sau acquire() tự chờ/đổi key
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                    limiter.on_rate_limited(key, retry_after)
+                    self._log(f"  Rate limit hit (429), retry {attempt + 1}/{max_retries}"
+                              f"{f' (Retry-After {retry_after:.0f}s)' if retry_after is not None else ''}", "WARN")
                     if attempt < max_retries - 1:
-                        time.sleep(delay)
                         continue
                     else:
                         self._log(f"  API error after {max_retries} retries: {resp.status_code}", "ERROR")
@@ -255,7 +749,7 @@ class ProgressivePromptsGenerator:
 
                 elif resp.status_code >= 500:
                     # Server error - retry with exponential backoff
-                    delay = base_delay * (2 ** attempt)
+                    delay = min(base_delay * (2 ** attempt), self.MAX_BACKOFF)
                     self._log(f"  Server error ({resp.status_code}), retry {attempt + 1}/{max_retries} after {delay}s", "WARN")
                     if attempt < max_retries - 1:
                         time.sleep(delay)
@@ -264,13 +758,20 @@ class ProgressivePromptsGenerator:
                         self._log(f"  API error after {max_retries} retries: {resp.status_code}", "ERROR")
                         return None
 
+                elif resp.status_code in DEAD_STATUSES and len(self.deepseek_keys) > 1:
+                    # Key bị từ chối (đã ghi vào key_health) -> bỏ key, thử key khác
+                    self.deepseek_keys = [k for k in self.deepseek_keys if k != key]
+                    limiter = self._key_limiter()
+                    self._log(f"  API key rejected ({resp.status_code}), {len(self.deepseek_keys)} keys left", "WARN")
+                    continue
+
                 else:
                     # Client error (4xx except 429) - don't retry
                     self._log(f"  API error: {resp.status_code} - {resp.text[:200]}", "ERROR")
                     return None
 
             except requests.exceptions.Timeout:
-                delay = base_delay * (2 ** attempt)
+                delay = min(base_delay * (2 ** attempt), self.MAX_BACKOFF)
                 self._log(f"  Timeout, retry {attempt + 1}/{max_retries} after {delay}s", "WARN")
                 if attempt < max_retries - 1:
                     time.sleep(delay)
@@ -280,7 +781,7 @@ class ProgressivePromptsGenerator:
                     return None
 
             except Exception as e:
-                delay = base_delay * (2 ** attempt)
+                delay = min(base_delay * (2 ** attempt), self.MAX_BACKOFF)
                 self._log(f"  API exception: {e}, retry {attempt + 1}/{max_retries} after {delay}s", "WARN")
                 if attempt < max_retries - 1:
                     time.sleep(delay)
@@ -291,6 +792,13 @@ class ProgressivePromptsGenerator:
 
         return None
 
+    @staticmethod
+    def _is_complete_json(text: str) -> bool:
+        """Response chứa 1 JSON object đóng ngoặc đầy đủ, có dữ liệu (không cần repair)."""
+        parser = JsonStreamParser()
+        parser.feed(text)
+        return parser.done and parser.has_data
+
     def _extract_json(self, text: str) -> Optional[dict]:
         """Extract JSON từ response text - với repair cho truncated JSON."""
         import re
@@ -307,6 +815,12 @@ class ProgressivePromptsGenerator:
         except:
             pass
 
+        # Parse tăng dần: bỏ qua text/``` bao quanh, JSON bị cắt giữ các object hoàn chỉnh
+        parser = JsonStreamParser()
+        parser.feed(text)
+        if parser.has_data:
+            return parser.result()
+
         # Tìm JSON trong code block
         match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
         if match:
@@ -472,14 +986,8 @@ class ProgressivePromptsGenerator:
         raw_ids = [x.strip() for x in characters_used.split(",") if x.strip()]
         normalized = []
 
-        # Build lookup (lowercase -> original)
-        id_lookup = {cid.lower(): cid for cid in valid_char_ids}
-        # Also add versions without prefix
-        for cid in list(valid_char_ids):
-            if cid.startswith("nv_"):
-                id_lookup[cid[3:].lower()] = cid  # "john" -> "nv_john"
-            if cid.startswith("loc_"):
-                id_lookup[cid[4:].lower()] = cid  # "office" -> "loc_office"
+        # Lookup (lowercase / bỏ prefix -> original), dựng 1 lần cho mỗi bộ IDs
+        id_lookup = build_id_lookup(frozenset(valid_char_ids))
 
         for raw_id in raw_ids:
             raw_lower = raw_id.lower()
@@ -605,7 +1113,8 @@ Return JSON only:
     ]
 }}"""
 
-        response = self._call_api(prompt, temperature=0.5, max_tokens=2000)
+        response = self._call_api_validated(prompt, lambda d: bool(d and len(d.get("shots") or []) >= 2),
+                                            temperature=0.5, max_tokens=2000)
         if not response:
             return None
 
@@ -720,7 +1229,7 @@ Return JSON only:
 """
 
         # Call API
-        response = self._call_api(prompt, temperature=0.5)
+        response = self._call_api_validated(prompt, bool, temperature=0.5, step="step_1")
         if not response:
             self._log("  ERROR: API call failed!", "ERROR")
             return StepResult("analyze_story", StepStatus.FAILED, "API call failed")
@@ -887,7 +1396,8 @@ Return JSON only:
 
         # PHASE 1: Call API for segment division only (no image_count)
         self._log(f"  [PHASE 1] Calling API for segment division...")
-        response = self._call_api(prompt, temperature=0.3, max_tokens=4096)
+        response = self._call_api_validated(prompt, lambda d: bool(d and "segments" in d),
+                                            temperature=0.3, max_tokens=4096, step="step_2")
         if not response:
             self._log("  ERROR: API call failed!", "ERROR")
             return StepResult("analyze_story_segments", StepStatus.FAILED, "API call failed")
@@ -991,7 +1501,8 @@ Return JSON only:
     "reasoning": "Brief explanation (optional)"
 }}}}"""
 
-            calc_response = self._call_api(calc_prompt, temperature=0.2, max_tokens=500)
+            calc_response = self._call_api_validated(calc_prompt, lambda d: bool(d and "image_count" in d),
+                                                     temperature=0.2, max_tokens=500, step="step_2")
 
             if calc_response:
                 calc_data = self._extract_json(calc_response)
@@ -1008,7 +1519,7 @@ Return JSON only:
                 return (idx, target_images, srt_count, "fallback-api")
 
         # Execute in parallel with ThreadPoolExecutor
-        max_workers = min(10, len(segments))  # Limit to 10 concurrent calls
+        max_workers = self._api_workers(len(segments))
         results = []
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -1102,7 +1613,9 @@ Return JSON only:
 }}
 """
             self._log(f"     [RETRY] Calling API for SRT {seg_start}-{seg_end} (depth={depth})...")
-            response = self._call_api(retry_prompt, temperature=0.3, max_tokens=2048)
+            # Retry vì kết quả trước bị từ chối -> không đọc cache
+            response = self._call_api(retry_prompt, temperature=0.3, max_tokens=2048, step="step_2",
+                                      use_cache=False)
 
             if response:
                 retry_data = self._extract_json(response)
@@ -1298,7 +1811,9 @@ Return JSON only:
     ]
 }}
 """
-                api_response = self._call_api(missing_prompt, temperature=0.3, max_tokens=3000)
+                # Bù phần SRT mà response trước bỏ sót -> không đọc cache
+                api_response = self._call_api(missing_prompt, temperature=0.3, max_tokens=3000, step="step_2",
+                                              use_cache=False)
 
                 api_segments = []
                 if api_response:
@@ -1463,8 +1978,11 @@ Return JSON only:
         self._log("[STEP 3/7] Tạo characters...")
         self._log("="*60)
 
-        # Check if already done
-        existing_chars = workbook.get_characters()
+        # Check if already done (locations cũng nằm trong sheet characters -> không tính)
+        existing_chars = [
+            c for c in workbook.get_characters()
+            if not (c.role == "location" or (c.id and c.id.startswith("loc_")))
+        ]
         if existing_chars and len(existing_chars) > 0:
             self._log(f"  -> Đã có {len(existing_chars)} characters, skip!")
             workbook.update_step_status("step_3", "COMPLETED", len(existing_chars), len(existing_chars), "Already done")
@@ -1569,7 +2087,8 @@ Return JSON:
 """
 
         # Call API
-        response = self._call_api(prompt, temperature=0.5)
+        response = self._call_api_validated(prompt, lambda d: bool(d and "characters" in d),
+                                            temperature=0.5, step="step_3")
         if not response:
             self._log("  ERROR: API call failed!", "ERROR")
             return StepResult("create_characters", StepStatus.FAILED, "API call failed")
@@ -1582,56 +2101,65 @@ Return JSON:
 
         # Save to Excel
         try:
-            minor_count = 0
-            char_counter = 0  # Đếm để tạo ID đơn giản: nv1, nv2, nv3...
-
-            for char_data in data["characters"]:
-                role = char_data.get("role", "supporting").lower()
-
-                # Tạo ID đơn giản và nhất quán
-                if role == "narrator" or "narrator" in char_data.get("name", "").lower():
-                    char_id = "nvc"  # Narrator luôn là nvc
-                else:
-                    char_counter += 1
-                    char_id = f"nv{char_counter}"  # nv1, nv2, nv3...
-
-                # Detect trẻ vị thành niên (dưới 18 tuổi)
-                is_minor = char_data.get("is_minor", False)
-                if isinstance(is_minor, str):
-                    is_minor = is_minor.lower() in ("true", "yes", "1")
-
-                char = Character(
-                    id=char_id,
-                    name=char_data.get("name", ""),
-                    role=char_data.get("role", "supporting"),
-                    english_prompt=char_data.get("portrait_prompt", ""),
-                    character_lock=char_data.get("character_lock", ""),
-                    vietnamese_prompt=char_data.get("vietnamese_description", ""),
-                    image_file=f"{char_id}.png",
-                    is_child=is_minor,
-                    status="skip" if is_minor else "pending",  # Skip tạo ảnh cho trẻ em
-                )
-                workbook.add_character(char)
-
-                if is_minor:
-                    minor_count += 1
-
-            workbook.save()
-            self._log(f"  -> Saved {len(data['characters'])} characters to Excel")
-            if minor_count > 0:
-                self._log(f"  -> [WARN] {minor_count} characters là trẻ em (sẽ KHÔNG tạo ảnh)")
-            for c in data["characters"][:3]:
-                minor_tag = " [MINOR]" if c.get("is_minor") else ""
-                self._log(f"     - {c.get('name', 'N/A')} ({c.get('role', 'N/A')}){minor_tag}")
-            if len(data["characters"]) > 3:
-                self._log(f"     ... và {len(data['characters']) - 3} characters khác")
+            with _workbook_section(workbook):
+                # Kiểm tra lại trong lock: đoạn kiểm tra -> ghi -> save không xen với step khác
+                if any(
+                    not (c.role == "location" or (c.id and c.id.startswith("loc_")))
+                    for c in workbook.get_characters()
+                ):
+                    self._log("  -> Characters đã được ghi trong lúc gọi API, skip!")
+                    return StepResult("create_characters", StepStatus.COMPLETED, "Already done")
+
+                minor_count = 0
+                char_counter = 0  # Đếm để tạo ID đơn giản: nv1, nv2, nv3...
+
+                for char_data in data["characters"]:
+                    role = char_data.get("role", "supporting").lower()
+
+                    # Tạo ID đơn giản và nhất quán
+                    if role == "narrator" or "narrator" in char_data.get("name", "").lower():
+                        char_id = "nvc"  # Narrator luôn là nvc
+                    else:
+                        char_counter += 1
+                        char_id = f"nv{char_counter}"  # nv1, nv2, nv3...
+
+                    # Detect trẻ vị thành niên (dưới 18 tuổi)
+                    is_minor = char_data.get("is_minor", False)
+                    if isinstance(is_minor, str):
+                        is_minor = is_minor.lower() in ("true", "yes", "1")
+
+                    char = Character(
+                        id=char_id,
+                        name=char_data.get("name", ""),
+                        role=char_data.get("role", "supporting"),
+                        english_prompt=char_data.get("portrait_prompt", ""),
+                        character_lock=char_data.get("character_lock", ""),
+                        vietnamese_prompt=char_data.get("vietnamese_description", ""),
+                        image_file=f"{char_id}.png",
+                        is_child=is_minor,
+                        status="skip" if is_minor else "pending",  # Skip tạo ảnh cho trẻ em
+                    )
+                    workbook.add_character(char)
 
-            # Update step status with duration
-            elapsed = int(time.time() - step_start)
-            workbook.update_step_status("step_3", "COMPLETED", len(data['characters']), len(data['characters']),
-                f"{elapsed}s - {len(data['characters'])} chars")
+                    if is_minor:
+                        minor_count += 1
 
-            return StepResult("create_characters", StepStatus.COMPLETED, "Success", data)
+                workbook.save()
+                self._log(f"  -> Saved {len(data['characters'])} characters to Excel")
+                if minor_count > 0:
+                    self._log(f"  -> [WARN] {minor_count} characters là trẻ em (sẽ KHÔNG tạo ảnh)")
+                for c in data["characters"][:3]:
+                    minor_tag = " [MINOR]" if c.get("is_minor") else ""
+                    self._log(f"     - {c.get('name', 'N/A')} ({c.get('role', 'N/A')}){minor_tag}")
+                if len(data["characters"]) > 3:
+                    self._log(f"     ... và {len(data['characters']) - 3} characters khác")
+
+                # Update step status with duration
+                elapsed = int(time.time() - step_start)
+                workbook.update_step_status("step_3", "COMPLETED", len(data['characters']), len(data['characters']),
+                    f"{elapsed}s - {len(data['characters'])} chars")
+
+                return StepResult("create_characters", StepStatus.COMPLETED, "Success", data)
         except Exception as e:
             self._log(f"  ERROR: Could not save to Excel: {e}", "ERROR")
             elapsed = int(time.time() - step_start)
@@ -1651,10 +2179,10 @@ Return JSON:
         txt_content: str = ""
     ) -> StepResult:
         """
-        Step 3: Tạo locations dựa trên story_analysis + characters.
+        Step 3: Tạo locations dựa trên story_analysis + story_segments.
 
-        Input: Đọc story_analysis, characters từ Excel
-        Output sheet: locations
+        Input: Đọc story_analysis, story_segments từ Excel (không phụ thuộc characters)
+        Output sheet: characters (các row role="location", id loc1, loc2...)
         """
         import time
         step_start = time.time()
@@ -1677,15 +2205,19 @@ Return JSON:
         except:
             pass
 
-        characters = workbook.get_characters()
-        char_names = [c.name for c in characters] if characters else []
-
         context_lock = story_analysis.get("context_lock", "")
         setting = story_analysis.get("setting", {})
 
         # OPTIMIZED: Tận dụng insights từ Step 1.5 (segments)
         story_segments = workbook.get_story_segments() or []
 
+        # Tên nhân vật lấy từ segments (không chờ step characters -> 2 step chạy song song được)
+        char_names = []
+        for seg in story_segments:
+            chars_involved = seg.get("characters_involved", [])
+            if isinstance(chars_involved, list):
+                char_names.extend(c for c in chars_involved if c and c not in char_names)
+
         # Build rich context từ segments thay vì đọc lại full text
         segment_insights = ""
         all_locations_hints = set()
@@ -1773,7 +2305,8 @@ Return JSON only:
 """
 
         # Call API
-        response = self._call_api(prompt, temperature=0.5)
+        response = self._call_api_validated(prompt, lambda d: bool(d and "locations" in d),
+                                            temperature=0.5, step="step_4")
         if not response:
             self._log("  ERROR: API call failed!", "ERROR")
             return StepResult("create_locations", StepStatus.FAILED, "API call failed")
@@ -1786,36 +2319,42 @@ Return JSON only:
 
         # Save to Excel - LƯU VÀO SHEET CHARACTERS với id loc_xxx
         try:
-            loc_counter = 0  # Đếm để tạo ID đơn giản: loc1, loc2, loc3...
-
-            for loc_data in data["locations"]:
-                loc_counter += 1
-                loc_id = f"loc{loc_counter}"  # Đơn giản: loc1, loc2, loc3...
-
-                # Tạo Character với role="location" thay vì Location riêng
-                loc_char = Character(
-                    id=loc_id,
-                    name=loc_data.get("name", ""),
-                    role="location",  # Đánh dấu là location
-                    english_prompt=loc_data.get("location_prompt", ""),
-                    character_lock=loc_data.get("location_lock", ""),
-                    vietnamese_prompt=loc_data.get("lighting_default", ""),  # Dùng field này cho lighting
-                    image_file=f"{loc_id}.png",
-                    status="pending",
-                )
-                workbook.add_character(loc_char)  # Thêm vào characters sheet
+            with _workbook_section(workbook):
+                # Kiểm tra lại trong lock: step 3 ghi cùng sheet characters song song
+                if workbook.get_locations():
+                    self._log("  -> Locations đã được ghi trong lúc gọi API, skip!")
+                    return StepResult("create_locations", StepStatus.COMPLETED, "Already done")
+
+                loc_counter = 0  # Đếm để tạo ID đơn giản: loc1, loc2, loc3...
+
+                for loc_data in data["locations"]:
+                    loc_counter += 1
+                    loc_id = f"loc{loc_counter}"  # Đơn giản: loc1, loc2, loc3...
+
+                    # Tạo Character với role="location" thay vì Location riêng
+                    loc_char = Character(
+                        id=loc_id,
+                        name=loc_data.get("name", ""),
+                        role="location",  # Đánh dấu là location
+                        english_prompt=loc_data.get("location_prompt", ""),
+                        character_lock=loc_data.get("location_lock", ""),
+                        vietnamese_prompt=loc_data.get("lighting_default", ""),  # Dùng field này cho lighting
+                        image_file=f"{loc_id}.png",
+                        status="pending",
+                    )
+                    workbook.add_character(loc_char)  # Thêm vào characters sheet
 
-            workbook.save()
-            self._log(f"  -> Saved {len(data['locations'])} locations to characters sheet")
-            for loc in data["locations"][:3]:
-                self._log(f"     - {loc.get('name', 'N/A')}")
+                workbook.save()
+                self._log(f"  -> Saved {len(data['locations'])} locations to characters sheet")
+                for loc in data["locations"][:3]:
+                    self._log(f"     - {loc.get('name', 'N/A')}")
 
-            # Update step status with duration
-            elapsed = int(time.time() - step_start)
-            workbook.update_step_status("step_4", "COMPLETED", len(data['locations']), len(data['locations']),
-                f"{elapsed}s - {len(data['locations'])} locs")
+                # Update step status with duration
+                elapsed = int(time.time() - step_start)
+                workbook.update_step_status("step_4", "COMPLETED", len(data['locations']), len(data['locations']),
+                    f"{elapsed}s - {len(data['locations'])} locs")
 
-            return StepResult("create_locations", StepStatus.COMPLETED, "Success", data)
+                return StepResult("create_locations", StepStatus.COMPLETED, "Success", data)
         except Exception as e:
             self._log(f"  ERROR: Could not save to Excel: {e}", "ERROR")
             elapsed = int(time.time() - step_start)
@@ -1923,7 +2462,8 @@ Return JSON only:
         # Call API with retry (simpler - 3 retries)
         MAX_RETRIES = 3
         for retry in range(MAX_RETRIES):
-            response = self._call_api(prompt, temperature=0.5, max_tokens=4096)
+            response = self._call_api(prompt, temperature=0.5, max_tokens=4096, step="step_5",
+                                      use_cache=retry == 0)
             if response:
                 data = self._extract_json(response)
                 if data and "scenes" in data:
@@ -1937,7 +2477,7 @@ Return JSON only:
 
         # Execute segments in parallel
         segment_results = {}
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
+        with ThreadPoolExecutor(max_workers=self._api_workers(len(story_segments))) as executor:
             futures = {executor.submit(process_segment, (i, seg)): i for i, seg in enumerate(story_segments)}
             for future in as_completed(futures):
                 seg_idx = futures[future]
@@ -2076,7 +2616,8 @@ Create scenes (~8s each). Return JSON:
 {{"scenes": [{{"scene_id": {scene_id_counter}, "srt_indices": [], "srt_start": "", "srt_end": "", "duration": 8, "srt_text": "", "visual_moment": "", "characters_used": "", "location_used": "", "camera": "", "lighting": ""}}]}}
 """
 
-            response = self._call_api(prompt, temperature=0.5, max_tokens=4096)
+            response = self._call_api_validated(prompt, lambda d: bool(d and "scenes" in d),
+                                                temperature=0.5, max_tokens=4096, step="step_5")
             data = self._extract_json(response) if response else None
 
             if data and "scenes" in data:
@@ -2173,7 +2714,7 @@ Create scenes (~8s each). Return JSON:
         # Process segments in PARALLEL
         all_scenes = []
         total_entries = len(srt_entries)
-        MAX_PARALLEL = self.config.get("max_parallel_api", 6)
+        MAX_PARALLEL = self.http.max_in_flight
 
         self._log(f"  Processing {len(story_segments)} segments in parallel (max {MAX_PARALLEL} concurrent)...")
 
@@ -2301,7 +2842,8 @@ Create exactly {image_count} scenes!"""
             data = None
 
             for retry in range(MAX_RETRIES):
-                response = self._call_api(prompt, temperature=0.5, max_tokens=8192)
+                response = self._call_api(prompt, temperature=0.5, max_tokens=8192, step="step_5",
+                                          use_cache=retry == 0)
                 if response:
                     data = self._extract_json(response)
                     if data and "scenes" in data:
@@ -2379,7 +2921,7 @@ Create exactly {image_count} scenes!"""
 
         # Execute segments in parallel
         segment_results = {}
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
+        with ThreadPoolExecutor(max_workers=self._api_workers(len(story_segments))) as executor:
             futures = {executor.submit(process_segment_basic, (i, seg)): i for i, seg in enumerate(story_segments)}
             for future in as_completed(futures):
                 seg_idx = futures[future]
@@ -2562,24 +3104,17 @@ Create exactly {image_count} scenes!"""
         self._log(f"  Story segments: {len(story_segments)}")
 
         # Process in batches - PARALLEL processing
+        # Batch được cắt khi có slot trống, size theo số liệu token của các batch trước
         BATCH_SIZE = 15
-        MAX_PARALLEL = self.config.get("max_parallel_api", 6)  # From settings.yaml
+        MAX_PARALLEL = self.http.max_in_flight  # max_parallel_api trong settings.yaml
         all_plans = []
+        sizer = self._batch_sizer("step_6", BATCH_SIZE)
+        remaining_scenes = list(director_plan)
+        self._log(f"  Processing {len(director_plan)} scenes, batch size {sizer.next_size()} (adaptive), "
+                  f"max {MAX_PARALLEL} concurrent")
 
-        # Prepare all batches
-        batches = []
-        for batch_start in range(0, len(director_plan), BATCH_SIZE):
-            batch = director_plan[batch_start:batch_start + BATCH_SIZE]
-            batch_num = batch_start // BATCH_SIZE + 1
-            batches.append((batch_num, batch_start, batch))
-
-        total_batches = len(batches)
-        self._log(f"  Processing {total_batches} batches in parallel (max {MAX_PARALLEL} concurrent)")
-
-        def process_single_batch(batch_info):
-            """Process a single batch - called in parallel"""
-            batch_num, batch_start, batch = batch_info
-
+        def build_batch_prompt(batch):
+            """Prompt cho 1 batch scenes."""
             # Format scenes for prompt
             scenes_text = ""
             for scene in batch:
@@ -2635,27 +3170,44 @@ Return JSON only:
 }}
 """
 
-            # Call API with retry logic
-            MAX_RETRIES = 3
-            data = None
+            return prompt
+
+        def process_single_batch(batch_info):
+            """Process a single batch - called in parallel"""
+            batch_num, batch = batch_info
+            plans = []
+            remaining = list(batch)
 
+            # Call API with retry logic (response bị cắt -> gọi tiếp cho các scene còn thiếu)
+            MAX_RETRIES = 3
             for retry in range(MAX_RETRIES):
-                response = self._call_api(prompt, temperature=0.4, max_tokens=8192)
-                if not response:
+                data, parser = self._call_api_json(build_batch_prompt(remaining), temperature=0.4,
+                                                   max_tokens=8192, step="step_6", use_cache=retry == 0)
+                usage, finish_reason, cached, received = self._last_call_info()
+                # Không có response (API lỗi) không phải bị cắt -> không tính vào batch size
+                truncated = received and (finish_reason == "length" or not parser.done)
+
+                wanted = {_scene_num(s.get("scene_id")) for s in remaining}
+                got = [p for p in ((data or {}).get("scene_plans") or [])
+                       if isinstance(p, dict) and _scene_num(p.get("scene_id")) in wanted]
+                if not cached:
+                    self.token_usage.add_items("step_6", len(got))
+                if received and not cached:
+                    sizer.record(len(remaining), len(got), int(usage.get("prompt_tokens") or 0),
+                                 int(usage.get("completion_tokens") or 0), truncated)
+
+                plans.extend(got)
+                got_ids = {_scene_num(p.get("scene_id")) for p in got}
+                remaining = [s for s in remaining if _scene_num(s.get("scene_id")) not in got_ids]
+                if not remaining:
+                    break
+                if not got:
                     time.sleep(2 ** retry)  # Exponential backoff
-                    continue
-
-                # Parse response
-                data = self._extract_json(response)
-                if data and "scene_plans" in data:
-                    break  # Success!
-                else:
-                    time.sleep(2 ** retry)
 
-            if not data or "scene_plans" not in data:
-                # Fallback: create basic plans for this batch
+            if remaining:
+                # Fallback: create basic plans for scenes API không trả về
                 fallback_plans = []
-                for scene in batch:
+                for scene in remaining:
                     fallback_plan = {
                         "scene_id": scene.get("scene_id"),
                         "artistic_intent": f"Convey the moment: {(scene.get('visual_moment') or '')[:100]}",
@@ -2667,25 +3219,40 @@ Return JSON only:
                         "key_focus": "Main subject of the scene"
                     }
                     fallback_plans.append(fallback_plan)
-                return (batch_num, fallback_plans, True)  # True = fallback used
+                # Giữ thứ tự scene như trong batch
+                order = {_scene_num(s.get("scene_id")): i for i, s in enumerate(batch)}
+                plans = sorted(plans + fallback_plans, key=lambda p: order.get(_scene_num(p.get("scene_id")), 0))
+                return (batch_num, plans, len(fallback_plans))  # > 0 = fallback used
 
-            return (batch_num, data["scene_plans"], False)  # False = API success
+            return (batch_num, plans, 0)  # 0 = API success
 
         # Execute batches in parallel
         batch_results = {}
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
-            future_to_batch = {executor.submit(process_single_batch, b): b[0] for b in batches}
+        next_batch_num = 1
+        max_in_flight = self.http.max_in_flight
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            running = {}  # future -> batch_num
+            while remaining_scenes or running:
+                # Cắt batch mới khi có slot trống -> size dùng số liệu mới nhất
+                while remaining_scenes and len(running) < max_in_flight:
+                    size = sizer.next_size()
+                    batch, remaining_scenes = remaining_scenes[:size], remaining_scenes[size:]
+                    running[executor.submit(process_single_batch, (next_batch_num, batch))] = next_batch_num
+                    next_batch_num += 1
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_num = running.pop(future)
+                    try:
+                        result_batch_num, plans, fallback_count = future.result()
+                        batch_results[result_batch_num] = plans
+                        status = f"{fallback_count} fallback" if fallback_count else "OK"
+                        self._log(f"     Batch {result_batch_num}: {len(plans)} plans [{status}]")
+                    except Exception as e:
+                        self._log(f"     Batch {batch_num} error: {e}", "ERROR")
+                        batch_results[batch_num] = []
 
-            for future in as_completed(future_to_batch):
-                batch_num = future_to_batch[future]
-                try:
-                    result_batch_num, plans, used_fallback = future.result()
-                    batch_results[result_batch_num] = plans
-                    status = "fallback" if used_fallback else "OK"
-                    self._log(f"     Batch {result_batch_num}/{total_batches}: {len(plans)} plans [{status}]")
-                except Exception as e:
-                    self._log(f"     Batch {batch_num} error: {e}", "ERROR")
-                    batch_results[batch_num] = []
+        self._log_batch_stats("step_6")
 
         # Combine results in order
         for batch_num in sorted(batch_results.keys()):
@@ -2729,6 +3296,11 @@ Return JSON only:
 
         Input: Đọc director_plan, characters, locations từ Excel
         Output: Thêm scenes vào sheet scenes
+
+        Mỗi scene đóng ngoặc trong stream được ghi ngay vào journal
+        ({code}_step_7.journal.jsonl), phần còn lại của batch (fallback, trùng)
+        khi batch xong; scenes được gộp vào workbook theo thứ tự batch. Bị kill giữa chừng thì lần
+        chạy sau gộp lại journal trước, chỉ gọi API cho scenes còn thiếu.
         """
         import time
         step_start = time.time()
@@ -2747,20 +3319,39 @@ Return JSON only:
             self._log(f"  ERROR: Could not read director plan: {e}", "ERROR")
             return StepResult("create_scene_prompts", StepStatus.FAILED, str(e))
 
-        # Check existing scenes
-        existing_scenes = workbook.get_scenes()
-        existing_ids = {s.scene_id for s in existing_scenes} if existing_scenes else set()
+        # Check existing scenes (chỉ đọc cột scene_id, không parse cả sheet)
+        existing_ids = workbook.get_scene_ids()
+
+        # Gộp lại các batch đã xong của lần chạy trước (bị dừng giữa chừng)
+        journal = StepJournal(workbook.path, "step_7")
+        recovered = [
+            Scene.from_dict(record) for record in journal.read()
+            if record.get("scene_id") not in existing_ids
+        ]
+        if recovered:
+            recovered.sort(key=lambda sc: sc.scene_id)
+            workbook.add_scenes(recovered)
+            workbook.flush()
+            existing_ids.update(sc.scene_id for sc in recovered)
+            self._log(f"  -> Recovered {len(recovered)} scenes từ journal của lần chạy trước")
 
         # Find scenes that need prompts
         pending_scenes = [s for s in director_plan if s.get("scene_id") not in existing_ids]
 
         if not pending_scenes:
-            self._log(f"  -> Đã có {len(existing_scenes)} scenes, skip!")
-            workbook.update_step_status("step_7", "COMPLETED", len(existing_scenes), len(existing_scenes), "Already done")
+            self._log(f"  -> Đã có {len(existing_ids)} scenes, skip!")
+            workbook.update_step_status("step_7", "COMPLETED", len(existing_ids), len(existing_ids), "Already done")
+            journal.clear()
             return StepResult("create_scene_prompts", StepStatus.COMPLETED, "Already done")
 
         self._log(f"  -> Cần tạo prompts cho {len(pending_scenes)} scenes...")
 
+        # Báo cho Chrome workers: step đang chạy, scenes sẽ được ghi ra theo từng batch
+        # (run_worker.has_excel_with_prompts(allow_streaming=True))
+        total_expected = len(existing_ids) + len(pending_scenes)
+        workbook.update_step_status("step_7", "IN_PROGRESS", total_expected, len(existing_ids))
+        workbook.flush()
+
         # Read context
         story_analysis = {}
         try:
@@ -2804,40 +3395,79 @@ Return JSON only:
 
         # Process in batches - PARALLEL API calls
         total_created = 0
-        MAX_PARALLEL = self.config.get("max_parallel_api", 6)  # From settings.yaml
+        MAX_PARALLEL = self.http.max_in_flight  # max_parallel_api trong settings.yaml
+
+        # Batch được cắt khi có slot trống, size theo số liệu token của các batch trước
+        sizer = self._batch_sizer("step_7", batch_size)
+        remaining_scenes = list(pending_scenes)
+        self._log(f"  Processing {len(pending_scenes)} scenes, batch size {sizer.next_size()} (adaptive), "
+                  f"max {MAX_PARALLEL} concurrent")
+
+        # Context giống hệt nhau cho mọi batch (character/location locks, context_lock,
+        # quy tắc, format) -> đặt thành system message đứng đầu request, để provider
+        # có prefix/context caching (DeepSeek) không tính lại phần này mỗi batch.
+        # Mỗi scene trong batch chỉ nhắc id + file reference.
+        char_refs_text = "\n".join(
+            f"- {cid} ({char_image_lookup.get(cid, cid + '.png')}): {lock}" for cid, lock in char_lookup.items()
+        )
+        loc_refs_text = "\n".join(
+            f"- {lid} ({loc_image_lookup.get(lid, lid + '.png')}): {lock}" for lid, lock in loc_lookup.items()
+        )
+        shared_context = f"""You create detailed image prompts for the scenes of one video.
 
-        # Prepare all batches
-        all_batches = []
-        for batch_start in range(0, len(pending_scenes), batch_size):
-            batch = pending_scenes[batch_start:batch_start + batch_size]
-            batch_num = batch_start // batch_size + 1
-            all_batches.append((batch_num, batch))
+VISUAL CONTEXT (use as prefix):
+{context_lock}
 
-        total_batches = len(all_batches)
-        self._log(f"  Processing {total_batches} batches in parallel (max {MAX_PARALLEL} concurrent)")
+CHARACTERS - id (reference file): appearance:
+{char_refs_text or 'Not specified'}
 
-        def process_single_batch(batch_info):
-            """Process a single batch - called in parallel"""
-            batch_num, batch = batch_info
+LOCATIONS - id (reference file): appearance:
+{loc_refs_text or 'Not specified'}
+
+IMPORTANT - REFERENCE FILE ANNOTATIONS:
+- Each character MUST have their reference file in parentheses: "a man (nv_john.png)"
+- Location MUST have reference file: "in the room (loc_office.png)"
+- Format: "Description of person (nv_xxx.png) doing action in location (loc_xxx.png)"
+- Character files always start with "nv_", location files always start with "loc_"
+- Describe characters and locations using their appearance above
+
+CRITICAL REQUIREMENTS:
+1. Create EXACTLY one scene prompt for EACH scene in the request
+2. Each img_prompt MUST be UNIQUE - do NOT copy/repeat prompts between scenes
+3. Each prompt should reflect the specific visual_moment and text of that scene
+4. Use the exact scene_id from the input
+
+For each scene, create:
+1. img_prompt: UNIQUE detailed image generation prompt with REFERENCE ANNOTATIONS
+2. video_prompt: Motion/video prompt if this becomes a video clip
+
+Example img_prompt:
+"Close-up shot, 85mm lens, a 35-year-old man with tired eyes (nv_john.png) sitting at a desk, looking worried, soft window light, in a modern office (loc_office.png), cinematic, 4K"
 
+Return JSON only:
+{{
+    "scenes": [
+        {{
+            "scene_id": 1,
+            "img_prompt": "UNIQUE detailed prompt with (character.png) and (location.png) annotations...",
+            "video_prompt": "camera movement and action description..."
+        }}
+    ]
+}}
+"""
+
+        def build_batch_prompt(batch):
+            """Phần riêng của 1 batch (đi sau shared_context)."""
             # Build scenes text for prompt
             scenes_text = ""
             for scene in batch:
                 char_ids = [cid.strip() for cid in (scene.get("characters_used") or "").split(",") if cid.strip()]
-                char_desc_parts = []
-                char_refs = []
-                for cid in char_ids:
-                    desc = char_lookup.get(cid, cid)
-                    img = char_image_lookup.get(cid, f"{cid}.png")
-                    char_desc_parts.append(f"{desc} ({img})")
-                    char_refs.append(img)
-                char_desc = ", ".join(char_desc_parts)
+                char_refs = [char_image_lookup.get(cid, f"{cid}.png") for cid in char_ids]
+                char_desc = ", ".join(f"{cid} ({img})" for cid, img in zip(char_ids, char_refs))
 
                 loc_id = scene.get("location_used") or ""
-                loc_desc = loc_lookup.get(loc_id, loc_id)
                 loc_img = loc_image_lookup.get(loc_id, f"{loc_id}.png") if loc_id else ""
-                if loc_desc and loc_img:
-                    loc_desc = f"{loc_desc} ({loc_img})"
+                loc_desc = f"{loc_id} ({loc_img})" if loc_id else ""
 
                 scene_id = scene.get('scene_id')
                 plan = scene_planning.get(scene_id, {})
@@ -2868,78 +3498,168 @@ Scene {scene_id}:
 
             prompt = f"""Create detailed image prompts for these {len(batch)} scenes.
 
-VISUAL CONTEXT (use as prefix):
-{context_lock}
-
-IMPORTANT - REFERENCE FILE ANNOTATIONS:
-- Each character MUST have their reference file in parentheses: "a man (nv_john.png)"
-- Location MUST have reference file: "in the room (loc_office.png)"
-- Format: "Description of person (nv_xxx.png) doing action in location (loc_xxx.png)"
-- Character files always start with "nv_", location files always start with "loc_"
-
 SCENES TO PROCESS ({len(batch)} scenes - create EXACTLY {len(batch)} prompts):
 {scenes_text}
 
-CRITICAL REQUIREMENTS:
-1. Create EXACTLY {len(batch)} scene prompts - one for EACH scene listed above
-2. Each img_prompt MUST be UNIQUE - do NOT copy/repeat prompts between scenes
-3. Each prompt should reflect the specific visual_moment and text of that scene
-4. Use the exact scene_id from the input
+Return JSON only with EXACTLY {len(batch)} scenes.
+"""
 
-For each scene, create:
-1. img_prompt: UNIQUE detailed image generation prompt with REFERENCE ANNOTATIONS
-2. video_prompt: Motion/video prompt if this becomes a video clip
+            return prompt
 
-Example img_prompt:
-"Close-up shot, 85mm lens, a 35-year-old man with tired eyes (nv_john.png) sitting at a desk, looking worried, soft window light, in a modern office (loc_office.png), cinematic, 4K"
+        def build_scene(batch, scene_data) -> Optional[Scene]:
+            """1 scene từ API -> Scene (None nếu scene_id không thuộc batch)."""
+            scene_id = int(scene_data.get("scene_id", 0))
+            original = next((s for s in batch if int(s.get("scene_id", 0)) == scene_id), None)
+            if not original:
+                return None
 
-Return JSON only with EXACTLY {len(batch)} scenes:
-{{
-    "scenes": [
-        {{
-            "scene_id": 1,
-            "img_prompt": "UNIQUE detailed prompt with (character.png) and (location.png) annotations...",
-            "video_prompt": "camera movement and action description..."
-        }}
-    ]
-}}
-"""
+            img_prompt = scene_data.get("img_prompt", "")
+
+            # Post-process: ensure reference annotations
+            char_ids = [cid.strip() for cid in (original.get("characters_used") or "").split(",") if cid.strip()]
+            loc_id = original.get("location_used") or ""
+
+            for cid in char_ids:
+                img_file = char_image_lookup.get(cid, f"{cid}.png")
+                if img_file and f"({img_file})" not in img_prompt:
+                    img_prompt = img_prompt.rstrip(". ") + f" ({img_file})."
+
+            if loc_id:
+                loc_img = loc_image_lookup.get(loc_id, f"{loc_id}.png")
+                if loc_img and f"({loc_img})" not in img_prompt:
+                    img_prompt = img_prompt.rstrip(". ") + f" (reference: {loc_img})."
+
+            # CRITICAL FIX: Parse prompt to extract ACTUAL character/location IDs used
+            # This ensures metadata matches prompt content exactly
+            import re
+
+            # Extract all character IDs from prompt (pattern: nvX.png or nv_X.png)
+            char_pattern = r'\(([nN][vV]_?\d+)\.png\)'
+            prompt_char_matches = re.findall(char_pattern, img_prompt)
+            if prompt_char_matches:
+                # Use IDs found in prompt instead of original metadata
+                char_ids = list(set(prompt_char_matches))  # unique IDs
+
+            # Extract location ID from prompt (pattern: locX.png or loc_X.png)
+            loc_pattern = r'\(([lL][oO][cC]_?\d+)\.png\)'
+            prompt_loc_matches = re.findall(loc_pattern, img_prompt)
+            if prompt_loc_matches:
+                # Use first location found in prompt
+                loc_id = prompt_loc_matches[0]
+
+            # Rebuild reference files from parsed IDs
+            ref_files = [char_image_lookup.get(cid, f"{cid}.png") for cid in char_ids]
+            if loc_id:
+                ref_files.append(loc_image_lookup.get(loc_id, f"{loc_id}.png"))
+
+            # Xác định video_note dựa trên mode và segment
+            video_note = ""
+            excel_mode = self.config.get("excel_mode", "full").lower()
+            segment_id = original.get("segment_id", 1)  # Default segment 1 nếu không có
+            if excel_mode == "basic" and segment_id > 1:
+                video_note = "SKIP"  # BASIC mode: chỉ làm video cho Segment 1
+
+            # Use parsed IDs (from prompt) for metadata accuracy
+            chars_used_str = ",".join(char_ids) if char_ids else ""
+            loc_used_str = loc_id if loc_id else ""
+
+            # v1.0.48: Calculate planned_duration from srt_start/srt_end
+            srt_start = original.get("srt_start", "")
+            srt_end = original.get("srt_end", "")
+            planned_duration = calc_planned_duration(srt_start, srt_end)
+
+            scene = Scene(
+                scene_id=scene_id,
+                srt_start=srt_start,
+                srt_end=srt_end,
+                duration=original.get("duration", 0),
+                planned_duration=planned_duration,  # v1.0.48: Calculated from SRT
+                srt_text=original.get("srt_text", ""),
+                img_prompt=img_prompt,
+                video_prompt=scene_data.get("video_prompt", ""),
+                characters_used=chars_used_str,  # Use parsed IDs from prompt
+                location_used=loc_used_str,  # Use parsed ID from prompt
+                reference_files=json.dumps(ref_files) if ref_files else "",
+                status_img="pending",
+                status_vid="pending",
+                video_note=video_note,  # GHI CHÚ VIDEO: "SKIP" hoặc ""
+                segment_id=segment_id  # SEGMENT ID từ director_plan
+            )
+            return scene
+
+        def make_on_scene(batch_num, batch, remaining, state):
+            """
+            on_item cho stream của 1 request: scene đóng ngoặc là build + journal
+            ngay (emit_scene). Scene trùng scene_id hoặc trùng img_prompt với scene
+            đã emit thì giữ lại cho build_batch_scenes xử lý cuối batch.
+            """
+            wanted = {_scene_num(s.get("scene_id")) for s in remaining}
+
+            def on_scene(key, scene_data):
+                if key != "scenes":
+                    return
+                try:
+                    scene_id = _scene_num(scene_data.get("scene_id"))
+                    prompt_key = scene_data.get("img_prompt", "")[:100]
+                    if scene_id not in wanted or scene_id in state["ids"] or prompt_key in state["prompt_keys"]:
+                        return
+                    scene = build_scene(batch, scene_data)
+                    if scene is None:
+                        return
+                    state["ids"].add(scene_id)
+                    state["prompt_keys"].add(prompt_key)
+                    emit_scene(batch_num, scene)
+                except Exception as e:
+                    self._log(f"     Batch {batch_num}: stream scene error: {e}", "WARN")
 
-            # Call API with retry
+            return on_scene
+
+        def process_single_batch(batch_info):
+            """Process a single batch - called in parallel"""
+            batch_num, batch = batch_info
+            api_scenes = []
+            remaining = list(batch)
+            state = stream_states.setdefault(batch_num, {"ids": set(), "prompt_keys": set()})
+
+            # Call API with retry (response bị cắt -> gọi tiếp cho các scene còn thiếu)
             MAX_RETRIES = 3
             for retry in range(MAX_RETRIES):
-                response = self._call_api(prompt, temperature=0.5, max_tokens=8192)
-                if response:
-                    data = self._extract_json(response)
-                    if data and "scenes" in data:
-                        return (batch_num, batch, data["scenes"], None)  # Success
+                data, parser = self._call_api_json(build_batch_prompt(remaining), temperature=0.5,
+                                                   max_tokens=8192, step="step_7", system=shared_context,
+                                                   on_item=make_on_scene(batch_num, batch, remaining, state),
+                                                   use_cache=retry == 0)
+                usage, finish_reason, cached, received = self._last_call_info()
+                # Không có response (API lỗi) không phải bị cắt -> không tính vào batch size
+                truncated = received and (finish_reason == "length" or not parser.done)
+
+                wanted = {_scene_num(s.get("scene_id")) for s in remaining}
+                got = [sc for sc in ((data or {}).get("scenes") or [])
+                       if isinstance(sc, dict) and _scene_num(sc.get("scene_id")) in wanted]
+                if not cached:
+                    self.token_usage.add_items("step_7", len(got))
+                if received and not cached:
+                    sizer.record(len(remaining), len(got), int(usage.get("prompt_tokens") or 0),
+                                 int(usage.get("completion_tokens") or 0), truncated)
+                if parser.first_item_at is not None and not api_scenes:
+                    first_scene_latency.append(parser.first_item_at - parser.started_at)
+
+                api_scenes.extend(got)
+                got_ids = {_scene_num(sc.get("scene_id")) for sc in got}
+                remaining = [s for s in remaining if _scene_num(s.get("scene_id")) not in got_ids]
+                if not remaining:
+                    break
+                if got:
+                    self._log(f"     Batch {batch_num}: got {len(api_scenes)}/{len(batch)} scenes"
+                              f"{' (truncated)' if truncated else ''}, requesting {len(remaining)} more")
+                    continue
                 time.sleep(2 ** retry)
 
+            if api_scenes:
+                return (batch_num, batch, api_scenes, None)  # Success (thiếu scene -> fallback)
             return (batch_num, batch, None, "API failed")  # Failed
 
-        # Execute batches in parallel
-        batch_results = {}
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
-            future_to_batch = {executor.submit(process_single_batch, b): b[0] for b in all_batches}
-
-            for future in as_completed(future_to_batch):
-                batch_num = future_to_batch[future]
-                try:
-                    result = future.result()
-                    batch_results[result[0]] = result  # Store by batch_num
-                    status = "OK" if result[2] else "FAILED"
-                    self._log(f"     Batch {result[0]}/{total_batches}: [{status}]")
-                except Exception as e:
-                    self._log(f"     Batch {batch_num} error: {e}", "ERROR")
-
-        # Process and save results sequentially (Excel not thread-safe)
-        for batch_num in sorted(batch_results.keys()):
-            _, batch, api_scenes, error = batch_results[batch_num]
-
-            if not api_scenes:
-                self._log(f"  Batch {batch_num}: skipped ({error})", "WARNING")
-                continue
-
+        def build_batch_scenes(batch_num, batch, api_scenes) -> List[Scene]:
+            """Validate/fallback kết quả API của 1 batch -> list Scene để lưu."""
             # Validate và tạo fallback cho scenes thiếu
             if len(api_scenes) < len(batch):
                 self._log(f"  [WARN] Batch {batch_num}: API returned {len(api_scenes)}, expected {len(batch)} - ADDING MISSING")
@@ -3029,94 +3749,121 @@ Return JSON only with EXACTLY {len(batch)} scenes:
 
                 # KHÔNG continue - tiếp tục save scenes
 
-            # Save scenes
-            try:
-                for scene_data in api_scenes:
-                    scene_id = int(scene_data.get("scene_id", 0))
-                    original = next((s for s in batch if int(s.get("scene_id", 0)) == scene_id), None)
-                    if not original:
-                        continue
+            scenes = []
+            for scene_data in api_scenes:
+                scene = build_scene(batch, scene_data)
+                if scene is not None:
+                    scenes.append(scene)
+
+            return scenes
+
+        def emit_scene(batch_num, scene):
+            """
+            Scene vừa về trong stream -> journal ngay; batch đang tới lượt gộp thì
+            ghi luôn vào workbook (write-behind), batch sau thì chờ fold_ready_batches.
+            """
+            nonlocal total_created
+            with fold_lock:
+                journal.append([scene.to_dict()], batch=batch_num)
+                if batch_num != next_to_fold:
+                    streamed_scenes.setdefault(batch_num, []).append(scene)
+                    return
+                workbook.add_scenes([scene])
+                total_created += 1
+                workbook.update_step_status("step_7", "IN_PROGRESS", total_expected,
+                    len(existing_ids) + total_created)
+                workbook.save()
 
-                    img_prompt = scene_data.get("img_prompt", "")
-
-                    # Post-process: ensure reference annotations
-                    char_ids = [cid.strip() for cid in (original.get("characters_used") or "").split(",") if cid.strip()]
-                    loc_id = original.get("location_used") or ""
-
-                    for cid in char_ids:
-                        img_file = char_image_lookup.get(cid, f"{cid}.png")
-                        if img_file and f"({img_file})" not in img_prompt:
-                            img_prompt = img_prompt.rstrip(". ") + f" ({img_file})."
-
-                    if loc_id:
-                        loc_img = loc_image_lookup.get(loc_id, f"{loc_id}.png")
-                        if loc_img and f"({loc_img})" not in img_prompt:
-                            img_prompt = img_prompt.rstrip(". ") + f" (reference: {loc_img})."
-
-                    # CRITICAL FIX: Parse prompt to extract ACTUAL character/location IDs used
-                    # This ensures metadata matches prompt content exactly
-                    import re
-
-                    # Extract all character IDs from prompt (pattern: nvX.png or nv_X.png)
-                    char_pattern = r'\(([nN][vV]_?\d+)\.png\)'
-                    prompt_char_matches = re.findall(char_pattern, img_prompt)
-                    if prompt_char_matches:
-                        # Use IDs found in prompt instead of original metadata
-                        char_ids = list(set(prompt_char_matches))  # unique IDs
-
-                    # Extract location ID from prompt (pattern: locX.png or loc_X.png)
-                    loc_pattern = r'\(([lL][oO][cC]_?\d+)\.png\)'
-                    prompt_loc_matches = re.findall(loc_pattern, img_prompt)
-                    if prompt_loc_matches:
-                        # Use first location found in prompt
-                        loc_id = prompt_loc_matches[0]
-
-                    # Rebuild reference files from parsed IDs
-                    ref_files = [char_image_lookup.get(cid, f"{cid}.png") for cid in char_ids]
-                    if loc_id:
-                        ref_files.append(loc_image_lookup.get(loc_id, f"{loc_id}.png"))
-
-                    # Xác định video_note dựa trên mode và segment
-                    video_note = ""
-                    excel_mode = self.config.get("excel_mode", "full").lower()
-                    segment_id = original.get("segment_id", 1)  # Default segment 1 nếu không có
-                    if excel_mode == "basic" and segment_id > 1:
-                        video_note = "SKIP"  # BASIC mode: chỉ làm video cho Segment 1
-
-                    # Use parsed IDs (from prompt) for metadata accuracy
-                    chars_used_str = ",".join(char_ids) if char_ids else ""
-                    loc_used_str = loc_id if loc_id else ""
-
-                    # v1.0.48: Calculate planned_duration from srt_start/srt_end
-                    srt_start = original.get("srt_start", "")
-                    srt_end = original.get("srt_end", "")
-                    planned_duration = calc_planned_duration(srt_start, srt_end)
-
-                    scene = Scene(
-                        scene_id=scene_id,
-                        srt_start=srt_start,
-                        srt_end=srt_end,
-                        duration=original.get("duration", 0),
-                        planned_duration=planned_duration,  # v1.0.48: Calculated from SRT
-                        srt_text=original.get("srt_text", ""),
-                        img_prompt=img_prompt,
-                        video_prompt=scene_data.get("video_prompt", ""),
-                        characters_used=chars_used_str,  # Use parsed IDs from prompt
-                        location_used=loc_used_str,  # Use parsed ID from prompt
-                        reference_files=json.dumps(ref_files) if ref_files else "",
-                        status_img="pending",
-                        status_vid="pending",
-                        video_note=video_note,  # GHI CHÚ VIDEO: "SKIP" hoặc ""
-                        segment_id=segment_id  # SEGMENT ID từ director_plan
-                    )
-                    workbook.add_scene(scene)
-                    total_created += 1
+        def fold_ready_batches():
+            """Gộp các batch đã xong vào workbook theo đúng thứ tự batch_num."""
+            nonlocal next_to_fold, total_created
+            with fold_lock:
+                folded = False
+                while next_to_fold in finished_batches:
+                    scenes = streamed_scenes.pop(next_to_fold, []) + finished_batches.pop(next_to_fold)
+                    if scenes:
+                        workbook.add_scenes(scenes)
+                        total_created += len(scenes)
+                        folded = True
+                    next_to_fold += 1
+
+                # Batch vừa tới lượt có thể đã stream được vài scene
+                head = streamed_scenes.pop(next_to_fold, None)
+                if head:
+                    workbook.add_scenes(head)
+                    total_created += len(head)
+                    folded = True
+
+                if folded:
+                    workbook.update_step_status("step_7", "IN_PROGRESS", total_expected,
+                        len(existing_ids) + total_created)
+                    if self.stream_scene_batches:
+                        # Ghi ngay để Chrome workers tạo ảnh cho batch này, không đợi hết step
+                        workbook.flush()
+                    else:
+                        workbook.save()  # write-behind: chỉ ghi file theo flush_interval
+
+        # Execute batches in parallel, lưu từng batch ngay khi xong
+        first_scene_latency = []  # Giây từ lúc gửi request tới khi scene đầu tiên parse xong
+        finished_batches = {}  # batch_num -> List[Scene] (đã journal, chờ gộp)
+        streamed_scenes = {}  # batch_num -> List[Scene] đã về trong stream (đã journal, chờ gộp)
+        stream_states = {}  # batch_num -> {"ids", "prompt_keys"} của scene đã emit
+        fold_lock = threading.Lock()  # journal + gộp workbook (main thread và stream của các batch)
+        next_to_fold = 1
+        next_batch_num = 1
+        max_in_flight = self.http.max_in_flight
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            running = {}  # future -> (batch_num, số scenes)
+            while remaining_scenes or running:
+                # Cắt batch mới khi có slot trống -> size dùng số liệu mới nhất
+                while remaining_scenes and len(running) < max_in_flight:
+                    size = sizer.next_size()
+                    batch, remaining_scenes = remaining_scenes[:size], remaining_scenes[size:]
+                    future = executor.submit(process_single_batch, (next_batch_num, batch))
+                    running[future] = (next_batch_num, len(batch))
+                    next_batch_num += 1
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_num, batch_len = running.pop(future)
+                    scenes = []
+                    try:
+                        _, batch, api_scenes, error = future.result()
+                        status = "OK" if api_scenes else "FAILED"
+                        self._log(f"     Batch {batch_num} ({batch_len} scenes): [{status}]")
+
+                        if api_scenes:
+                            # Scene đã emit trong stream thì đã journal, chỉ còn scene bị giữ lại/fallback
+                            emitted = stream_states.get(batch_num, {}).get("ids", set())
+                            scenes = [sc for sc in build_batch_scenes(batch_num, batch, api_scenes)
+                                      if sc.scene_id not in emitted]
+                            # Durable trước, gộp vào Excel sau
+                            if scenes:
+                                with fold_lock:
+                                    journal.append([sc.to_dict() for sc in scenes], batch=batch_num)
+                        else:
+                            self._log(f"  Batch {batch_num}: skipped ({error})", "WARNING")
+                    except Exception as e:
+                        self._log(f"     Batch {batch_num} error: {e}", "ERROR")
 
-                workbook.save()
-            except Exception as e:
-                self._log(f"  Batch {batch_num} save error: {e}", "ERROR")
+                    finished_batches[batch_num] = scenes
+                    try:
+                        fold_ready_batches()
+                    except Exception as e:
+                        self._log(f"  Batch {batch_num} save error: {e}", "ERROR")
+
+        # Ghi chắc chắn vào Excel rồi mới bỏ journal
+        # (còn batch chưa gộp được -> giữ journal cho lần chạy sau)
+        workbook.flush()
+        if not finished_batches and not streamed_scenes:
+            journal.clear()
 
         self._log(f"\n  -> Total: Created {total_created} scene prompts")
+        if first_scene_latency:
+            first_scene_latency.sort()
+            self._log(f"  -> Time to first scene: min {first_scene_latency[0]:.1f}s, "
+                      f"median {first_scene_latency[len(first_scene_latency) // 2]:.1f}s")
+        self._log_batch_stats("step_7")
 
         elapsed = int(time.time() - step_start)
         if total_created > 0:
@@ -3179,52 +3926,108 @@ Return JSON only with EXACTLY {len(batch)} scenes:
             except:
                 pass
 
-        # Load/create workbook
-        workbook = PromptWorkbook(excel_path).load_or_create()
-
-        # Run steps
-        all_success = True
-
-        # Step 1: Analyze story
-        result = self.step_analyze_story(project_dir, code, workbook, srt_entries, txt_content)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 1 FAILED! Stopping.", "ERROR")
-            return False
-
-        # Step 1.5: Analyze story segments (nội dung con)
-        result = self.step_analyze_story_segments(project_dir, code, workbook, srt_entries, txt_content)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 1.5 FAILED! Stopping.", "ERROR")
-            return False
-
-        # Step 2: Create characters
-        result = self.step_create_characters(project_dir, code, workbook, srt_entries, txt_content)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 2 FAILED! Stopping.", "ERROR")
-            return False
-
-        # Step 3: Create locations
-        result = self.step_create_locations(project_dir, code, workbook, srt_entries, txt_content)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 3 FAILED! Stopping.", "ERROR")
-            return False
-
-        # Step 4: Create director plan (sử dụng segments để guide số lượng scenes)
-        result = self.step_create_director_plan(project_dir, code, workbook, srt_entries)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 4 FAILED! Stopping.", "ERROR")
-            return False
+        # Load/create workbook (write-behind: gộp nhiều lần save, flush khi kết thúc step)
+        workbook = PromptWorkbook(
+            excel_path,
+            write_behind=True,
+            flush_interval=float(self.config.get("excel_flush_interval", PromptWorkbook.DEFAULT_FLUSH_INTERVAL))
+        ).load_or_create()
 
-        # Step 4.5: Lên kế hoạch chi tiết từng scene (artistic planning)
-        result = self.step_plan_scenes(project_dir, code, workbook)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 4.5 FAILED! Stopping.", "ERROR")
-            return False
+        try:
+            return self._run_steps(project_dir, code, workbook, srt_entries, txt_content)
+        finally:
+            workbook.close()
+            self._log_cache_stats()
+            for line in self.token_usage.format_report() + self.latency.format_report():
+                self._log(line)
+
+    def _log_schedule(self, durations: Dict[str, float], deps: Dict[str, Set[str]], wall: float) -> None:
+        """Log thời gian chạy tuần tự (tổng các step) so với critical path của DAG."""
+        sequential = sum(durations.values())
+        critical = critical_path_seconds(durations, deps)
+        self.last_schedule = {"sequential": sequential, "critical_path": critical, "wall": wall}
+        self.last_step_durations = dict(durations)
+        if sequential >= 1:
+            saved_pct = (1 - critical / sequential) * 100
+            self._log(f"  Schedule: sequential {sequential:.0f}s -> critical path {critical:.0f}s "
+                      f"(-{saved_pct:.0f}%), wall {wall:.0f}s")
+
+    def _log_cache_stats(self) -> None:
+        """Log hit/miss của llm_cache (bao nhiêu % token API được cache trả thay)."""
+        if self.llm_cache is None:
+            return
+        stats = self.llm_cache.stats()
+        if stats["hits"] or stats["misses"]:
+            saved = stats["saved_prompt_tokens"] + stats["saved_completion_tokens"]
+            self._log(f"  LLM cache: {stats['hits']} hits / {stats['misses']} misses "
+                      f"(hit rate {stats['hit_rate'] * 100:.0f}%), saved {saved} tokens "
+                      f"= {stats['saved_pct']}% of API tokens")
+
+    def _log_batch_stats(self, step: str) -> None:
+        """Log số scenes / API call và batch size hiện tại của step."""
+        sizer = self._batch_sizers.get(step)
+        if sizer is None:
+            return
+        stats = sizer.stats()
+        if stats["calls"]:
+            self._log(f"  -> Scenes/API call: {stats['items_per_call']} ({stats['calls']} calls, "
+                      f"{stats['truncations']} truncated), ~{stats['output_tokens_per_item']:.0f} "
+                      f"output tokens/scene, next batch size {stats['size']}")
+
+    def _run_steps(
+        self,
+        project_dir: Path,
+        code: str,
+        workbook: PromptWorkbook,
+        srt_entries: list,
+        txt_content: str
+    ) -> bool:
+        """
+        Chạy các steps theo PIPELINE_STEPS: step nào đủ inputs thì chạy, các
+        step độc lập (characters + locations) chạy song song. Mỗi step vẫn tự
+        skip nếu đã xong (resume theo processing_status như cũ).
+        """
+        context = {
+            "project_dir": project_dir,
+            "code": code,
+            "workbook": _SerializedWorkbook(workbook),
+            "srt_entries": srt_entries,
+            "txt_content": txt_content,
+        }
+        deps = step_dependencies()
+        pending = list(PIPELINE_STEPS)
+        running = {}
+        completed: Set[str] = set()
+        durations: Dict[str, float] = {}
+        failed = False
+        run_start = time.time()
+
+        def run_step(spec: StepSpec) -> Tuple[StepResult, float]:
+            step_start = time.time()
+            result = getattr(self, spec.method)(*(context[name] for name in spec.args))
+            return result, time.time() - step_start
+
+        with ThreadPoolExecutor(max_workers=len(PIPELINE_STEPS)) as executor:
+            while pending or running:
+                if not failed:
+                    for spec in [s for s in pending if deps[s.step_id] <= completed]:
+                        pending.remove(spec)
+                        running[executor.submit(run_step, spec)] = spec
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    spec = running.pop(future)
+                    result, durations[spec.step_id] = future.result()
+                    if result.status == StepStatus.FAILED:
+                        self._log(f"Step {spec.label} FAILED! Stopping.", "ERROR")
+                        failed = True
+                    else:
+                        completed.add(spec.step_id)
 
-        # Step 5: Create scene prompts (đọc từ scene planning)
-        result = self.step_create_scene_prompts(project_dir, code, workbook)
-        if result.status == StepStatus.FAILED:
-            self._log("Step 5 FAILED!", "ERROR")
+        self._log_schedule(durations, deps, time.time() - run_start)
+        if failed:
             return False
 
         self._log("\n" + "="*70)
@@ -0,0 +1,306 @@
+"""
+VE3 Tool - Quy tắc hậu kiểm img_prompt (compile 1 lần)
+=======================================================
+Các heuristic của PromptGenerator chạy cho mọi scene (hàng trăm - hàng nghìn
+scene mỗi project):
+- looks_like_narration: visual_moment có phải lời kể/thoại không
+- clean_narration: bỏ lời kể/thoại bị AI chép vào img_prompt
+- fix_location: hành động (nằm trên giường...) không khớp địa điểm (hallway...)
+
+Trước đây mỗi lần gọi lại dựng list điều kiện, lower() text nhiều lần và
+re.compile pattern. PromptRules compile mỗi nhóm từ khóa thành 1 regex
+(alternation) ngay khi tạo, nên mỗi scene chỉ cần 1 lần lower() và 1 lần
+search cho mỗi nhóm. Các mẫu câu cần bỏ vẫn sub lần lượt như cũ (kết quả
+giống hệt), regex gộp chỉ để bỏ qua nhanh prompt không có mẫu nào.
+looks_like_narration_many kiểm tra cả batch visual_moment 1 lần.
+
+Quy tắc mặc định nằm trong DEFAULT_RULES; config/prompts.yaml có thể ghi đè
+từng nhóm qua section prompt_rules (cùng cấu trúc).
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Sequence, Tuple
+
+DEFAULT_RULES: Dict[str, Any] = {
+    # Text bắt đầu bằng (sau khi lower + strip)
+    "narration_prefixes": ["i ", "i'", "my ", "we ", "she ", "he ", "they "],
+    # Text chứa (không phân biệt hoa thường)
+    "narration_keywords": [
+        '"', "said", "told", "asked",
+        "i was", "i had", "i remember", "by the time", "years old",
+        "subscribe", "like button", "comment",
+    ],
+    # Câu lời kể/thoại cần bỏ khỏi img_prompt (regex)
+    "narration_patterns": [
+        r'By the time I was \d+ years old[^.]*\.?',
+        r'I had saved[^.]*\.?',
+        r'I decided to[^.]*\.?',
+        r'It cost me[^.]*\.?',
+        r'I remember[^.]*\.?',
+        r'She (told|said|asked)[^.]*\.?',
+        r'He (told|said|asked)[^.]*\.?',
+        r'"[^"]*"',
+    ],
+    # Hành động -> địa điểm sai -> địa điểm đúng
+    "action_locations": [
+        {
+            "actions": ["lying in bed", "on the bed", "in bed", "bedroom", "on bed", "fell off the bed", "jumped up from bed"],
+            "wrong_locations": ["hallway", "corridor", "street", "outdoor", "kitchen", "office", "restaurant"],
+            "correct_location": "master bedroom, king-sized bed with silk sheets, elegant furniture, soft ambient lighting",
+        },
+        {
+            "actions": ["cooking", "in the kitchen", "at the stove", "preparing food"],
+            "wrong_locations": ["bedroom", "hallway", "office", "outdoor", "street"],
+            "correct_location": "modern kitchen interior, stove, countertops, cooking utensils, warm lighting",
+        },
+        {
+            "actions": ["shower", "bathtub", "bathroom", "brushing teeth", "mirror"],
+            "wrong_locations": ["bedroom", "kitchen", "office", "outdoor", "hallway"],
+            "correct_location": "elegant bathroom, marble tiles, mirror, soft lighting",
+        },
+        {
+            "actions": ["walking on street", "driving", "in the car", "outdoor", "park", "garden"],
+            "wrong_locations": ["bedroom", "kitchen", "bathroom", "office interior"],
+            "correct_location": "outdoor scene, natural daylight",
+        },
+        {
+            "actions": ["dining", "at restaurant", "eating dinner", "at the table"],
+            "wrong_locations": ["bedroom", "bathroom", "street", "office"],
+            "correct_location": "elegant restaurant interior, dining tables, ambient lighting",
+        },
+    ],
+    # Từ trong SRT -> địa điểm (thứ tự = ưu tiên)
+    "srt_location_hints": [
+        ["bed", "bedroom"],
+        ["bedroom", "bedroom"],
+        ["master bedroom", "master bedroom"],
+        ["kitchen", "kitchen"],
+        ["bathroom", "bathroom"],
+        ["restaurant", "restaurant"],
+        ["office", "office"],
+        ["car", "car interior"],
+        ["street", "street"],
+        ["courthouse", "courthouse"],
+        ["hospital", "hospital"],
+    ],
+    # Địa điểm thay thế chi tiết hơn khi SRT nói rõ địa điểm
+    "srt_location_overrides": {
+        "bedroom": "master bedroom, king-sized bed with silk sheets, elegant nightstands, soft warm lighting",
+        "master bedroom": "master bedroom, king-sized bed with silk sheets, elegant nightstands, soft warm lighting",
+        "kitchen": "modern kitchen, marble countertops, stainless steel appliances, warm lighting",
+    },
+}
+
+_MULTI_DOTS = re.compile(r'\.\.+')
+_SPACES = re.compile(r'\s+')
+_UPPER_ESCAPE = re.compile(r'\\[A-Z]')
+
+
+def _combined(patterns: Sequence[str], flags: int = 0) -> Optional[Pattern]:
+    """1 regex khớp khi bất kỳ pattern nào khớp."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in patterns), flags)
+
+
+def _any_of(words: Sequence[str]) -> Optional[Pattern]:
+    """1 regex khớp bất kỳ từ nào trong words, dùng trên text đã lower()."""
+    if not words:
+        return None
+    return re.compile("|".join(re.escape(w.lower()) for w in words))
+
+
+class _LocationRule:
+    __slots__ = ("first_action", "actions", "wrong_locations", "wrong_any", "correct_location")
+
+    def __init__(self, rule: Dict[str, Any]):
+        self.first_action = rule["actions"][0]
+        self.actions = _any_of(rule["actions"])
+        self.wrong_locations = [loc.lower() for loc in rule["wrong_locations"]]
+        self.wrong_any = _any_of(self.wrong_locations)
+        self.correct_location = rule["correct_location"]
+
+
+class PromptRules:
+    """
+    Quy tắc đã compile. Dùng get_prompt_rules() để lấy instance dùng chung.
+
+    Attributes:
+        rules: Quy tắc gốc (DEFAULT_RULES + phần ghi đè)
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        r = self.rules
+
+        self._narration_prefixes = tuple(p.lower() for p in r["narration_prefixes"])
+        self._narration_any = _any_of(r["narration_keywords"])
+        self._clean_patterns = [re.compile(p, re.IGNORECASE) for p in r["narration_patterns"]]
+        self._clean_any = _combined(r["narration_patterns"], re.IGNORECASE)
+        # Regex gộp trên text đã lower() (không IGNORECASE nhanh hơn nhiều), chỉ dùng
+        # cho text ASCII và khi pattern lower() được (không có escape hoa như \S, \W)
+        self._clean_any_lower = None
+        if not any(_UPPER_ESCAPE.search(p) for p in r["narration_patterns"]):
+            self._clean_any_lower = _combined([p.lower() for p in r["narration_patterns"]])
+
+        self._location_rules = [_LocationRule(rule) for rule in r["action_locations"]]
+        self._any_action = _any_of([a for rule in r["action_locations"] for a in rule["actions"]])
+        self._any_wrong = _any_of([w for rule in r["action_locations"] for w in rule["wrong_locations"]])
+        self._srt_hints = [(hint.lower(), loc) for hint, loc in r["srt_location_hints"]]
+        self._srt_overrides = dict(r["srt_location_overrides"])
+        self._sentence_patterns: Dict[str, Pattern] = {}
+
+    # ========================================================================
+    # NARRATION
+    # ========================================================================
+
+    def looks_like_narration(self, text: str) -> bool:
+        """Text giống lời kể/thoại (không phải mô tả hình ảnh). Rỗng -> True."""
+        if not text:
+            return True
+        text_lower = text.lower().strip()
+        if text_lower.startswith(self._narration_prefixes):
+            return True
+        return bool(self._narration_any and self._narration_any.search(text_lower))
+
+    def looks_like_narration_many(self, texts: Sequence[str]) -> List[bool]:
+        return [self.looks_like_narration(text) for text in texts]
+
+    def _sentence_pattern(self, phrase: str) -> Pattern:
+        """
+        Câu (giữa 2 dấu chấm) chứa phrase. Giống r'[^.]*phrase[^.]*\.?' cũ nhưng
+        chỉ thử bắt đầu ở đầu câu (match nào cũng bắt đầu ở đó), tránh quét lại
+        từng vị trí trong câu.
+        """
+        pattern = self._sentence_patterns.get(phrase)
+        if pattern is None:
+            pattern = re.compile(r'(?<![^.])[^.]*' + re.escape(phrase) + r'[^.]*\.?', re.IGNORECASE)
+            if len(self._sentence_patterns) < 4096:
+                self._sentence_patterns[phrase] = pattern
+        return pattern
+
+    def _has_clean_pattern(self, img_prompt: str) -> bool:
+        if self._clean_any is None:
+            return False
+        if self._clean_any_lower is not None and img_prompt.isascii():
+            return self._clean_any_lower.search(img_prompt.lower()) is not None
+        return self._clean_any.search(img_prompt) is not None
+
+    def clean_narration(self, img_prompt: str, scene_text: str) -> Tuple[str, List[str]]:
+        """
+        Bỏ lời kể/thoại khỏi img_prompt.
+
+        Returns:
+            (img_prompt đã làm sạch, các cụm 5 từ của scene_text đã bị bỏ)
+        """
+        if not img_prompt or not scene_text:
+            return img_prompt, []
+
+        removed = []
+        # 1. Câu chứa 5+ từ liên tiếp của lời kể
+        words = scene_text.split()
+        if len(words) >= 5:
+            words_lower = scene_text.lower().split()
+            prompt_lower = img_prompt.lower()
+            for i in range(len(words) - 4):
+                if " ".join(words_lower[i:i + 5]) in prompt_lower:
+                    phrase = " ".join(words[i:i + 5])
+                    img_prompt = self._sentence_pattern(phrase).sub('', img_prompt)
+                    prompt_lower = img_prompt.lower()
+                    removed.append(phrase)
+
+        # 2. Các mẫu câu lời kể/thoại thường gặp (đa số prompt không có mẫu nào)
+        if self._has_clean_pattern(img_prompt):
+            for pattern in self._clean_patterns:
+                img_prompt = pattern.sub('', img_prompt)
+
+        # 3. Dọn dấu chấm/khoảng trắng thừa
+        img_prompt = _MULTI_DOTS.sub('.', img_prompt)
+        img_prompt = _SPACES.sub(' ', img_prompt)
+        img_prompt = img_prompt.strip().strip('.')
+        return img_prompt, removed
+
+    # ========================================================================
+    # LOCATION
+    # ========================================================================
+
+    def srt_location(self, srt_text: str) -> Optional[str]:
+        """Địa điểm SRT nhắc tới (theo thứ tự ưu tiên của srt_location_hints)."""
+        srt_lower = srt_text.lower() if srt_text else ""
+        for hint, loc in self._srt_hints:
+            if hint in srt_lower:
+                return loc
+        return None
+
+    def find_location_mismatch(self, img_prompt: str) -> Optional[Tuple[_LocationRule, str]]:
+        """(rule, địa điểm sai) đầu tiên: prompt có hành động của rule nhưng có địa điểm sai."""
+        prompt_lower = img_prompt.lower()
+        # Đa số prompt không có hành động/địa điểm nào trong quy tắc -> 2 lần search
+        if not (self._any_action and self._any_action.search(prompt_lower)
+                and self._any_wrong.search(prompt_lower)):
+            return None
+        for rule in self._location_rules:
+            if rule.actions.search(prompt_lower) and rule.wrong_any.search(prompt_lower):
+                for wrong_loc in rule.wrong_locations:
+                    if wrong_loc in prompt_lower:
+                        return rule, wrong_loc
+        return None
+
+    def fix_location(self, img_prompt: str, srt_text: str) -> Tuple[str, Optional[str]]:
+        """
+        Sửa địa điểm không khớp hành động trong img_prompt.
+
+        Returns:
+            (img_prompt đã sửa, mô tả lỗi hoặc None nếu không sửa gì)
+        """
+        if not img_prompt:
+            return img_prompt, None
+
+        mismatch = self.find_location_mismatch(img_prompt)
+        if mismatch is None:
+            return img_prompt, None
+        rule, wrong_loc = mismatch
+
+        # SRT nói rõ địa điểm -> dùng mô tả chi tiết hơn (chỉ tính khi có lỗi)
+        correct_loc = self._srt_overrides.get(self.srt_location(srt_text), rule.correct_location)
+
+        # Thay cả câu chứa địa điểm sai
+        fixed = self._sentence_pattern(wrong_loc).sub(correct_loc + '. ', img_prompt)
+        fixed = _SPACES.sub(' ', fixed)
+        fixed = _MULTI_DOTS.sub('.', fixed)
+        return fixed.strip(), f"action implies {rule.first_action} but found '{wrong_loc}'"
+
+
+_SHARED: Tuple[int, Optional[PromptRules]] = (0, None)
+
+
+def get_prompt_rules() -> PromptRules:
+    """
+    Instance dùng chung (ghi đè từ prompts.yaml). Compile 1 lần, compile lại
+    khi prompts_loader reload prompts.yaml.
+    """
+    global _SHARED
+    from modules.prompts_loader import generation, get_prompt_rules_config
+    current = generation()
+    gen, rules = _SHARED
+    if rules is None or gen != current:
+        rules = PromptRules(get_prompt_rules_config())
+        _SHARED = (current, rules)
+    return rules
+
+
+@lru_cache(maxsize=64)
+def build_id_lookup(valid_ids: FrozenSet[str]) -> Dict[str, str]:
+    """
+    lowercase id / id bỏ tiền tố -> id chuẩn: {"nv_john", "loc_office"} ->
+    {"nv_john": "nv_john", "john": "nv_john", "loc_office": ..., "office": ...}
+    """
+    lookup = {cid.lower(): cid for cid in valid_ids}
+    for cid in valid_ids:
+        if cid.startswith("nv_"):
+            lookup[cid[3:].lower()] = cid
+        if cid.startswith("loc_"):
+            lookup[cid[4:].lower()] = cid
+    return lookup
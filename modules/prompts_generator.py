@@ -44,11 +44,16 @@ from modules.excel_manager import (
     Location,
     Scene
 )
+from modules.ai_providers import MultiAIClient as ProviderClient
+from modules.json_stream import JsonStreamParser
+from modules.key_health import KeyHealthRegistry
+from modules.prompt_rules import get_prompt_rules
 from modules.prompts_loader import (
     get_analyze_story_prompt,
     get_generate_scenes_prompt,
     get_smart_divide_scenes_prompt,
-    get_global_style
+    get_global_style,
+    get_template
 )
 
 
@@ -59,7 +64,8 @@ from modules.prompts_loader import (
 class MultiAIClient:
     """
     Client hỗ trợ DeepSeek API.
-    Tự động test và loại bỏ API keys không hoạt động khi khởi tạo.
+    Tự động loại bỏ API keys không hoạt động khi khởi tạo (theo key_health,
+    không gọi thử API).
     """
 
     DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
@@ -71,7 +77,7 @@ class MultiAIClient:
             "deepseek_api_keys": ["key1"],
         }
 
-        auto_filter: Tự động test và loại bỏ API keys không hoạt động
+        auto_filter: Tự động loại bỏ API keys đang bị đánh dấu chết
         """
         self.config = config
         self.deepseek_keys = [k for k in config.get("deepseek_api_keys", []) if k and k.strip()]
@@ -85,57 +91,27 @@ class MultiAIClient:
 
         self.logger = get_logger("multi_ai")
 
+        # Trạng thái key dùng chung trên máy, cập nhật từ các call thật
+        self.key_health = KeyHealthRegistry.from_config(config)
+
+        # Provider layer (ai_providers) cho batch prompt không cần JSON mode, tạo khi cần
+        self._providers: Optional[ProviderClient] = None
+
         # Auto filter exhausted APIs at startup
         if auto_filter:
             self._filter_working_apis()
 
     def _filter_working_apis(self):
-        """Test và loại bỏ API keys không hoạt động - PARALLEL VERSION."""
-        print("\n[API Filter] Dang kiem tra API keys...")
-
-        results = {
-            'deepseek': [],
-        }
-        results_lock = threading.Lock()
-
-        def test_deepseek(key_info: Tuple[int, str]) -> Tuple[str, int, str, bool]:
-            i, key = key_info
-            result = self._test_deepseek_key(key)
-            return ('deepseek', i, key, result)
-
-        # Prepare all test tasks
-        tasks = []
-        tasks.extend([('deepseek', i, key) for i, key in enumerate(self.deepseek_keys)])
-
-        if not tasks:
+        """Loại bỏ API keys bị đánh dấu chết trong key_health (không probe API)."""
+        if not self.deepseek_keys:
             print("[API Filter] CANH BAO: Khong co DeepSeek API key!")
             return
 
-        # Use ThreadPoolExecutor for parallel API testing
-        max_workers = min(len(tasks), 10)
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-
-            # Submit all API tests
-            for provider, i, key in tasks:
-                if provider == 'deepseek':
-                    futures.append(executor.submit(test_deepseek, (i, key)))
-
-            # Process results as they complete
-            for future in as_completed(futures):
-                try:
-                    provider, idx, key, success = future.result()
-                    status = "OK" if success else "SKIP"
-                    print(f"  {provider.capitalize()} key #{idx+1}: {status}")
-                    if success:
-                        with results_lock:
-                            results[provider].append(key)
-                except Exception as e:
-                    self.logger.error(f"API test error: {e}")
-
-        # Update with working keys only
-        self.deepseek_keys = results['deepseek']
+        working = self.key_health.filter(self.deepseek_keys)
+        for i, key in enumerate(self.deepseek_keys):
+            if key not in working:
+                print(f"  Deepseek key #{i+1}: SKIP (marked dead)")
+        self.deepseek_keys = working
 
         print(f"[API Filter] Ket qua: {len(self.deepseek_keys)} DeepSeek")
 
@@ -144,20 +120,6 @@ class MultiAIClient:
         else:
             print(f"[API Filter] Se dung: DeepSeek")
 
-    def _test_deepseek_key(self, key: str) -> bool:
-        """Test DeepSeek key với request nhỏ."""
-        try:
-            headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
-            data = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": "Say OK"}],
-                "max_tokens": 5
-            }
-            resp = requests.post(self.DEEPSEEK_URL, headers=headers, json=data, timeout=15)
-            return resp.status_code == 200
-        except:
-            return False
-
     def generate_content(
         self,
         prompt: str,
@@ -216,6 +178,22 @@ class MultiAIClient:
             raise last_error
         raise RuntimeError("Khong co DeepSeek API key hoat dong!")
 
+    @staticmethod
+    def _expects_json(prompt: str) -> bool:
+        """Prompt yêu cầu output JSON -> gọi DeepSeek với response_format json_object."""
+        return any(kw in prompt.lower() for kw in ['json', 'output format', '{"', "{'"])
+
+    def _provider_client(self) -> ProviderClient:
+        """
+        ai_providers.MultiAIClient dùng chung key (DeepSeek key đã lọc theo key_health),
+        không test key lúc tạo.
+        """
+        if self._providers is None:
+            config = dict(self.config)
+            config["deepseek_api_keys"] = list(self.deepseek_keys)
+            self._providers = ProviderClient(config, auto_filter=False)
+        return self._providers
+
     def _call_deepseek(self, prompt: str, temperature: float, max_tokens: int) -> str:
         """Call DeepSeek API."""
         api_key = self.deepseek_keys[self.deepseek_index]
@@ -226,7 +204,7 @@ class MultiAIClient:
         }
 
         # Determine if prompt expects JSON response
-        expects_json = any(kw in prompt.lower() for kw in ['json', 'output format', '{"', "{'"])
+        expects_json = self._expects_json(prompt)
 
         # DeepSeek API giới hạn max_tokens = 8192
         deepseek_max_tokens = min(max_tokens, 8192)
@@ -251,6 +229,7 @@ class MultiAIClient:
         print(f"[DeepSeek] Dang goi API... (prompt: {len(prompt)} ky tu, json_mode={expects_json}, max_tokens={deepseek_max_tokens}, cho 60-180s)")
 
         resp = requests.post(self.DEEPSEEK_URL, headers=headers, json=data, timeout=180)
+        self.key_health.record(api_key, resp.status_code, "" if resp.status_code == 200 else resp.text[:200])
 
         if resp.status_code == 200:
             result = resp.json()
@@ -273,26 +252,65 @@ class MultiAIClient:
         prompts: List[str],
         temperature: float = 0.7,
         max_tokens: int = 8192,
-        max_workers: int = None
+        max_workers: int = None,
+        on_result: Optional[Callable[[int, str], None]] = None
     ) -> List[str]:
         """
         Generate content for multiple prompts in parallel.
 
+        Prompt không yêu cầu JSON đi qua ai_providers generate_many (mọi provider/key
+        còn dùng được, giới hạn concurrency theo provider); prompt JSON vẫn gọi
+        DeepSeek với JSON mode.
+
         Args:
             prompts: List of prompts to process
             temperature: Temperature for generation
             max_tokens: Max tokens per response
-            max_workers: Max parallel workers (None = auto)
+            max_workers: Max parallel workers cho prompt JSON (None = auto)
+            on_result: Callback(index, text) ngay khi 1 prompt xong ("" = lỗi)
 
         Returns:
             List of responses in same order as prompts
         """
-        if not prompts:
-            return []
+        results = [""] * len(prompts)
+        text_indices, json_indices = [], []
+        for i, prompt in enumerate(prompts):
+            (json_indices if self._expects_json(prompt) else text_indices).append(i)
+
+        def done(indices: List[int]) -> Callable[[int, Optional[str]], None]:
+            def callback(pos: int, text: Optional[str]) -> None:
+                results[indices[pos]] = text or ""
+                if on_result:
+                    on_result(indices[pos], text or "")
+            return callback
+
+        if text_indices:
+            self._provider_client().generate_many(
+                [prompts[i] for i in text_indices], temperature=temperature,
+                max_tokens=max_tokens, on_result=done(text_indices))
+        if json_indices:
+            self._deepseek_batch([prompts[i] for i in json_indices], temperature, max_tokens,
+                                 max_workers, done(json_indices))
+        return results
 
+    def _deepseek_batch(
+        self,
+        prompts: List[str],
+        temperature: float,
+        max_tokens: int,
+        max_workers: Optional[int],
+        on_result: Callable[[int, str], None]
+    ) -> None:
+        """Gọi generate_content (DeepSeek) song song, prompt lỗi được retry tuần tự."""
         # Single prompt - no parallelization needed
         if len(prompts) == 1:
-            return [self.generate_content(prompts[0], temperature, max_tokens)]
+            try:
+                result = self.generate_content(prompts[0], temperature, max_tokens)
+            except Exception as e:
+                self.logger.error(f"Prompt 1 failed: {e}")
+                result = ""
+            on_result(0, result)
+            return
 
         # Determine worker count
         if max_workers is None:
@@ -302,8 +320,6 @@ class MultiAIClient:
 
         print(f"[Parallel] Xu ly {len(prompts)} prompts voi {max_workers} workers...")
 
-        # Results placeholder (preserve order)
-        results = [None] * len(prompts)
         errors = []
 
         def process_prompt(idx_prompt: Tuple[int, str]) -> Tuple[int, str, Exception]:
@@ -335,9 +351,8 @@ class MultiAIClient:
                 if error:
                     errors.append((idx, error))
                     self.logger.warning(f"Prompt {idx+1} failed: {error}")
-                    results[idx] = ""  # Empty result for failed
                 else:
-                    results[idx] = result
+                    on_result(idx, result)
 
                 print(f"[Parallel] Hoan thanh {completed}/{len(prompts)}...", end="\r")
 
@@ -348,12 +363,11 @@ class MultiAIClient:
             print(f"[Parallel] Retry {len(errors)} prompts that bi loi...")
             for idx, _ in errors:
                 try:
-                    results[idx] = self.generate_content(prompts[idx], temperature, max_tokens)
+                    result = self.generate_content(prompts[idx], temperature, max_tokens)
                 except Exception as e:
                     self.logger.error(f"Retry failed for prompt {idx+1}: {e}")
-                    results[idx] = ""
-
-        return results
+                    result = ""
+                on_result(idx, result)
 
 
 # ============================================================================
@@ -1327,12 +1341,11 @@ Trả về JSON:"""
 
                 if part_scenes:
                     # Lưu vào director_plan sheet
+                    existing = workbook.get_director_plan()
+                    existing_ids = {p['plan_id'] for p in existing} if existing else set()
                     for scene in part_scenes:
                         try:
                             # Check if scene already exists
-                            existing = workbook.get_director_plan()
-                            existing_ids = {p['plan_id'] for p in existing} if existing else set()
-
                             if scene['scene_id'] not in existing_ids:
                                 workbook._ensure_director_plan_sheet()
                                 ws = workbook.workbook[workbook.DIRECTOR_PLAN_SHEET]
@@ -1343,6 +1356,8 @@ Trả về JSON:"""
                                 ws.cell(row=next_row, column=4, value=scene.get("duration", 0))
                                 ws.cell(row=next_row, column=5, value=scene.get("text", "")[:500])
                                 ws.cell(row=next_row, column=6, value="pending")
+                                workbook.mark_dirty(workbook.DIRECTOR_PLAN_SHEET)
+                                existing_ids.add(scene['scene_id'])
                         except:
                             pass
 
@@ -3530,6 +3545,7 @@ Estimated Shots: {part_info.get('estimated_shots', 5)}
         Validate và fix location mismatch trong img_prompt.
 
         Ví dụ lỗi: "LYING IN BED... hotel hallway" → Sửa thành "LYING IN BED... bedroom"
+        Quy tắc action → location: modules/prompt_rules.py (ghi đè được trong prompts.yaml).
 
         Args:
             img_prompt: Prompt từ AI
@@ -3538,109 +3554,15 @@ Estimated Shots: {part_info.get('estimated_shots', 5)}
         Returns:
             Fixed img_prompt
         """
-        if not img_prompt:
-            return img_prompt
-
-        import re
-        prompt_lower = img_prompt.lower()
-        srt_lower = srt_text.lower() if srt_text else ""
-
-        # Định nghĩa các action → location mappings
-        action_location_rules = [
-            # BED actions → must be bedroom
-            {
-                "actions": ["lying in bed", "on the bed", "in bed", "bedroom", "on bed", "fell off the bed", "jumped up from bed"],
-                "wrong_locations": ["hallway", "corridor", "street", "outdoor", "kitchen", "office", "restaurant"],
-                "correct_location": "master bedroom, king-sized bed with silk sheets, elegant furniture, soft ambient lighting"
-            },
-            # KITCHEN actions → must be kitchen
-            {
-                "actions": ["cooking", "in the kitchen", "at the stove", "preparing food"],
-                "wrong_locations": ["bedroom", "hallway", "office", "outdoor", "street"],
-                "correct_location": "modern kitchen interior, stove, countertops, cooking utensils, warm lighting"
-            },
-            # BATHROOM actions
-            {
-                "actions": ["shower", "bathtub", "bathroom", "brushing teeth", "mirror"],
-                "wrong_locations": ["bedroom", "kitchen", "office", "outdoor", "hallway"],
-                "correct_location": "elegant bathroom, marble tiles, mirror, soft lighting"
-            },
-            # OUTDOOR actions
-            {
-                "actions": ["walking on street", "driving", "in the car", "outdoor", "park", "garden"],
-                "wrong_locations": ["bedroom", "kitchen", "bathroom", "office interior"],
-                "correct_location": "outdoor scene, natural daylight"
-            },
-            # RESTAURANT actions
-            {
-                "actions": ["dining", "at restaurant", "eating dinner", "at the table"],
-                "wrong_locations": ["bedroom", "bathroom", "street", "office"],
-                "correct_location": "elegant restaurant interior, dining tables, ambient lighting"
-            },
-        ]
-
-        # Check SRT text for location hints
-        srt_location_hints = {
-            "bed": "bedroom",
-            "bedroom": "bedroom",
-            "master bedroom": "master bedroom",
-            "kitchen": "kitchen",
-            "bathroom": "bathroom",
-            "restaurant": "restaurant",
-            "office": "office",
-            "car": "car interior",
-            "street": "street",
-            "courthouse": "courthouse",
-            "hospital": "hospital",
-        }
-
-        # Find if SRT mentions a specific location
-        srt_location = None
-        for hint, loc in srt_location_hints.items():
-            if hint in srt_lower:
-                srt_location = loc
-                break
-
-        # Check each rule
-        for rule in action_location_rules:
-            # Check if any action is in the prompt
-            action_found = any(action in prompt_lower for action in rule["actions"])
-
-            if action_found:
-                # Check if wrong location is in the prompt
-                for wrong_loc in rule["wrong_locations"]:
-                    if wrong_loc in prompt_lower:
-                        self.logger.warning(f"[Validation] Action/Location mismatch: action implies {rule['actions'][0]} but found '{wrong_loc}'")
-
-                        # Use SRT location if available, otherwise use rule's correct location
-                        correct_loc = rule["correct_location"]
-                        if srt_location:
-                            if srt_location == "bedroom" or srt_location == "master bedroom":
-                                correct_loc = "master bedroom, king-sized bed with silk sheets, elegant nightstands, soft warm lighting"
-                            elif srt_location == "kitchen":
-                                correct_loc = "modern kitchen, marble countertops, stainless steel appliances, warm lighting"
-
-                        # Replace the wrong location with correct one
-                        # Find the sentence containing the wrong location and replace
-                        pattern = re.compile(r'[^.]*' + re.escape(wrong_loc) + r'[^.]*\.?', re.IGNORECASE)
-                        fixed = pattern.sub(correct_loc + '. ', img_prompt)
-
-                        # Clean up double spaces/periods
-                        fixed = re.sub(r'\s+', ' ', fixed)
-                        fixed = re.sub(r'\.\.+', '.', fixed)
-
-                        return fixed.strip()
-
-        return img_prompt
+        fixed, mismatch = get_prompt_rules().fix_location(img_prompt, srt_text)
+        if mismatch:
+            self.logger.warning(f"[Validation] Action/Location mismatch: {mismatch}")
+        return fixed
 
     def _load_prompt_template(self, prompt_name: str) -> Optional[str]:
-        """Load a specific prompt template from prompts.yaml"""
+        """Load a specific prompt template from prompts.yaml (cached, reload khi file đổi)"""
         try:
-            import yaml
-            prompts_path = Path(__file__).parent.parent / "config" / "prompts.yaml"
-            with open(prompts_path, 'r', encoding='utf-8') as f:
-                prompts = yaml.safe_load(f)
-            return prompts.get(prompt_name, None)
+            return get_template(prompt_name)
         except Exception as e:
             self.logger.error(f"Failed to load prompt {prompt_name}: {e}")
             return None
@@ -4326,6 +4248,11 @@ Return JSON: {{"scenes": [{{"scene_id": 1, "img_prompt": "...", "video_prompt":
         shot_types_hook = ["WIDE LOW ANGLE", "EXTREME CLOSE-UP", "EXTREME CLOSE-UP"]  # First 3 scenes
         shot_types_cycle = ["WIDE", "CLOSE-UP", "MEDIUM", "EXTREME CLOSE-UP", "LOW ANGLE", "TWO-SHOT"]
 
+        # Kiểm tra narration cho cả batch 1 lần (regex đã compile sẵn)
+        narration_flags = get_prompt_rules().looks_like_narration_many(
+            [scene.get("visual_moment", "") for scene in scenes_data]
+        )
+
         result = []
         for idx, scene in enumerate(scenes_data):
             # Get scene info
@@ -4401,7 +4328,7 @@ Return JSON: {{"scenes": [{{"scene_id": 1, "img_prompt": "...", "video_prompt":
 
             # Visual moment - ONLY if it's actually visual (not narration)
             # Check if visual_moment looks like narration (contains certain patterns)
-            if visual_moment and not self._looks_like_narration(visual_moment):
+            if visual_moment and not narration_flags[idx]:
                 parts.append(visual_moment[:200])
             else:
                 # Create STORY-AWARE visual based on scene_type and scene text
@@ -4532,45 +4459,12 @@ Return JSON: {{"scenes": [{{"scene_id": 1, "img_prompt": "...", "video_prompt":
     def _looks_like_narration(self, text: str) -> bool:
         """Check if text looks like narration/dialogue rather than visual description.
 
-        Narration patterns:
+        Narration patterns (modules/prompt_rules.py):
         - Contains quotes or spoken text
         - Starts with "I ", "My ", "We ", "She ", "He "
         - Contains past tense narrative phrases
         """
-        if not text:
-            return True
-
-        text_lower = text.lower().strip()
-
-        # Narration indicators
-        narration_patterns = [
-            # First person narrative
-            text_lower.startswith("i "),
-            text_lower.startswith("i'"),
-            text_lower.startswith("my "),
-            text_lower.startswith("we "),
-            # Third person narrative
-            text_lower.startswith("she "),
-            text_lower.startswith("he "),
-            text_lower.startswith("they "),
-            # Contains dialogue markers
-            '"' in text,
-            "said" in text_lower,
-            "told" in text_lower,
-            "asked" in text_lower,
-            # Past tense narrative
-            "i was" in text_lower,
-            "i had" in text_lower,
-            "i remember" in text_lower,
-            "by the time" in text_lower,
-            "years old" in text_lower,
-            # YouTube CTA
-            "subscribe" in text_lower,
-            "like button" in text_lower,
-            "comment" in text_lower,
-        ]
-
-        return any(narration_patterns)
+        return get_prompt_rules().looks_like_narration(text)
 
     def _create_hook_visual(self, scene_idx: int, scene_text: str, char_parts: List[str], loc_part: str) -> str:
         """Create dramatic HOOK visual for scenes 1-3 (idx 0-2).
@@ -4653,46 +4547,11 @@ Return JSON: {{"scenes": [{{"scene_id": 1, "img_prompt": "...", "video_prompt":
         if not img_prompt or not scene_text:
             return img_prompt
 
-        import re
-
-        # 1. Remove exact match of scene_text (or significant portion)
-        # Try to match phrases that are clearly from the narration
-        words = scene_text.split()
-        if len(words) >= 5:
-            # Try to match 5+ consecutive words from narration
-            for i in range(len(words) - 4):
-                phrase = " ".join(words[i:i+5])
-                if phrase.lower() in img_prompt.lower():
-                    # Found narration in prompt - try to remove it
-                    # Find and remove the sentence containing this phrase
-                    pattern = re.compile(r'[^.]*' + re.escape(phrase) + r'[^.]*\.?', re.IGNORECASE)
-                    img_prompt = pattern.sub('', img_prompt)
-                    self.logger.debug(f"[Clean] Removed narration phrase: '{phrase[:30]}...'")
-
-        # 2. Remove common narration patterns
-        narration_patterns = [
-            r'By the time I was \d+ years old[^.]*\.?',
-            r'I had saved[^.]*\.?',
-            r'I decided to[^.]*\.?',
-            r'It cost me[^.]*\.?',
-            r'I remember[^.]*\.?',
-            r'She (told|said|asked)[^.]*\.?',
-            r'He (told|said|asked)[^.]*\.?',
-            r'"[^"]*"',  # Remove quoted dialogue
-        ]
-
-        for pattern in narration_patterns:
-            if re.search(pattern, img_prompt, re.IGNORECASE):
-                img_prompt = re.sub(pattern, '', img_prompt, flags=re.IGNORECASE)
-                self.logger.debug(f"[Clean] Removed pattern: {pattern[:30]}...")
+        img_prompt, removed = get_prompt_rules().clean_narration(img_prompt, scene_text)
+        for phrase in removed:
+            self.logger.debug(f"[Clean] Removed narration phrase: '{phrase[:30]}...'")
 
-        # 3. Clean up: remove double periods, extra spaces
-        img_prompt = re.sub(r'\.\.+', '.', img_prompt)
-        img_prompt = re.sub(r'\s+', ' ', img_prompt)
-        img_prompt = img_prompt.strip()
-        img_prompt = img_prompt.strip('.')
-
-        # 4. If prompt is now too short, return original (something went wrong)
+        # If prompt is now too short, flag it (something went wrong)
         if len(img_prompt) < 30:
             self.logger.warning(f"[Clean] Prompt too short after cleaning, may need manual review")
 
@@ -4801,6 +4660,13 @@ Return JSON: {{"scenes": [{{"scene_id": 1, "img_prompt": "...", "video_prompt":
                 # Lấy text từ { đến hết
                 json_str = clean_text[start_idx:]
 
+                # Parse tăng dần: giữ mọi object đã đóng ngoặc, không phải đoán chỗ cắt
+                parser = JsonStreamParser()
+                parser.feed(json_str)
+                if parser.items_emitted:
+                    self.logger.info(f"[_extract_json] Kept {parser.items_emitted} complete objects from truncated JSON")
+                    return parser.result()
+
                 # Chiến lược repair mạnh mẽ hơn
                 repair_attempts = [
                     # Attempt 1: Find last complete scene object and close there
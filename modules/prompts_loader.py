@@ -2,6 +2,10 @@
 VE3 Tool - Prompts Loader
 =========================
 Load prompts from config/prompts.yaml
+
+prompts.yaml chỉ được parse 1 lần mỗi process và parse lại khi file đổi
+(mtime/size), nên sửa prompt không cần restart worker. Template được trả về
+dạng PromptTemplate (str đã precompile cho format()).
 """
 
 import sys
@@ -20,64 +24,168 @@ if sys.platform == "win32":
         except:
             pass
 
+import threading
 from pathlib import Path
+from string import Formatter
+from typing import Optional
 
 try:
     import yaml
+    # libyaml nhanh hơn ~30 lần với prompts.yaml (~90KB), kết quả như safe_load
+    _YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 except ImportError:
     yaml = None
 
 
-def _load_prompts_yaml():
-    """Load prompts.yaml file."""
-    # Find config file
+def _find_prompts_path() -> Optional[Path]:
+    """Find config/prompts.yaml."""
     config_paths = [
         Path(__file__).parent.parent / "config" / "prompts.yaml",
         Path("config/prompts.yaml"),
         Path(os.environ.get("VE3_CONFIG_DIR", "config")) / "prompts.yaml",
     ]
-
     for path in config_paths:
         if path.exists():
-            if yaml:
-                with open(path, "r", encoding="utf-8") as f:
-                    return yaml.safe_load(f)
+            return path
+    return None
+
+
+def _load_prompts_yaml(path: Optional[Path] = None):
+    """Load prompts.yaml file."""
+    path = path or _find_prompts_path()
+    if path is None:
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        if yaml:
+            return yaml.load(f, Loader=_YAML_LOADER) or {}
+        # Fallback: simple text read
+        return {"_raw": f.read()}
+
+
+# ============================================================================
+# PRECOMPILED TEMPLATES
+# ============================================================================
+
+class PromptTemplate(str):
+    """
+    Prompt template (vẫn là str) với format() đã phân tích sẵn.
+
+    str.format phải parse lại cả template (hàng nghìn ký tự, rất nhiều {{ }}
+    của ví dụ JSON) mỗi lần gọi. PromptTemplate parse 1 lần khi load thành
+    các đoạn (text, tên biến), format() chỉ ghép lại. Template dùng
+    {x!r}, {x:spec}, {x.attr}, {0}... hoặc sai cú pháp -> dùng str.format
+    (cùng kết quả/cùng lỗi như trước).
+    """
+
+    def __new__(cls, text: str):
+        template = super().__new__(cls, text)
+        template._segments = None
+        try:
+            segments = []
+            for literal, field, spec, conversion in Formatter().parse(text):
+                if field is not None and (spec or conversion or not field.isidentifier()):
+                    break
+                segments.append((literal, field))
             else:
-                # Fallback: simple text read
-                with open(path, "r", encoding="utf-8") as f:
-                    return {"_raw": f.read()}
+                template._segments = tuple(segments)
+        except ValueError:
+            pass
+        return template
 
-    return {}
+    def format(self, *args, **kwargs) -> str:
+        if self._segments is None or args:
+            return str.format(self, *args, **kwargs)
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field is not None:
+                value = kwargs[field]  # KeyError(field) như str.format
+                parts.append(value if type(value) is str else format(value))
+        return "".join(parts)
 
 
-# Cache loaded prompts
+# ============================================================================
+# CACHE (hot reload khi prompts.yaml thay đổi)
+# ============================================================================
+
 _PROMPTS_CACHE = None
+_PROMPTS_STAMP = None
+_TEMPLATES = {}
+_GENERATION = 0
+_LOCK = threading.Lock()
+
+
+def _stamp(path: Optional[Path]):
+    try:
+        st = path.stat()
+        return (str(path), st.st_mtime_ns, st.st_size)
+    except (OSError, AttributeError):
+        return None
 
 
 def _get_prompts():
-    """Get prompts with caching."""
-    global _PROMPTS_CACHE
-    if _PROMPTS_CACHE is None:
-        _PROMPTS_CACHE = _load_prompts_yaml()
-    return _PROMPTS_CACHE
+    """Get prompts with caching (reload khi mtime/size của prompts.yaml đổi)."""
+    global _PROMPTS_CACHE, _PROMPTS_STAMP, _GENERATION
+    path = _find_prompts_path()
+    stamp = _stamp(path)
+    if _PROMPTS_CACHE is not None and stamp == _PROMPTS_STAMP:
+        return _PROMPTS_CACHE
+
+    with _LOCK:
+        if _PROMPTS_CACHE is None or stamp != _PROMPTS_STAMP:
+            prompts = _load_prompts_yaml(path)
+            _TEMPLATES.clear()
+            _PROMPTS_CACHE = prompts if isinstance(prompts, dict) else {}
+            _PROMPTS_STAMP = stamp
+            _GENERATION += 1
+        return _PROMPTS_CACHE
+
+
+def generation() -> int:
+    """Tăng mỗi lần prompts.yaml được (re)load - để cache phụ thuộc biết khi nào dựng lại."""
+    _get_prompts()
+    return _GENERATION
+
+
+def get_template(name: str, default: Optional[str] = None) -> Optional[PromptTemplate]:
+    """
+    Prompt template theo tên (đã precompile, cache tới khi prompts.yaml đổi).
+    Giá trị không phải string (None, dict...) được trả nguyên.
+    """
+    prompts = _get_prompts()
+    template = _TEMPLATES.get(name)
+    if template is not None:
+        return template
+
+    with _LOCK:
+        if prompts is not _PROMPTS_CACHE:
+            prompts = _PROMPTS_CACHE  # Vừa reload ở thread khác
+        text = prompts.get(name, default)
+        if not isinstance(text, str):
+            return text
+        template = PromptTemplate(text)
+        if name in prompts:
+            _TEMPLATES[name] = template
+        return template
 
 
 def get_analyze_story_prompt() -> str:
     """Get the analyze story prompt template."""
-    prompts = _get_prompts()
-    return prompts.get("analyze_story", "")
+    return get_template("analyze_story", "")
 
 
 def get_generate_scenes_prompt() -> str:
     """Get the generate scenes prompt template."""
-    prompts = _get_prompts()
-    return prompts.get("generate_scenes", "")
+    return get_template("generate_scenes", "")
 
 
 def get_smart_divide_scenes_prompt() -> str:
     """Get the smart divide scenes prompt template."""
     prompts = _get_prompts()
-    return prompts.get("smart_divide_scenes", prompts.get("divide_scenes", ""))
+    if "smart_divide_scenes" in prompts:
+        return get_template("smart_divide_scenes")
+    return get_template("divide_scenes", "")
 
 
 def get_global_style() -> str:
@@ -96,3 +204,9 @@ def get_visual_clarity() -> str:
     """Get the visual clarity string."""
     prompts = _get_prompts()
     return prompts.get("visual_clarity_string", "Face illuminated by soft volumetric light")
+
+
+def get_prompt_rules_config() -> dict:
+    """Get overrides for modules.prompt_rules (section prompt_rules, optional)."""
+    rules = _get_prompts().get("prompt_rules")
+    return rules if isinstance(rules, dict) else {}
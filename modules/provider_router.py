@@ -0,0 +1,184 @@
+"""
+VE3 Tool - Chọn AI provider theo latency và độ ổn định
+======================================================
+ai_providers.MultiAIClient trước đây luôn thử provider theo thứ tự cố định.
+ProviderRouter giữ số liệu của từng provider/model:
+- EWMA latency của các call thành công
+- EWMA tỉ lệ thành công
+và xếp hạng theo chi phí kỳ vọng = latency / tỉ lệ thành công (provider chưa
+có số liệu được thử trước để có số liệu).
+
+Circuit breaker: lỗi liên tiếp FAILURE_THRESHOLD lần -> mở mạch (bỏ qua
+provider) OPEN_SECONDS giây. Hết thời gian -> half-open: cho đúng 1 call thử,
+thành công thì đóng mạch, lỗi thì mở lại với thời gian gấp đôi (tối đa
+MAX_OPEN_SECONDS).
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _Route:
+    """Số liệu + trạng thái circuit của 1 provider/model."""
+
+    __slots__ = ("calls", "successes", "failures", "latency", "success_rate",
+                 "consecutive_failures", "state", "open_until", "open_seconds", "probing")
+
+    def __init__(self, open_seconds: float):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.latency: Optional[float] = None
+        self.success_rate = 1.0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.open_seconds = open_seconds
+        self.probing = 0.0  # monotonic() lúc cho call thử half-open, 0 = chưa cho
+
+
+class ProviderRouter:
+    """
+    Xếp hạng provider cho mỗi call + circuit breaker (thread-safe).
+
+    Usage:
+        for name in router.order(names):
+            if not router.begin(name):
+                continue
+            ...call...
+            router.record_success(name, latency) / router.record_failure(name)
+    """
+
+    # Hệ số EWMA cho latency và tỉ lệ thành công
+    ALPHA = 0.2
+    FAILURE_THRESHOLD = 3
+    OPEN_SECONDS = 30.0
+    MAX_OPEN_SECONDS = 600.0
+    # Call thử half-open không báo kết quả sau chừng này giây thì cho call thử khác
+    PROBE_TIMEOUT = 180.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, _Route] = {}
+
+    def _route(self, name: str) -> _Route:
+        route = self._routes.get(name)
+        if route is None:
+            route = _Route(self.OPEN_SECONDS)
+            self._routes[name] = route
+        return route
+
+    @staticmethod
+    def _cost(route: _Route) -> float:
+        if route.latency is None:
+            # Chưa thử -> thử trước; chưa lần nào thành công -> xếp cuối
+            return 0.0 if not route.calls else float("inf")
+        return route.latency / max(route.success_rate, 0.05)
+
+    def order(self, names: List[str], load: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        Các provider nên thử cho call này, tốt nhất trước. Provider đang mở
+        mạch bị bỏ; hết thời gian mở thì được 1 call thử (half-open) - chỉ
+        xếp vào danh sách, call thử được giữ chỗ ở begin() lúc thật sự gọi.
+        Tất cả đều mở mạch -> trả provider sắp hết thời gian mở nhất.
+
+        Args:
+            load: name -> số call đang chạy; chi phí nhân (1 + load) để các call
+                  song song chia ra nhiều provider/key
+        """
+        now = time.monotonic()
+        with self._lock:
+            allowed, blocked = [], []
+            for name in names:
+                route = self._route(name)
+                if route.state == OPEN and now >= route.open_until:
+                    route.state = HALF_OPEN
+                    route.probing = 0.0
+                if route.state == CLOSED:
+                    allowed.append(name)
+                elif route.state == HALF_OPEN and self._probe_free(route, now):
+                    allowed.append(name)
+                else:
+                    blocked.append(name)
+
+            if not allowed and blocked:
+                return [min(blocked, key=lambda n: self._routes[n].open_until)]
+            # sort ổn định: cùng chi phí thì giữ thứ tự cấu hình
+            load = load or {}
+            return sorted(allowed, key=lambda n: (self._cost(self._routes[n]) * (1 + load.get(n, 0)),
+                                                  load.get(n, 0)))
+
+    def _probe_free(self, route: _Route, now: float) -> bool:
+        """Chưa có call thử half-open, hoặc call thử trước không báo kết quả."""
+        return not route.probing or now - route.probing >= self.PROBE_TIMEOUT
+
+    def begin(self, name: str) -> bool:
+        """
+        Gọi ngay trước khi call provider. Provider half-open: giữ chỗ call thử
+        duy nhất, trả False nếu call khác đã giữ (bỏ qua provider này).
+        """
+        now = time.monotonic()
+        with self._lock:
+            route = self._route(name)
+            if route.state != HALF_OPEN:
+                return True
+            if not self._probe_free(route, now):
+                return False
+            route.probing = now
+            return True
+
+    def record_success(self, name: str, latency: float) -> None:
+        """Call thành công sau latency giây -> đóng mạch."""
+        with self._lock:
+            route = self._route(name)
+            route.calls += 1
+            route.successes += 1
+            route.latency = latency if route.latency is None else route.latency + self.ALPHA * (latency - route.latency)
+            route.success_rate += self.ALPHA * (1.0 - route.success_rate)
+            route.consecutive_failures = 0
+            route.state = CLOSED
+            route.open_seconds = self.OPEN_SECONDS
+            route.probing = 0.0
+
+    def record_failure(self, name: str) -> None:
+        """Call lỗi/không có kết quả -> mở mạch khi lỗi liên tiếp đủ ngưỡng."""
+        with self._lock:
+            route = self._route(name)
+            route.calls += 1
+            route.failures += 1
+            route.success_rate += self.ALPHA * (0.0 - route.success_rate)
+            route.consecutive_failures += 1
+            if route.state == HALF_OPEN:
+                # Call thử lỗi -> mở lại lâu hơn
+                route.open_seconds = min(self.MAX_OPEN_SECONDS, route.open_seconds * 2)
+                self._open(route)
+            elif route.consecutive_failures >= self.FAILURE_THRESHOLD:
+                self._open(route)
+
+    @staticmethod
+    def _open(route: _Route) -> None:
+        route.state = OPEN
+        route.open_until = time.monotonic() + route.open_seconds
+        route.probing = 0.0
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """name -> calls, successes, failures, success_rate, latency (EWMA, giây), state, open_for."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "calls": route.calls,
+                    "successes": route.successes,
+                    "failures": route.failures,
+                    "success_rate": round(route.success_rate, 3),
+                    "latency": round(route.latency, 2) if route.latency is not None else None,
+                    "state": route.state,
+                    "open_for": round(max(0.0, route.open_until - now), 1) if route.state == OPEN else 0.0,
+                }
+                for name, route in self._routes.items()
+            }
@@ -288,6 +288,7 @@ OUTPUT: Only return the NEW PROMPT, nothing else."""
             self.log(f"[STEP 1/4] Clearing old violated media_id from Excel...")
             self.workbook.update_character(ref_id, media_id="", status="fixing")
             self.workbook.save()
+            self.workbook.flush()  # Chrome 1 không được dùng lại media_id cũ
             self.log(f"  [v] Cleared old media_id")
 
             # 3b. Fix prompt với AI
@@ -374,6 +375,9 @@ OUTPUT: Only return the NEW PROMPT, nothing else."""
             # Rate limit
             time.sleep(3)
 
+        # Ghi nốt các thay đổi còn lại (workbook có thể đang ở chế độ write-behind)
+        self.workbook.flush()
+
         # Summary
         self.log("\n" + "=" * 50)
         self.log("VALIDATION SUMMARY")
@@ -34,22 +34,7 @@ from pathlib import Path
 from typing import Dict, Optional
 from datetime import datetime
 
-# fcntl chỉ có trên Linux, Windows dùng msvcrt
-if sys.platform == 'win32':
-    import msvcrt
-    def lock_file(f, exclusive=True):
-        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK if exclusive else msvcrt.LK_NBRLCK, 1)
-    def unlock_file(f):
-        try:
-            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
-        except:
-            pass
-else:
-    import fcntl
-    def lock_file(f, exclusive=True):
-        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
-    def unlock_file(f):
-        fcntl.flock(f, fcntl.LOCK_UN)
+from modules.file_lock import lock_file, unlock_file
 
 
 class Shared403Tracker:
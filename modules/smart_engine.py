@@ -1010,7 +1010,14 @@ class SmartEngine:
         - Đảm bảo ảnh mới khớp style với ảnh cũ
         """
         import openpyxl
+        from modules.excel_manager import PromptWorkbook
         try:
+            # Sheet 'config' + change journal (project_id mới ghi chưa được gộp vào file)
+            project_id = PromptWorkbook(excel_path).get_config_value('flow_project_id') \
+                if Path(excel_path).exists() else ""
+            if project_id:
+                return str(project_id).strip()
+
             wb = openpyxl.load_workbook(excel_path)
 
             # Tìm trong sheet 'config' trước
@@ -1046,39 +1053,16 @@ class SmartEngine:
 
         Gọi sau khi tạo ảnh để lưu project_id cho lần chạy sau.
         """
-        import openpyxl
+        from modules.excel_manager import PromptWorkbook
         if not project_id:
             return False
 
         try:
-            wb = openpyxl.load_workbook(excel_path)
-
-            # Tạo hoặc lấy sheet 'config'
-            if 'config' not in wb.sheetnames:
-                ws = wb.create_sheet('config')
-                ws['A1'] = 'key'
-                ws['B1'] = 'value'
-            else:
-                ws = wb['config']
-
-            # Tìm row có key = 'flow_project_id' để update
-            found = False
-            for row_num, row in enumerate(ws.iter_rows(min_row=2, max_row=20, values_only=True), start=2):
-                if row and len(row) >= 1:
-                    key = str(row[0] or '').strip().lower()
-                    if key == 'flow_project_id':
-                        ws.cell(row=row_num, column=2, value=project_id)
-                        found = True
-                        break
-
-            # Nếu chưa có, thêm row mới
-            if not found:
-                next_row = ws.max_row + 1
-                ws.cell(row=next_row, column=1, value='flow_project_id')
-                ws.cell(row=next_row, column=2, value=project_id)
-
-            wb.save(excel_path)
-            wb.close()
+            # Qua change journal: không ghi đè thay đổi của các worker đang chạy
+            workbook = PromptWorkbook(excel_path, change_journal=True)
+            workbook.load_or_create()
+            workbook.set_config_value('flow_project_id', project_id)
+            workbook.save()
             self.log(f"  -> Lưu project_id vào Excel: {project_id[:8]}...")
             return True
 
@@ -3405,7 +3389,6 @@ class SmartEngine:
         Đọc trực tiếp từ Excel format của prompts generator.
         """
         import subprocess
-        import openpyxl
         import tempfile
 
         # Check FFmpeg
@@ -3442,22 +3425,26 @@ class SmartEngine:
         self.log(f"  Excel: {excel_path.name}")
 
         try:
-            # 1. Load scenes từ Excel (Scenes sheet)
-            wb = openpyxl.load_workbook(excel_path)
+            # 1. Load scenes từ Excel (Scenes sheet) - read-only, chỉ parse sheet Scenes
+            from modules.excel_manager import PromptWorkbook
+            found_sheet = []
 
-            # Tìm sheet Scenes
-            scenes_sheet = None
-            for sheet_name in wb.sheetnames:
-                if 'scene' in sheet_name.lower():
-                    scenes_sheet = wb[sheet_name]
-                    break
+            def is_scenes_sheet(sheet_name: str) -> bool:
+                # Chỉ lấy sheet đầu tiên có chữ 'scene'
+                if found_sheet or 'scene' not in sheet_name.lower():
+                    return False
+                found_sheet.append(sheet_name)
+                return True
+
+            sheets = PromptWorkbook.open_readonly(excel_path, is_scenes_sheet)
+            scenes_sheet = next(iter(sheets.values()), None)
 
             if not scenes_sheet:
                 self.log("  Khong tim thay sheet 'Scenes' trong Excel!", "ERROR")
                 return None
 
             # Đọc headers
-            headers = [cell.value for cell in scenes_sheet[1]]
+            headers = list(scenes_sheet.headers)
             self.log(f"  Headers: {headers[:5]}...")
 
             # Tìm cột cần thiết (ID và srt_start)
@@ -3492,7 +3479,7 @@ class SmartEngine:
             video_count = 0
             image_count = 0
 
-            for row in scenes_sheet.iter_rows(min_row=2, values_only=True):
+            for row in scenes_sheet.rows:
                 if row[id_col] is None:
                     continue
 
@@ -4050,21 +4037,18 @@ class SmartEngine:
 
     def _load_prompts(self, excel_path: Path, proj_dir: Path) -> List[Dict]:
         """Load prompts tu Excel - doc TAT CA sheets."""
-        import openpyxl
+        from modules.excel_manager import PromptWorkbook
 
         prompts = []
-        wb = openpyxl.load_workbook(excel_path)
+        # Read-only/streaming: chi doc, khong can load full edit mode
+        sheets = PromptWorkbook.open_readonly(excel_path)
 
-        self.log(f"Excel co {len(wb.sheetnames)} sheets: {wb.sheetnames}")
+        self.log(f"Excel co {len(sheets)} sheets: {list(sheets)}")
 
         # Doc TAT CA sheets
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-
+        for sheet_name, sheet in sheets.items():
             # Get headers
-            headers = []
-            for cell in ws[1]:
-                headers.append(cell.value)
+            headers = list(sheet.headers)
 
             self.log(f"  Sheet '{sheet_name}' headers: {headers}")
 
@@ -4141,7 +4125,7 @@ class SmartEngine:
             self.log(f"  -> Found: id_col={id_col} ({headers[id_col]}), prompt_col={prompt_col} ({headers[prompt_col]}), ref_col={ref_col}")
 
             count = 0
-            for row in ws.iter_rows(min_row=2, values_only=True):
+            for row in sheet.rows:
                 if row is None:
                     continue
                 if id_col >= len(row) or prompt_col >= len(row):
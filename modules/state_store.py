@@ -0,0 +1,312 @@
+"""
+VE3 Tool - Project State Store
+==============================
+Sidecar SQLite ({code}_state.sqlite) nằm cạnh {code}_prompts.xlsx.
+
+PromptWorkbook ghi lại snapshot trạng thái (scenes, characters, segments,
+processing_status) trong 1 transaction ngay sau mỗi lần ghi file Excel.
+Các reader chỉ cần trạng thái (GUI, worker scan, QualityChecker) đọc file
+này thay vì parse toàn bộ XML của workbook.
+
+Sidecar lưu mtime/size của file Excel lúc ghi. Nếu Excel bị ghi/copy bởi
+process khác (copy_from_master, sửa tay) thì sidecar bị coi là cũ và
+reader quay về đọc Excel. Tương tự khi change journal ({code}_changes.jsonl)
+có thay đổi chưa gộp vào Excel: sidecar lưu vị trí journal đã gộp, journal đã
+dài hơn -> cũ, reader đọc Excel + journal.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from modules.change_journal import ChangeJournal
+from modules.utils import get_logger
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    scene_id INTEGER PRIMARY KEY,
+    segment_id INTEGER,
+    srt_start TEXT,
+    srt_end TEXT,
+    status_img TEXT,
+    status_vid TEXT,
+    has_img_prompt INTEGER,
+    is_fallback INTEGER,
+    has_video_prompt INTEGER,
+    img_path TEXT,
+    video_path TEXT,
+    media_id TEXT,
+    video_note TEXT
+);
+CREATE TABLE IF NOT EXISTS characters (
+    id TEXT PRIMARY KEY,
+    role TEXT,
+    name TEXT,
+    image_file TEXT,
+    status TEXT,
+    is_child INTEGER,
+    media_id TEXT
+);
+CREATE TABLE IF NOT EXISTS segments (
+    segment_id INTEGER PRIMARY KEY,
+    segment_name TEXT,
+    image_count INTEGER,
+    srt_range_start INTEGER,
+    srt_range_end INTEGER,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+    step_id TEXT PRIMARY KEY,
+    step_name TEXT,
+    status TEXT,
+    items_total INTEGER,
+    items_done INTEGER,
+    coverage_pct REAL,
+    notes TEXT,
+    last_updated TEXT
+);
+"""
+
+SCENE_STATE_COLUMNS = [
+    "scene_id", "segment_id", "srt_start", "srt_end", "status_img", "status_vid",
+    "has_img_prompt", "is_fallback", "has_video_prompt",
+    "img_path", "video_path", "media_id", "video_note",
+]
+CHARACTER_STATE_COLUMNS = ["id", "role", "name", "image_file", "status", "is_child", "media_id"]
+SEGMENT_STATE_COLUMNS = [
+    "segment_id", "segment_name", "image_count", "srt_range_start", "srt_range_end", "status",
+]
+STEP_STATE_COLUMNS = [
+    "step_id", "step_name", "status", "items_total", "items_done",
+    "coverage_pct", "notes", "last_updated",
+]
+
+
+def state_path_for(excel_path: Union[str, Path]) -> Path:
+    """AR8-0003_prompts.xlsx -> AR8-0003_state.sqlite (cùng thư mục)."""
+    excel_path = Path(excel_path)
+    stem = excel_path.stem
+    if stem.endswith("_prompts"):
+        stem = stem[:-len("_prompts")]
+    return excel_path.with_name(f"{stem}_state.sqlite")
+
+
+def scene_state_row(scene: Any) -> Dict[str, Any]:
+    """Rút gọn Scene thành các field trạng thái (giống 1 row của bảng scenes)."""
+    img_prompt = (scene.img_prompt or "").strip()
+    return {
+        "scene_id": scene.scene_id,
+        "segment_id": scene.segment_id,
+        "srt_start": scene.srt_start or "",
+        "srt_end": scene.srt_end or "",
+        "status_img": scene.status_img or "pending",
+        "status_vid": scene.status_vid or "pending",
+        "has_img_prompt": bool(img_prompt),
+        "is_fallback": "[FALLBACK]" in img_prompt,
+        "has_video_prompt": bool((scene.video_prompt or "").strip()),
+        "img_path": scene.img_path or "",
+        "video_path": scene.video_path or "",
+        "media_id": scene.media_id or "",
+        "video_note": scene.video_note or "",
+    }
+
+
+def character_state_row(character: Any) -> Dict[str, Any]:
+    """Rút gọn Character thành các field trạng thái."""
+    return {
+        "id": character.id,
+        "role": character.role,
+        "name": character.name,
+        "image_file": character.image_file,
+        "status": character.status,
+        "is_child": bool(character.is_child),
+        "media_id": character.media_id,
+    }
+
+
+class ProjectStateStore:
+    """
+    Sidecar SQLite chứa trạng thái của một project.
+
+    Attributes:
+        excel_path: Path đến file Excel gốc
+        path: Path đến file sidecar
+    """
+
+    def __init__(self, excel_path: Union[str, Path]):
+        self.excel_path = Path(excel_path)
+        self.path = state_path_for(self.excel_path)
+        self.logger = get_logger("state_store")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ========================================================================
+    # WRITE
+    # ========================================================================
+
+    def write_snapshot(
+        self,
+        scenes: List[Dict[str, Any]],
+        characters: List[Dict[str, Any]],
+        segments: List[Dict[str, Any]],
+        steps: List[Dict[str, Any]],
+        config: Optional[Dict[str, str]] = None,
+        excel_stat: Optional[os.stat_result] = None,
+        journal_position: Tuple[str, int] = ("", 0)
+    ) -> None:
+        """
+        Ghi đè toàn bộ trạng thái trong 1 transaction.
+        Gọi ngay sau khi file Excel vừa được ghi xong.
+
+        Args:
+            excel_stat: os.stat của file Excel lấy ngay sau khi ghi (None = stat lúc này;
+                file có thể đã bị process khác ghi lại trong lúc dựng snapshot)
+            journal_position: (generation, offset) của change journal đã gộp vào file Excel
+        """
+        stat = excel_stat if excel_stat is not None else self.excel_path.stat()
+
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+            with conn:
+                for table in ("scenes", "characters", "segments", "steps", "meta"):
+                    conn.execute(f"DELETE FROM {table}")
+
+                self._insert(conn, "scenes", SCENE_STATE_COLUMNS, scenes)
+                self._insert(conn, "characters", CHARACTER_STATE_COLUMNS, characters)
+                self._insert(conn, "segments", SEGMENT_STATE_COLUMNS, segments)
+                self._insert(conn, "steps", STEP_STATE_COLUMNS, steps)
+
+                meta = {
+                    "excel_mtime_ns": str(stat.st_mtime_ns),
+                    "excel_size": str(stat.st_size),
+                    "updated_at": str(time.time()),
+                    "config": json.dumps(config or {}),
+                    "journal_position": f"{journal_position[0]}:{journal_position[1]}",
+                }
+                conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, table: str, columns: List[str], rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        placeholders = ", ".join("?" for _ in columns)
+        # OR REPLACE: Excel có ID trùng thì giữ row sau, không làm hỏng cả snapshot
+        sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        conn.executemany(sql, [tuple(row.get(col) for col in columns) for row in rows])
+
+    # ========================================================================
+    # READ
+    # ========================================================================
+
+    def is_fresh(self) -> bool:
+        """
+        True nếu sidecar được ghi cho đúng phiên bản file Excel hiện tại và
+        change journal không có thay đổi nào sau phần đã gộp vào file đó.
+        """
+        if not self.path.exists():
+            return False
+        try:
+            stat = self.excel_path.stat()
+            meta = self._read_meta()
+        except (OSError, sqlite3.Error):
+            return False
+        if meta.get("excel_mtime_ns") != str(stat.st_mtime_ns) or meta.get("excel_size") != str(stat.st_size):
+            return False
+
+        journal = ChangeJournal(self.excel_path)
+        if not journal.exists():
+            return True
+        try:
+            generation, size = journal.position()
+        except OSError:
+            return False
+        return meta.get("journal_position") == f"{generation}:{size}"
+
+    def _read_meta(self) -> Dict[str, str]:
+        conn = self._connect()
+        try:
+            return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM meta")}
+        finally:
+            conn.close()
+
+    def _select(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def get_scene_status(self) -> List[Dict[str, Any]]:
+        """Trạng thái từng scene (không có nội dung prompt), sắp theo scene_id."""
+        rows = self._select("SELECT * FROM scenes ORDER BY scene_id")
+        for row in rows:
+            for key in ("has_img_prompt", "is_fallback", "has_video_prompt"):
+                row[key] = bool(row[key])
+        return rows
+
+    def get_characters(self) -> List[Dict[str, Any]]:
+        """Danh sách nhân vật (id, role, image_file, status, media_id...)."""
+        rows = self._select("SELECT * FROM characters")
+        for row in rows:
+            row["is_child"] = bool(row["is_child"])
+        return rows
+
+    def get_story_segments(self) -> List[Dict[str, Any]]:
+        """Danh sách segments, sắp theo segment_id."""
+        return self._select("SELECT * FROM segments ORDER BY segment_id")
+
+    def get_all_step_status(self) -> List[Dict[str, Any]]:
+        """Cùng format với PromptWorkbook.get_all_step_status()."""
+        return self._select("SELECT * FROM steps ORDER BY rowid")
+
+    def get_step_status(self, step_id: str) -> Dict[str, Any]:
+        """Cùng format với PromptWorkbook.get_step_status()."""
+        rows = self._select("SELECT * FROM steps WHERE step_id = ?", (step_id,))
+        return rows[0] if rows else {}
+
+    def get_config_value(self, key: str) -> str:
+        """Giá trị trong sheet 'config' tại thời điểm ghi snapshot."""
+        config = json.loads(self._read_meta().get("config") or "{}")
+        return config.get(key.lower(), "")
+
+    def get_counts(self) -> Dict[str, int]:
+        """Các con số hay dùng cho status poll."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                """
+                SELECT COUNT(*) AS total_scenes,
+                       COALESCE(SUM(has_img_prompt), 0) AS scenes_with_prompts,
+                       COALESCE(SUM(is_fallback), 0) AS fallback_prompts,
+                       COALESCE(SUM(has_video_prompt), 0) AS video_prompts,
+                       COALESCE(SUM(status_img = 'done'), 0) AS images_done,
+                       COALESCE(SUM(status_vid = 'done'), 0) AS videos_done
+                FROM scenes
+                """
+            ).fetchone()
+            counts = dict(row)
+            counts["total_characters"] = conn.execute("SELECT COUNT(*) FROM characters").fetchone()[0]
+            return counts
+        finally:
+            conn.close()
+
+    def remove(self) -> None:
+        """Xóa sidecar (vd: khi file Excel bị tạo lại)."""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,93 @@
+"""
+VE3 Tool - Step Journal
+=======================
+Journal append-only ({code}_{step_id}.journal.jsonl) nằm cạnh {code}_prompts.xlsx.
+
+Step chạy theo batch (Step 5 scene prompts) ghi mỗi batch xong thành 1 dòng
+JSON và fsync ngay, trước khi gộp vào workbook. Process bị kill giữa chừng
+thì các batch đã xong vẫn còn trong journal; lần chạy sau đọc lại journal,
+gộp phần chưa có vào Excel rồi mới gọi API cho phần còn thiếu.
+
+Journal bị xóa khi kết quả của step đã được ghi chắc chắn vào file Excel.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from modules.utils import get_logger
+
+
+def journal_path_for(excel_path: Union[str, Path], step_id: str) -> Path:
+    """AR8-0003_prompts.xlsx + step_7 -> AR8-0003_step_7.journal.jsonl (cùng thư mục)."""
+    excel_path = Path(excel_path)
+    stem = excel_path.stem
+    if stem.endswith("_prompts"):
+        stem = stem[:-len("_prompts")]
+    return excel_path.with_name(f"{stem}_{step_id}.journal.jsonl")
+
+
+class StepJournal:
+    """
+    Journal các batch kết quả của một step.
+
+    Attributes:
+        path: Path đến file journal
+        step_id: ID của step (step_7, ...)
+    """
+
+    def __init__(self, excel_path: Union[str, Path], step_id: str):
+        self.step_id = step_id
+        self.path = journal_path_for(excel_path, step_id)
+        self.logger = get_logger("step_journal")
+
+    def append(self, records: List[Dict[str, Any]], batch: Any = None) -> None:
+        """
+        Ghi 1 batch (list record) thành 1 dòng và fsync trước khi return.
+
+        Args:
+            records: Các record của batch (dict JSON-serializable)
+            batch: Nhãn batch (batch_num) để debug
+        """
+        line = json.dumps(
+            {"batch": batch, "ts": time.time(), "records": records},
+            ensure_ascii=False, default=str
+        )
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self) -> List[Dict[str, Any]]:
+        """
+        Đọc tất cả record theo thứ tự ghi.
+        Dòng cuối bị cắt dở (crash khi đang ghi) được bỏ qua.
+        """
+        if not self.path.exists():
+            return []
+
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"Skip broken journal line {line_no} in {self.path.name}")
+                    continue
+                records.extend(entry.get("records") or [])
+        return records
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def clear(self) -> None:
+        """Xóa journal (kết quả đã nằm an toàn trong file Excel)."""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,90 @@
+"""
+VE3 Tool - Token accounting theo step
+=====================================
+Cộng dồn usage của các LLM call theo step (step_1..step_7) để biết token
+(~chi phí API) đi đâu, và bao nhiêu input token phải trả cho mỗi scene.
+
+DeepSeek trả thêm prompt_cache_hit_tokens / prompt_cache_miss_tokens khi
+phần đầu prompt trùng với request trước (context caching) -> report cho
+thấy phần prefix dùng chung giữa các batch có được cache hay không.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class TokenUsage:
+    """
+    Usage token theo step của 1 lần chạy.
+
+    Attributes:
+        steps: step -> {calls, cached_calls, prompt_tokens, completion_tokens,
+                        prompt_cache_hit_tokens, prompt_cache_miss_tokens, items}
+    """
+
+    _FIELDS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps: Dict[str, Dict[str, int]] = {}
+
+    def _step(self, step: str) -> Dict[str, int]:
+        entry = self.steps.get(step)
+        if entry is None:
+            entry = {"calls": 0, "cached_calls": 0, "items": 0}
+            entry.update((field, 0) for field in self._FIELDS)
+            self.steps[step] = entry
+        return entry
+
+    def record(self, step: str, usage: Optional[Dict[str, Any]], cached: bool = False) -> None:
+        """1 LLM call của step (cached = response lấy từ llm_cache, không tốn token)."""
+        with self._lock:
+            entry = self._step(step or "other")
+            if cached:
+                entry["cached_calls"] += 1
+                return
+            entry["calls"] += 1
+            for field in self._FIELDS:
+                entry[field] += int((usage or {}).get(field) or 0)
+
+    def add_items(self, step: str, count: int) -> None:
+        """Số item (scene, plan...) các call của step tạo ra - để tính token/item."""
+        with self._lock:
+            self._step(step or "other")["items"] += count
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """step -> usage + các tỉ lệ (input/output token mỗi item, % prompt được cache)."""
+        with self._lock:
+            result = {}
+            for step, entry in sorted(self.steps.items()):
+                row: Dict[str, Any] = dict(entry)
+                items = entry["items"]
+                row["prompt_tokens_per_item"] = round(entry["prompt_tokens"] / items, 1) if items else None
+                row["completion_tokens_per_item"] = round(entry["completion_tokens"] / items, 1) if items else None
+                cache_total = entry["prompt_cache_hit_tokens"] + entry["prompt_cache_miss_tokens"]
+                row["prompt_cache_hit_pct"] = (
+                    round(entry["prompt_cache_hit_tokens"] / cache_total * 100, 1) if cache_total else None
+                )
+                result[step] = row
+            return result
+
+    def format_report(self) -> List[str]:
+        """Các dòng log của report (rỗng nếu chưa có call nào)."""
+        lines = []
+        total_in = total_out = 0
+        for step, row in self.report().items():
+            if not row["calls"] and not row["cached_calls"]:
+                continue
+            total_in += row["prompt_tokens"]
+            total_out += row["completion_tokens"]
+            line = (f"  {step}: {row['calls']} calls (+{row['cached_calls']} cached), "
+                    f"in {row['prompt_tokens']} / out {row['completion_tokens']} tokens")
+            if row["prompt_tokens_per_item"] is not None:
+                line += (f", {row['prompt_tokens_per_item']:.0f} in + "
+                         f"{row['completion_tokens_per_item']:.0f} out per item ({row['items']} items)")
+            if row["prompt_cache_hit_pct"] is not None:
+                line += f", prefix cache hit {row['prompt_cache_hit_pct']:.0f}%"
+            lines.append(line)
+        if lines:
+            lines.insert(0, f"  TOKEN USAGE: in {total_in} / out {total_out} tokens")
+        return lines
@@ -447,6 +447,10 @@ def has_excel_with_prompts(project_dir: Path, name: str) -> bool:
 
     try:
         from modules.excel_manager import PromptWorkbook
+        state = PromptWorkbook.read_state(excel_path)
+        if state:
+            return state.get_counts()["scenes_with_prompts"] > 0
+
         wb = PromptWorkbook(str(excel_path))
         wb.load_or_create()  # PHẢI load trước khi dùng
         scenes = wb.get_scenes()
@@ -463,6 +467,10 @@ def needs_api_completion(project_dir: Path, name: str) -> bool:
 
     try:
         from modules.excel_manager import PromptWorkbook
+        state = PromptWorkbook.read_state(excel_path)
+        if state:
+            return state.get_counts()["fallback_prompts"] > 0
+
         wb = PromptWorkbook(str(excel_path))
         wb.load_or_create()  # PHẢI load trước khi dùng
         scenes = wb.get_scenes()
@@ -79,6 +79,10 @@ LOCAL_PROJECTS = TOOL_DIR / "PROJECTS"
 # Scan interval (seconds)
 SCAN_INTERVAL = 30
 
+# Streaming scene prompts: Step 7 IN_PROGRESS nhưng status/Excel/sidecar/journal
+# không đổi quá lâu (giây) -> Excel Worker đã dừng giữa chừng, không coi là đang stream
+SCENE_PROMPTS_STALE_AFTER = 900
+
 
 def get_channel_from_folder() -> str:
     """
@@ -191,8 +195,11 @@ def is_excel_step7_completed(project_dir: Path, name: str) -> bool:
 
     try:
         from modules.excel_manager import PromptWorkbook
-        wb = PromptWorkbook(str(excel_path))
-        wb.load_or_create()
+        # Sidecar state (nếu còn khớp với Excel) -> không phải parse xlsx
+        wb = PromptWorkbook.read_state(excel_path)
+        if wb is None:
+            wb = PromptWorkbook(str(excel_path))
+            wb.load_or_create()
 
         # Check step 7 status
         step7_status = wb.get_step_status("step_7")
@@ -212,35 +219,117 @@ def is_excel_step7_completed(project_dir: Path, name: str) -> bool:
         return False
 
 
-def has_excel_with_prompts(project_dir: Path, name: str) -> bool:
-    """Check if project has Excel with prompts (ready for worker).
+def _scene_prompts_last_activity(excel_path: Path, last_updated) -> float:
+    """
+    Lần cuối Step 7 có hoạt động (epoch): last_updated của step_7 và mtime của
+    Excel, sidecar state, step journal (ghi mỗi scene/batch).
+    """
+    from datetime import datetime
+    from modules.state_store import state_path_for
+    from modules.step_journal import journal_path_for
+
+    latest = 0.0
+    if isinstance(last_updated, datetime):
+        latest = last_updated.timestamp() + 60
+    elif last_updated:
+        try:
+            # Chỉ ghi tới phút
+            latest = datetime.strptime(str(last_updated).strip(), "%Y-%m-%d %H:%M").timestamp() + 60
+        except ValueError:
+            pass
+    for path in (excel_path, state_path_for(excel_path), journal_path_for(excel_path, "step_7")):
+        try:
+            latest = max(latest, path.stat().st_mtime)
+        except OSError:
+            pass
+    return latest
 
-    IMPORTANT: Also checks that Step 7 is COMPLETED to avoid conflict
-    with Excel Worker still writing to the file.
+
+def _scene_prompt_progress(project_dir: Path, name: str) -> tuple:
+    """
+    Trạng thái Step 7 (scene prompts) + số scene đã có prompt.
+
+    Step 7 IN_PROGRESS mà không có hoạt động nào trong SCENE_PROMPTS_STALE_AFTER
+    giây -> status "STALE" (Excel Worker đã chết, sẽ không có thêm batch).
+
+    Returns:
+        (status step_7, total_scenes, scenes_with_prompts) - ("", 0, 0) nếu chưa có Excel
     """
-    # Check flat structure
     excel_path = project_dir / f"{name}_prompts.xlsx"
     if not excel_path.exists():
-        return False
-
-    try:
-        from modules.excel_manager import PromptWorkbook
+        return "", 0, 0
+
+    from modules.excel_manager import PromptWorkbook
+    state = PromptWorkbook.read_state(excel_path)
+    if state:
+        step7_status = state.get_step_status("step_7") or {}
+        counts = state.get_counts()
+        total_scenes, scenes_with_prompts = counts["total_scenes"], counts["scenes_with_prompts"]
+    else:
         wb = PromptWorkbook(str(excel_path))
         wb.load_or_create()
+        step7_status = wb.get_step_status("step_7") or {}
+        stats = wb.get_stats()
+        total_scenes, scenes_with_prompts = stats.get('total_scenes', 0), stats.get('scenes_with_prompts', 0)
 
-        # Check Step 7 COMPLETED first
-        step7_status = wb.get_step_status("step_7")
-        if not step7_status or step7_status.get("status") != "COMPLETED":
-            # Excel Worker chưa hoàn thành - KHÔNG xử lý
-            return False
+    status = step7_status.get("status", "")
+    if status == "IN_PROGRESS":
+        idle = time.time() - _scene_prompts_last_activity(excel_path, step7_status.get("last_updated"))
+        if idle > SCENE_PROMPTS_STALE_AFTER:
+            status = "STALE"
+    return status, total_scenes, scenes_with_prompts
 
-        stats = wb.get_stats()
-        total_scenes = stats.get('total_scenes', 0)
-        scenes_with_prompts = stats.get('scenes_with_prompts', 0)
-        return total_scenes > 0 and scenes_with_prompts > 0
+
+def has_excel_with_prompts(project_dir: Path, name: str, allow_streaming: bool = False) -> bool:
+    """Check if project has Excel with prompts (ready for worker).
+
+    IMPORTANT: Also checks that Step 7 is COMPLETED to avoid conflict
+    with Excel Worker still writing to the file.
+
+    allow_streaming=True: Step 7 đang chạy (IN_PROGRESS) nhưng đã có batch scene
+    được ghi vào Excel -> cũng coi là sẵn sàng, Chrome tạo ảnh song song với
+    Excel Worker (ghi status qua change journal nên không đè nhau). Step 7 bị
+    dừng giữa chừng (STALE) thì vẫn tạo ảnh cho các scene đã có.
+    """
+    try:
+        status, total_scenes, scenes_with_prompts = _scene_prompt_progress(project_dir, name)
     except:
         return False
 
+    if status == "COMPLETED" or (allow_streaming and status in ("IN_PROGRESS", "STALE")):
+        return total_scenes > 0 and scenes_with_prompts > 0
+    # Excel Worker chưa hoàn thành - KHÔNG xử lý
+    return False
+
+
+def is_scene_prompts_streaming(project_dir: Path, name: str, include_stale: bool = False) -> bool:
+    """
+    Excel Worker vẫn đang tạo scene prompts (Step 7 IN_PROGRESS) -> sẽ còn thêm scenes.
+    include_stale=True: tính cả Step 7 bị dừng giữa chừng (STALE) - scenes chưa đủ.
+    """
+    try:
+        status = _scene_prompt_progress(project_dir, name)[0]
+    except Exception:
+        return False
+    return status == "IN_PROGRESS" or (include_stale and status == "STALE")
+
+
+def scene_batch_progress(project_dir: Path, name: str) -> tuple:
+    """
+    Số scene đã có prompt + trạng thái Step 7, đọc 1 lần (không chờ).
+
+    Chrome tạo ảnh cho các batch đã có rồi return; batch mới do lần scan sau
+    xử lý, không giữ scan loop lại chờ Excel Worker.
+
+    Returns:
+        (scenes_with_prompts, status step_7) - đọc lỗi -> (0, "IN_PROGRESS")
+    """
+    try:
+        status, _, count = _scene_prompt_progress(project_dir, name)
+    except Exception:
+        return 0, "IN_PROGRESS"
+    return count, status
+
 
 def needs_api_completion(project_dir: Path, name: str) -> bool:
     """
@@ -253,6 +342,10 @@ def needs_api_completion(project_dir: Path, name: str) -> bool:
 
     try:
         from modules.excel_manager import PromptWorkbook
+        state = PromptWorkbook.read_state(excel_path)
+        if state:
+            return state.get_counts()["fallback_prompts"] > 0
+
         wb = PromptWorkbook(str(excel_path))
         scenes = wb.get_scenes()
 
@@ -533,6 +626,13 @@ def copy_to_visual(code: str, local_dir: Path) -> bool:
     print(f"  [OUT] Copying to VISUAL: {code}")
 
     try:
+        # Gộp change journal của các worker vào Excel trước khi copy
+        from modules.excel_manager import PromptWorkbook
+        excel_path = local_dir / f"{code}_prompts.xlsx"
+        merged = PromptWorkbook.merge_change_journal(excel_path)
+        if merged:
+            print(f"  [OUT] Merged {merged} journal changes into {excel_path.name}")
+
         # Create VISUAL dir on master
         MASTER_VISUAL.mkdir(parents=True, exist_ok=True)
 
@@ -578,11 +678,12 @@ def is_local_complete(project_dir: Path, name: str) -> bool:
     # ĐỌC EXCEL ĐỂ BIẾT TỔNG SỐ SCENES CẦN TẠO
     required_images = 0
     try:
-        from modules.excel_manager import PromptWorkbook
+        from modules.excel_manager import PromptWorkbook, scenes_from_rows
         excel_path = project_dir / f"{name}_prompts.xlsx"
         if excel_path.exists():
-            wb = PromptWorkbook(str(excel_path))
-            scenes = wb.get_scenes()
+            # Chỉ đọc sheet scenes, read-only
+            sheets = PromptWorkbook.open_readonly(excel_path, [PromptWorkbook.SCENES_SHEET])
+            scenes = scenes_from_rows(sheets[PromptWorkbook.SCENES_SHEET].rows)
             # Chỉ đếm scenes có img_prompt (cần tạo ảnh)
             required_images = sum(1 for s in scenes if s.img_prompt)
     except Exception as e:
@@ -0,0 +1,37 @@
+"""Tests cho prompts_generator.MultiAIClient.generate_batch_parallel qua ai_providers.generate_many."""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.ai_providers import MultiAIClient as ProviderClient
+from modules.prompts_generator import MultiAIClient
+
+
+class FakeClient:
+    """Provider giả: prompt "wait N" trả về sau N * 10ms."""
+    model = "fake"
+
+    def generate(self, prompt, system_prompt=None, temperature=0.7, max_tokens=4096):
+        time.sleep(int(prompt.split()[1]) * 0.01)
+        return f"text:{prompt}"
+
+
+def make_client():
+    client = MultiAIClient({}, auto_filter=False)
+    client._providers = ProviderClient({"provider_concurrency": {"groq": 4}}, auto_filter=False)
+    for i in range(2):
+        client._providers._add_client("groq", FakeClient(), i)
+    client.generate_content = lambda prompt, temperature=0.7, max_tokens=8192: f"json:{prompt}"
+    return client
+
+
+def test_batch_streams_results_and_keeps_order():
+    prompts = ["wait 20", "wait 1", 'Return JSON {"a": 1}', "wait 10"]
+    completed = []
+    results = make_client().generate_batch_parallel(prompts, on_result=lambda i, text: completed.append(i))
+
+    assert results == ["text:wait 20", "text:wait 1", 'json:Return JSON {"a": 1}', "text:wait 10"]
+    # Text prompts stream ra theo thứ tự xong, không phải thứ tự prompts
+    assert completed == [1, 3, 0, 2]
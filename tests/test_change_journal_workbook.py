@@ -0,0 +1,98 @@
+"""Tests cho PromptWorkbook + change journal: 2 workbook (2 process) cùng 1 file Excel."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.excel_manager import PromptWorkbook, Scene
+
+
+def scene_ids(path):
+    return [s.scene_id for s in PromptWorkbook(path).load_or_create().get_scenes()]
+
+
+def setup_project(tmp_path):
+    """File Excel có scenes 1-3, Excel worker (ghi full) + Chrome (journal, non-owner)."""
+    path = tmp_path / "AR1-0001_prompts.xlsx"
+    excel = PromptWorkbook(path, state_sidecar=False).load_or_create()
+    excel.add_scenes(Scene(scene_id=i, img_prompt=f"prompt {i}") for i in (1, 2, 3))
+    excel.save()
+
+    chrome = PromptWorkbook(path, change_journal=True, journal_owner=False, state_sidecar=False).load_or_create()
+    chrome.update_scene(1, status_img="done")
+    chrome.save()
+    assert chrome.workbook is not None  # Chrome giữ bản scenes 1-3 trong bộ nhớ
+    return path, excel, chrome
+
+
+def test_bare_save_does_not_overwrite_newer_file(tmp_path):
+    path, excel, chrome = setup_project(tmp_path)
+
+    excel.add_scenes(Scene(scene_id=i, img_prompt=f"prompt {i}") for i in (4, 5, 6))
+    excel.save()
+    assert scene_ids(path) == [1, 2, 3, 4, 5, 6]
+
+    # save() không kèm sửa gì + close()/flush lúc thoát
+    chrome.save()
+    chrome.close()
+
+    assert scene_ids(path) == [1, 2, 3, 4, 5, 6]
+    assert PromptWorkbook(path).load_or_create().get_scenes()[0].status_img == "done"
+
+
+def test_direct_edit_is_written_on_top_of_newer_file(tmp_path):
+    path, excel, chrome = setup_project(tmp_path)
+
+    excel.add_scenes(Scene(scene_id=i, img_prompt=f"prompt {i}") for i in (4, 5, 6))
+    excel.save()
+
+    # Sửa ô trực tiếp (không qua journal) trên bản cũ trong bộ nhớ -> ghi full
+    chrome.update_step_status("step_7", "COMPLETED", 6, 6)
+    chrome.close()
+
+    result = PromptWorkbook(path).load_or_create()
+    assert [s.scene_id for s in result.get_scenes()] == [1, 2, 3, 4, 5, 6]
+    assert result.get_scenes()[0].status_img == "done"
+    assert result.get_step_status("step_7")["status"] == "COMPLETED"
+
+
+def test_journaled_reads_keep_one_cache_entry_per_kind(tmp_path):
+    from modules.excel_manager import parsed_workbook_cache
+
+    path, excel, chrome = setup_project(tmp_path)
+    reader = PromptWorkbook(path).load_or_create()
+    for i in range(5):
+        chrome.update_scene(2, status_img=f"try {i}")
+        reader.load_or_create()
+        assert reader.get_scenes()[1].status_img == f"try {i}"
+
+    kinds = parsed_workbook_cache._entries[str(path)][1]
+    assert [k for k in kinds if "@journal" in k] == ["scenes@journal"]
+
+
+def test_sidecar_is_stale_while_journal_has_unmerged_changes(tmp_path):
+    path = tmp_path / "AR1-0002_prompts.xlsx"
+    excel = PromptWorkbook(path).load_or_create()
+    excel.add_scenes(Scene(scene_id=i, img_prompt=f"prompt {i}") for i in (1, 2))
+    excel.save()
+
+    chrome = PromptWorkbook(path, change_journal=True, journal_owner=False).load_or_create()
+    chrome.update_scene(1, status_img="done")
+    assert PromptWorkbook.read_state(path) is None
+
+    owner = PromptWorkbook(path, change_journal=True, journal_owner=True).load_or_create()
+    assert owner.merge_changes() == 1
+    state = PromptWorkbook.read_state(path)
+    assert state is not None
+    assert state.get_counts()["images_done"] == 1
+
+    chrome.update_scene(2, status_img="done")
+    assert PromptWorkbook.read_state(path) is None
+
+
+def test_get_scene_ids_reads_without_full_load(tmp_path):
+    path, excel, chrome = setup_project(tmp_path)
+
+    reader = PromptWorkbook(path, state_sidecar=False).load_or_create()
+    assert reader.get_scene_ids() == {1, 2, 3}
+    assert reader._load_pending  # Chỉ đọc sheet scenes read-only
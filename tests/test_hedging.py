@@ -0,0 +1,70 @@
+"""Tests cho hedge request của ProgressivePromptsGenerator._post_hedged."""
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.key_rate_limiter import KeyRateLimiter
+from modules.latency_stats import LatencyStats
+from modules.progressive_prompts import ProgressivePromptsGenerator, _HedgeRace
+
+
+class FakeResponse:
+    status_code = 200
+    text = "{}"
+    headers = {}
+
+
+class SlowHttp:
+    """Request đầu tiên chậm (quá hedge delay), các request sau về ngay."""
+
+    def __init__(self):
+        self.keys = []
+        self.lock = threading.Lock()
+
+    def post(self, key, url, **kwargs):
+        with self.lock:
+            self.keys.append(key)
+            first = len(self.keys) == 1
+        if first:
+            time.sleep(0.3)
+        return FakeResponse()
+
+
+def make_generator():
+    gen = object.__new__(ProgressivePromptsGenerator)
+    gen.llm_hedge = True
+    gen.hedge_percentile = 95
+    gen.HEDGE_MIN_DELAY = 0.05
+    gen.latency = LatencyStats()
+    for _ in range(gen.HEDGE_MIN_SAMPLES):
+        gen.latency.record("step", 0.01)
+    gen.http = SlowHttp()
+    gen._log = lambda *args, **kwargs: None
+    return gen
+
+
+def test_acquire_excludes_keys(tmp_path):
+    limiter = KeyRateLimiter(["a", "b"], state_file=tmp_path / "rate.json", burst=5)
+    assert all(limiter.acquire(timeout=0, exclude={"a"}) == "b" for _ in range(3))
+    assert KeyRateLimiter(["a"], state_file=tmp_path / "one.json").acquire(timeout=0, exclude={"a"}) is None
+
+
+def test_single_key_does_not_hedge_on_same_key(tmp_path):
+    gen = make_generator()
+    limiter = KeyRateLimiter(["a"], state_file=tmp_path / "rate.json")
+    key, _, idx = gen._post_hedged(_HedgeRace(None), "a", {}, "step", limiter)
+    assert (key, idx) == ("a", 0)
+    assert gen.http.keys == ["a"]
+
+
+def test_hedge_uses_another_key(tmp_path):
+    gen = make_generator()
+    # "a" có nhiều token nhất nhưng là key của request gốc
+    limiter = KeyRateLimiter(["a", "b"], state_file=tmp_path / "rate.json", burst=10)
+    limiter.acquire(timeout=0, exclude={"a"})
+    key, _, idx = gen._post_hedged(_HedgeRace(None), "a", {}, "step", limiter)
+    assert (key, idx) == ("b", 1)
+    assert gen.http.keys == ["a", "b"]
@@ -0,0 +1,59 @@
+"""Tests cho modules.json_stream và ProgressivePromptsGenerator._extract_json."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.json_stream import JsonStreamParser, parse_json_stream
+from modules.progressive_prompts import ProgressivePromptsGenerator
+
+SCENES = '{"scenes": [{"scene_id": 1, "img_prompt": "a {b} c"}, {"scene_id": 2}]}'
+EXPECTED = {"scenes": [{"scene_id": 1, "img_prompt": "a {b} c"}, {"scene_id": 2}]}
+
+
+def extract(text):
+    return object.__new__(ProgressivePromptsGenerator)._extract_json(text)
+
+
+def test_prose_braces_before_code_block():
+    text = "Sure! Use {placeholder} style.\n```json\n" + SCENES + "\n```"
+    assert parse_json_stream(text) == EXPECTED
+    assert extract(text) == EXPECTED
+
+
+def test_prose_braces_before_bare_json():
+    text = "Note {x}. " + SCENES
+    assert parse_json_stream(text) == EXPECTED
+    assert extract(text) == EXPECTED
+
+
+def test_prose_braces_streamed_in_chunks():
+    items = []
+    parser = JsonStreamParser(on_item=lambda key, item: items.append((key, item["scene_id"])))
+    text = "Note {x} and {y}. " + SCENES
+    for i in range(0, len(text), 3):
+        parser.feed(text[i:i + 3])
+    assert parser.done and parser.has_data
+    assert parser.result() == EXPECTED
+    assert items == [("scenes", 1), ("scenes", 2)]
+
+
+def test_empty_object_has_no_data():
+    parser = JsonStreamParser()
+    parser.feed("{}")
+    assert parser.done and not parser.has_data
+
+
+def test_truncated_keeps_complete_items():
+    parser = JsonStreamParser()
+    parser.feed(SCENES[:-12])
+    assert not parser.done
+    assert parser.result() == {"scenes": [{"scene_id": 1, "img_prompt": "a {b} c"}]}
+
+
+def test_array_root_is_not_parsed_as_first_element():
+    items = '[{"scene_id": 1}, {"scene_id": 2}]'
+    assert parse_json_stream(items) is None
+    assert parse_json_stream("Here:\n```json\n" + items + "\n```") is None
+    assert extract("```json\n" + items + "\n```") == [{"scene_id": 1}, {"scene_id": 2}]
+    assert extract("Note [x]. " + SCENES) == EXPECTED
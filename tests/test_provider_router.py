@@ -0,0 +1,37 @@
+"""Tests cho modules.provider_router (circuit breaker half-open)."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.provider_router import HALF_OPEN, ProviderRouter
+
+
+def half_open_router():
+    router = ProviderRouter()
+    router.OPEN_SECONDS = 0.0
+    router._route("b").open_seconds = 0.0
+    for _ in range(router.FAILURE_THRESHOLD):
+        router.record_failure("b")
+    router.record_success("a", 1.0)
+    return router
+
+
+def test_listing_half_open_route_does_not_claim_probe():
+    router = half_open_router()
+    for _ in range(3):
+        assert set(router.order(["a", "b"])) == {"a", "b"}
+    assert router.stats()["b"]["state"] == HALF_OPEN
+
+
+def test_probe_claimed_once_when_dispatched():
+    router = half_open_router()
+    assert "b" in router.order(["a", "b"])
+    assert router.begin("b")
+    assert not router.begin("b")
+    assert router.order(["a", "b"]) == ["a"]
+    assert router.begin("a")
+
+    router.record_success("b", 1.0)
+    assert set(router.order(["a", "b"])) == {"a", "b"}
+    assert router.begin("b") and router.begin("b")
@@ -0,0 +1,30 @@
+"""Tests cho ghi file Excel (atomic) của PromptWorkbook."""
+import os
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from modules.excel_manager import PromptWorkbook, Scene, _UMASK
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_save_keeps_file_mode(tmp_path):
+    path = tmp_path / "AR1-0001_prompts.xlsx"
+    workbook = PromptWorkbook(path, state_sidecar=False).load_or_create()
+    workbook.add_scenes([Scene(scene_id=1, img_prompt="prompt 1")])
+    workbook.save()
+    assert file_mode(path) == 0o666 & ~_UMASK
+
+    os.chmod(path, 0o664)
+    workbook.add_scenes([Scene(scene_id=2, img_prompt="prompt 2")])
+    workbook.save()
+    assert [s.scene_id for s in PromptWorkbook(path).load_or_create().get_scenes()] == [1, 2]
+    assert file_mode(path) == 0o664
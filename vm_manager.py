@@ -326,9 +326,22 @@ class QualityChecker:
             return status
 
         try:
-            from modules.excel_manager import PromptWorkbook
-            wb = PromptWorkbook(str(excel_path))
-            scenes = wb.get_scenes()
+            from modules.excel_manager import PromptWorkbook, scenes_from_rows, characters_from_rows
+            from modules.state_store import scene_state_row, character_state_row
+
+            # Ưu tiên sidecar {code}_state.sqlite (không phải parse xlsx),
+            # fallback đọc read-only đúng các sheet cần
+            state = PromptWorkbook.read_state(excel_path)
+            sheets = {}
+            if state:
+                scenes = state.get_scene_status()
+            else:
+                sheets = PromptWorkbook.open_readonly(excel_path, [
+                    PromptWorkbook.SCENES_SHEET,
+                    PromptWorkbook.CHARACTERS_SHEET,
+                    PromptWorkbook.STORY_SEGMENTS_SHEET,
+                ])
+                scenes = [scene_state_row(s) for s in scenes_from_rows(sheets[PromptWorkbook.SCENES_SHEET].rows)]
 
             status.total_scenes = len(scenes)
             status.excel_scene_count = len(scenes)
@@ -339,20 +352,20 @@ class QualityChecker:
 
             # Chi tiết từng loại prompt
             for scene in scenes:
-                scene_num = scene.scene_id
+                scene_num = scene["scene_id"]
 
                 # Check img_prompt
-                if scene.img_prompt and scene.img_prompt.strip():
+                if scene["has_img_prompt"]:
                     status.img_prompts_count += 1
                     # Check fallback
-                    if "[FALLBACK]" in scene.img_prompt:
+                    if scene["is_fallback"]:
                         status.fallback_prompts += 1
                         status.fallback_scenes.append(scene_num)
                 else:
                     status.missing_img_prompts.append(scene_num)
 
                 # Check video_prompt
-                if scene.video_prompt and scene.video_prompt.strip():
+                if scene["has_video_prompt"]:
                     status.video_prompts_count += 1
                 else:
                     status.missing_video_prompts.append(scene_num)
@@ -361,7 +374,13 @@ class QualityChecker:
 
             # Check characters from Excel
             try:
-                characters = wb.get_characters()
+                if state:
+                    characters = state.get_characters()
+                else:
+                    characters = [
+                        character_state_row(c)
+                        for c in characters_from_rows(sheets[PromptWorkbook.CHARACTERS_SHEET].rows)
+                    ]
                 status.characters_count = len(characters)
 
                 # Check nv/ folder for reference images
@@ -373,14 +392,14 @@ class QualityChecker:
 
                     # Check which characters have reference images
                     for char in characters:
-                        char_id = char.id.lower() if char.id else ""
+                        char_id = char["id"].lower() if char["id"] else ""
                         if char_id in nv_image_names:
                             status.characters_with_ref += 1
-                        elif char.image_file and (nv_dir / char.image_file).exists():
+                        elif char["image_file"] and (nv_dir / char["image_file"]).exists():
                             status.characters_with_ref += 1
                         else:
-                            if char.id:
-                                status.characters_missing_ref.append(char.id)
+                            if char["id"]:
+                                status.characters_missing_ref.append(char["id"])
             except:
                 pass
 
@@ -427,7 +446,7 @@ class QualityChecker:
             img_backup_dir = project_dir / "img_backup"
 
             for scene in scenes:
-                scene_id = scene.scene_id
+                scene_id = scene["scene_id"]
                 actual_img = img_dir / f"{scene_id}.png"
                 backup_img = img_backup_dir / f"{scene_id}.png"
                 actual_vid = img_dir / f"{scene_id}.mp4"
@@ -459,7 +478,14 @@ class QualityChecker:
 
             # Get Segment 1 info for BASIC mode
             try:
-                segments = wb.get_story_segments()
+                if state:
+                    segments = state.get_story_segments()
+                else:
+                    segments = [
+                        {"srt_range_start": int(row[6] or 0), "srt_range_end": int(row[7] or 0)}
+                        for row in sheets[PromptWorkbook.STORY_SEGMENTS_SHEET].rows
+                        if row[0] is not None
+                    ]
                 if segments:
                     seg1 = segments[0]  # First segment
                     status.segment1_end_srt = seg1.get('srt_range_end', 0)
@@ -470,8 +496,8 @@ class QualityChecker:
 
                     for scene in scenes:
                         # Scene belongs to Segment 1 if its scene_id is within SRT range
-                        if srt_start <= scene.scene_id <= srt_end:
-                            status.segment1_scenes.append(scene.scene_id)
+                        if srt_start <= scene["scene_id"] <= srt_end:
+                            status.segment1_scenes.append(scene["scene_id"])
             except:
                 pass
 
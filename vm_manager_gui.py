@@ -1935,8 +1935,11 @@ class SimpleGUI(tk.Tk):
 
         try:
             from modules.excel_manager import PromptWorkbook
-            wb = PromptWorkbook(str(excel_path))
-            wb.load_or_create()
+            # Sidecar state có cùng get_all_step_status() -> không phải parse xlsx
+            wb = PromptWorkbook.read_state(excel_path)
+            if wb is None:
+                wb = PromptWorkbook(str(excel_path))
+                wb.load_or_create()
 
             # Get step status
             step_ids = ["step_1", "step_2", "step_3", "step_4", "step_5", "step_6", "step_7"]